@@ -14,10 +14,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from os import environ
+
+# Reuse SSH connections between Ansible runs unless configured otherwise,
+# must be set up before Ansible constants are loaded
+environ.setdefault('ANSIBLE_SSH_ARGS', '-C -o ControlMaster=auto -o ControlPersist=60s')
+environ.setdefault('ANSIBLE_PIPELINING', 'True')
+
 from collections import namedtuple
+from os import path, remove
+from threading import Lock
+from time import time
+from uuid import uuid4
 
 from ansible.parsing.dataloader import DataLoader
-from ansible.plugins.callback.debug import CallbackModule
 from ansible.vars.manager import VariableManager
 from ansible.inventory.manager import InventoryManager
 from ansible.playbook.play import Play
@@ -26,10 +36,17 @@ from ansible.plugins.callback import CallbackBase
 
 from .sshpool import SshPool, log_print
 
-SEPARATOR = '_THIS_IS_SEPARATOR_'
-
 
 class AnsiblePool(SshPool):
+    """
+    Pool executing commands through Ansible.
+
+    Loader, inventory, variable manager and task queue manager with its workers are created once and reused by all
+    calls. Commands are executed as separate shell tasks, output of each command is collected separately.
+    """
+
+    default_forks = 100
+
     def __init__(self, ssh_config, **kwargs):
         super(AnsiblePool, self).__init__(ssh_config, **kwargs)
 
@@ -39,8 +56,9 @@ class AnsiblePool(SshPool):
 
         # initialize needed objects
         self.loader = DataLoader()
-        self.options = Options(connection='smart', module_path='.', forks=100, become=None, become_method=None,
-                               become_user=None, check=False, diff=False)
+        self.options = Options(connection='smart', module_path='.',
+                               forks=int(self.config.get('ansible_forks', self.default_forks)),
+                               become=None, become_method=None, become_user=None, check=False, diff=False)
         self.passwords = dict(become_pass='')
 
         # create inventory and pass to var manager
@@ -52,13 +70,29 @@ class AnsiblePool(SshPool):
 
         self.inventory = InventoryManager(loader=self.loader, sources=[all_hosts])
         self.variable_manager = VariableManager(loader=self.loader, inventory=self.inventory)
+        self.results_callback = TidenCallback()
+        self.tqm = None
+        # task queue manager, callback and extra vars are shared, so plays are run one at a time
+        self.run_lock = Lock()
 
     def trace_info(self):
         log_print('Support environment through Ansible')
 
+    def close(self):
+        """
+        Stop Ansible workers
+        """
+        with self.run_lock:
+            if self.tqm is not None:
+                self.tqm.cleanup()
+                self.tqm = None
+
     def upload(self, files, remote_path):
-        results_callback = DebugCallback()
+        self.upload_for_hosts('all', files, remote_path)
 
+    def upload_for_hosts(self, hosts, files, remote_path):
+        if not isinstance(hosts, str):
+            hosts = ",".join(hosts)
         tasks = []
         for file in files:
             tasks.append(dict(action=dict(module='synchronize',
@@ -66,29 +100,14 @@ class AnsiblePool(SshPool):
                                           dest=remote_path,
                                           # recursive='yes',
                                           # compress='yes',
-                                          ),
-                              register='shell_out'))
+                                          )))
 
-        self._run_ansible(results_callback, tasks)
+        self._run_ansible(tasks, hosts)
 
     def upload_on_host(self, host, files, remote_dir):
-        results_callback = CallbackModule()
-
-        tasks = []
-        for file in files:
-            tasks.append(dict(action=dict(module='synchronize',
-                                          src=file,
-                                          dest=remote_dir,
-                                          # recursive='yes',
-                                          # compress='yes',
-                                          ),
-                              register='shell_out'))
-
-        self._run_ansible(results_callback, tasks, host)
+        self.upload_for_hosts(host, files, remote_dir)
 
     def download(self, remote_path, local_path, prepend_host=True):
-        results_callback = DebugCallback()
-
         if not local_path.endswith('/'):
             local_path = '%s/' % local_path
 
@@ -98,108 +117,119 @@ class AnsiblePool(SshPool):
         tasks = [dict(action=dict(module='fetch',
                                   src=remote_path,
                                   dest=local_path,
-                                  flat='yes'), register='shell_out')]
+                                  flat='yes'))]
 
-        self._run_ansible(results_callback, tasks)
+        self._run_ansible(tasks)
 
     def download_from_host(self, host, remote_path, local_path):
-        results_callback = DebugCallback()
-
         # fix local path
         if not local_path.endswith('/'):
-            local_path.append('/')
+            local_path = '%s/' % local_path
 
         tasks = [dict(action=dict(module='fetch',
                                   src=remote_path,
                                   dest=local_path,
-                                  flat='yes'), register='shell_out')]
+                                  flat='yes'))]
 
-        self._run_ansible(results_callback, tasks, host)
+        self._run_ansible(tasks, host)
 
     def exec(self, commands, **kwargs):
-        results_callback = TidenCallback()
-
-        if isinstance(commands, list):
-            tasks = []
-            for command in commands:
-                tasks.append(dict(action=dict(module='shell',
-                                              args=self._escape_equals(command)), register='shell_out'))
-
-            self._run_ansible(results_callback, tasks)
-        elif isinstance(commands, dict):
-            if len(commands.keys()) == 0:
-                return
-
-            hosts = ",".join(filter(lambda x: len(commands[x]) > 0,
-                                    commands.keys()))
-
-            # NB! This trick with separator may cause errors in test code if start string used in parsing regex
-            # Because some strings may started with \n
-            env_vars = ''
-            if self.config.get('env_vars'):
-                for env_var_name in self.config['env_vars'].keys():
-                    env_vars += "%s=%s;" % (env_var_name, self.config['env_vars'][env_var_name])
-            commands_per_host = {}
-            for host in commands.keys():
-                commands_per_host[host] = ''
-                for command in commands[host]:
-                    command = self._escape_equals(command)
-                    if env_vars != '':
-                        command = "%s%s" % (env_vars, command)
-                    if len(command) > 0:
-                        # to separate different commands output used special separator
-                        # which will be used while parsing result for each command
-                        separator = ' ;echo "%s"; ' % SEPARATOR
-                        if '&' == command[-1]:
-                            # & symbol is already "next command"
-                            separator = ' echo "%s"; ' % SEPARATOR
-
-                        commands_per_host[host] += command + separator
-
-            variable_manager = VariableManager(loader=self.loader, inventory=self.inventory)
-
-            variable_manager.extra_vars = {'commands_per_host': commands_per_host}
-
-            tasks = [dict(action=dict(module='shell',
-                                      args='{{vars.commands_per_host[inventory_hostname]}}'),
-                          register='shell_out')]
-
-            # print("\n------------------CMD_P----------------------")
-            # print(commands_per_host)
-            # print("\n------------------TASKS----------------------")
-            # print(tasks)
-
-            self._run_ansible(results_callback, tasks, hosts=hosts, variable_manager=variable_manager)
-
-        return results_callback.result
-
-    def exec_on_host(self, host, commands):
-        results_callback = TidenCallback()
+        """
+        Execute commands on hosts.
+        :param commands: list of commands for all hosts or dictionary of lists of commands per host
+        :return: dictionary {host: [<output of each command>, ...]}
+        """
+        if isinstance(commands, dict):
+            commands_per_host = {host: list(host_commands) for host, host_commands in commands.items()
+                                 if len(host_commands) > 0}
+        elif isinstance(commands, list):
+            commands_per_host = {host: list(commands) for host in self.hosts}
+        else:
+            commands_per_host = {host: [commands] for host in self.hosts}
+        if len(commands_per_host.keys()) == 0:
+            return {}
 
-        tasks = []
         env_vars = ''
         if self.config.get('env_vars'):
             for env_var_name in self.config['env_vars'].keys():
                 env_vars += "%s=%s;" % (env_var_name, self.config['env_vars'][env_var_name])
-        for command in commands:
-            if env_vars != '':
-                command = "%s%s" % (env_vars, command)
-            tasks.append(dict(action=dict(module='shell',
-                                          args=command), register='shell_out'))
-
-        self._run_ansible(results_callback, tasks, host)
+        if env_vars != '':
+            for host in commands_per_host.keys():
+                commands_per_host[host] = ["%s%s" % (env_vars, command) for command in commands_per_host[host]]
 
-        return results_callback.result
+        # Each command is a separate task skipped for hosts having less commands,
+        # commands are passed as variables to be executed as is, without Ansible key=value parsing
+        tasks = []
+        for idx in range(max([len(host_commands) for host_commands in commands_per_host.values()])):
+            tasks.append(dict(name=str(idx),
+                              action=dict(module='shell',
+                                          args=dict(_raw_params='{{commands_per_host[inventory_hostname][%d]}}' % idx)),
+                              when='commands_per_host[inventory_hostname] | length > %d' % idx))
+
+        play_results = self._run_ansible(tasks, hosts=",".join(commands_per_host.keys()),
+                                         extra_vars={'commands_per_host': commands_per_host})
+
+        results = {}
+        for host, host_results in play_results.items():
+            results[host] = [host_results[idx] for idx in sorted(host_results.keys())]
+        return results
+
+    def exec_on_host(self, host, commands, **kwargs):
+        """
+        Execute commands on host. Ansible can't stream output, so `on_line` callback gets output lines
+        after all commands are completed.
+        """
+        output = self.exec({host: commands}, **kwargs).get(host, [])
+        on_line = kwargs.get('on_line')
+        if on_line is not None:
+            for command_output in output:
+                for line in command_output.splitlines():
+                    on_line(host, line)
+        return {host: output}
+
+    def exec_to_files(self, commands, **kwargs):
+        return {host: written for host, (written, _) in self.exec_to_files_timed(commands, **kwargs).items()}
+
+    def exec_to_files_timed(self, commands, **kwargs):
+        """
+        Ansible can't stream command output: output is written to remote temporary file which is fetched then.
+        Hosts are processed by the same plays, so every host reports duration of the whole call.
+        :param commands: {host: (command, local file path)}
+        :return: {host: (number of bytes written or None if command failed, seconds)}
+        """
+        started = time()
+        remote_file = '/tmp/tiden-%s.out' % uuid4().hex[:8]
+        results = self.exec({
+            host: ['{ %s; } > %s 2>/dev/null; echo "EXIT_CODE $?"' % (command, remote_file)]
+            for host, (command, _) in commands.items()
+        }, **kwargs)
+        done_hosts = [host for host in commands.keys() if 'EXIT_CODE 0' in ''.join(results.get(host, []))]
+        for host, (_, local_file) in commands.items():
+            if path.exists(local_file):
+                remove(local_file)
+        try:
+            if done_hosts:
+                tasks = [dict(action=dict(module='fetch',
+                                          src=remote_file,
+                                          dest='{{local_files[inventory_hostname]}}',
+                                          flat='yes'))]
+                self._run_ansible(tasks, hosts=','.join(done_hosts),
+                                  extra_vars={'local_files': {host: commands[host][1] for host in done_hosts}})
+        finally:
+            self.exec({host: ['rm -f %s' % remote_file] for host in commands.keys()})
+        elapsed = time() - started
+        return {
+            host: (path.getsize(local_file) if host in done_hosts and path.exists(local_file) else None, elapsed)
+            for host, (_, local_file) in commands.items()
+        }
 
     def connect(self):
-        results_callback = TidenPingCallback()
+        tasks = [dict(name='0', action=dict(module='ping'))]
 
-        tasks = [dict(action=dict(module='ping'), register='shell_out')]
+        play_results = self._run_ansible(tasks)
 
-        self._run_ansible(results_callback, tasks)
-
-        for node_ip, status in results_callback.result.items():
-            if not status:
+        for node_ip in self.hosts:
+            if play_results.get(node_ip, {}).get(0) != 'pong':
                 log_print('', 2)
                 log_print('Error: node %s is not available\n' % node_ip)
                 exit(1)
@@ -221,75 +251,75 @@ class AnsiblePool(SshPool):
     def jps(self):
         return super().jps()
 
-    def _run_ansible(self, results_callback, tasks, hosts='all', variable_manager=None):
-        # create play with tasks
-        variable_manager = self.variable_manager if variable_manager is None else variable_manager
+    def _get_tqm(self):
+        if self.tqm is None:
+            self.tqm = TaskQueueManager(
+                inventory=self.inventory,
+                variable_manager=self.variable_manager,
+                loader=self.loader,
+                options=self.options,
+                passwords=self.passwords,
+                stdout_callback=self.results_callback,
+            )
+        return self.tqm
 
+    def _run_ansible(self, tasks, hosts='all', extra_vars=None):
+        """
+        Run play, calls from different threads are serialized.
+        :return: results of play {host: {task index: output}}
+        """
         play_source = dict(
             name='Ansible Play',
             hosts=hosts,
             gather_facts='no',
             tasks=tasks
         )
-        play = Play().load(play_source, variable_manager=self.variable_manager, loader=self.loader)
-        # actually run it
-        tqm = None
-        try:
-            tqm = TaskQueueManager(
-                inventory=self.inventory,
-                variable_manager=variable_manager,
-                loader=self.loader,
-                options=self.options,
-                passwords=self.passwords,
-                stdout_callback=results_callback,
-            )
-            tqm.run(play)
-        finally:
-            if tqm is not None:
-                tqm.cleanup()
-
-    @staticmethod
-    def _escape_equals(command):
-        if "=" in command:
-            command = command.replace("=", "\=")
-        return command
-
-
-class DebugCallback(CallbackBase):
-    def v2_runner_on_failed(self, result, ignore_errors=False):
-        pass
+        with self.run_lock:
+            self.results_callback.reset()
+            self.variable_manager.extra_vars = extra_vars if extra_vars is not None else {}
+            try:
+                with self.tracer.span('ansible', cat='ssh', host=hosts, command=len(tasks)):
+                    play = Play().load(play_source, variable_manager=self.variable_manager, loader=self.loader)
+                    self._get_tqm().run(play)
+            finally:
+                self.variable_manager.extra_vars = {}
+            return self.results_callback.result
+
+
+class TidenCallback(CallbackBase):
+    """
+    Collects results of tasks per host and task index (task name)
+    """
 
-    def v2_runner_on_ok(self, result, **kwargs):
-        pass
-
-
-class ResultCallback(CallbackBase):
     def __init__(self):
         super().__init__()
 
         self.result = {}
 
+    def reset(self):
+        self.result = {}
 
-class TidenPingCallback(ResultCallback):
-    def v2_runner_on_failed(self, result, ignore_errors=False):
-        self.result[result._host.name] = str(result._result['ping']) == 'pong'
-
-    def v2_runner_on_ok(self, result, **kwargs):
-        self.result[result._host.name] = str(result._result['ping']) == 'pong'
-
+    def _store(self, result, output):
+        try:
+            idx = int(result._task.get_name())
+        except ValueError:
+            idx = len(self.result.get(result._host.name, {}))
+        self.result.setdefault(result._host.name, {})[idx] = output
 
-class TidenCallback(ResultCallback):
     def v2_runner_on_failed(self, result, ignore_errors=False):
-        # print(result._result['msg'])
-        if result._host.name in self.result:
-            self.result[result._host.name].append(str(result._result['msg']).split(SEPARATOR))
-        else:
-            self.result[result._host.name] = str(result._result['msg']).split(SEPARATOR)
+        output = str(result._result.get('stdout', '') or result._result.get('msg', ''))
+        if result._result.get('stderr'):
+            output += str(result._result['stderr'])
+        self._store(result, output)
 
-    def v2_runner_on_ok(self, result, **kwargs):
-        # print(result._result['stdout'])
-        if result._host.name in self.result:
-            self.result[result._host.name].append(str(result._result['stdout']).split(SEPARATOR))
-        else:
-            self.result[result._host.name] = str(result._result['stdout']).split(SEPARATOR)
+    def v2_runner_on_unreachable(self, result):
+        self._store(result, str(result._result.get('msg', '')))
 
+    def v2_runner_on_ok(self, result, **kwargs):
+        if 'ping' in result._result:
+            self._store(result, str(result._result['ping']))
+            return
+        output = str(result._result.get('stdout', ''))
+        if result._result.get('stderr'):
+            output += str(result._result['stderr'])
+        self._store(result, output)
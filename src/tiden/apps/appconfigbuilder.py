@@ -14,9 +14,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from jinja2 import Environment, FileSystemLoader
 
 from tiden import log_print, TidenException
+from tiden.templateengine import TemplateEngine
 
 
 class AppConfigBuilder:
@@ -215,30 +215,20 @@ class AppConfigBuilder:
 
             # render template
             for template, config in dict_configs.items():
-                rendered_string = Environment(loader=FileSystemLoader(self.tiden_config['rt']['test_resource_dir']),
-                                              trim_blocks=True) \
-                    .get_template(template) \
-                    .render({**variables, **self.tiden_config})
+                rendered_string = TemplateEngine().render(self.tiden_config['rt']['test_resource_dir'], template,
+                                                          {**variables, **self.tiden_config})
 
                 with open("%s/%s" % (self.tiden_config['rt']['test_resource_dir'], config), "w+") as config_file:
                     config_file.write(rendered_string)
 
     def build_config_and_deploy(self, config_type=None, config_set_name=None, node_id=None):
-        from glob import glob
-        from os import path
-        from tiden.util import unix_path
-
         if isinstance(config_type, (list, tuple)):
             for type in config_type:
                 self.build_config(type, config_set_name, node_id)
         else:
             self.build_config(config_type, config_set_name, node_id)
-        files = []
-        test_resource_dir = self.tiden_config['rt']['test_resource_dir']
-        for file in glob(f"{test_resource_dir}/*"):
-            if path.isfile(file):
-                files.append(unix_path(file))
-        self.tiden_ssh.upload(files, self.tiden_config['rt']['remote']['test_module_dir'])
+        self.tiden_ssh.deploy_resources(self.tiden_config['rt']['test_resource_dir'],
+                                        self.tiden_config['rt']['remote']['test_module_dir'])
 
     def __str__(self):
         res = ['\nApplication config for app %s:\n' % str(self.app.__name__),
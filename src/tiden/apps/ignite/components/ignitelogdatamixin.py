@@ -15,7 +15,7 @@
 # limitations under the License.
 
 from .ignitenodesmixin import IgniteNodesMixin
-from re import findall
+from re import findall, search
 from ....util import print_red
 
 
@@ -49,6 +49,84 @@ class IgniteLogDataMixin(IgniteNodesMixin):
                 res[node_id] = self.nodes[node_id][msg_key]
         return res
 
+    def _get_host_group_nodes(self, host_group):
+        if 'server' == host_group:
+            return (
+                    self.get_all_additional_nodes() +
+                    self.get_all_default_nodes()
+            )
+        elif 'client' == host_group:
+            return (
+                    self.get_all_client_nodes() +
+                    self.get_all_common_nodes()
+            )
+        elif 'alive_server' == host_group:
+            return (
+                    self.get_alive_additional_nodes() +
+                    self.get_alive_default_nodes()
+            )
+        elif 'alive_client' == host_group:
+            return (
+                    self.get_alive_client_nodes() +
+                    self.get_alive_common_nodes()
+            )
+        elif 'alive' == host_group:
+            return (
+                self.get_all_alive_nodes()
+            )
+        elif '*' == host_group:
+            return (
+                self.get_all_nodes()
+            )
+        assert False, "Unknown host group!"
+
+    def grep_all_data_from_log_multi(self, host_group, patterns, **kwargs):
+        """
+        Same as grep_all_data_from_log for several messages at once: every node log is grepped once for all
+        messages, then each message lines are matched with own regex.
+        :param host_group:
+                        options: 'server', 'client', 'alive_server', 'alive_client', 'alive', '*'
+        :param patterns: dictionary {node_option_name: (grep_text, regex_match)}
+        :param kwargs:
+                    default_value = if set, self.nodes (node_option_name) = default_value, if nothing find
+        :return: dictionary {node_option_name: <same result as grep_all_data_from_log>}
+        """
+        commands = {}
+        result_order = {}
+
+        if 'default_value' in kwargs:
+            default_value = kwargs['default_value']
+
+            for node_idx in self.nodes.keys():
+                for node_option_name in patterns.keys():
+                    self.nodes[node_idx][node_option_name] = default_value
+
+        grep_text = '|'.join([grep_text for grep_text, regex_match in patterns.values()])
+        for node_idx in self._get_host_group_nodes(host_group):
+            if 'log' in self.nodes[node_idx]:
+                node_idx_host = self.nodes[node_idx]['host']
+                if commands.get(node_idx_host) is None:
+                    commands[node_idx_host] = []
+                    result_order[node_idx_host] = []
+                commands[node_idx_host].append('grep -E "%s" %s' % (grep_text, self.nodes[node_idx]['log']))
+                result_order[node_idx_host].append(node_idx)
+            else:
+                print_red('There is no log for node %s' % node_idx)
+        results = self.ssh.exec(commands)
+
+        for host in results.keys():
+            for res_node_idx in range(0, len(results[host])):
+                lines = results[host][res_node_idx].split('\n')
+                for node_option_name, (option_grep_text, regex_match) in patterns.items():
+                    option_lines = '\n'.join([line for line in lines if search(option_grep_text, line)])
+                    m = findall(regex_match, option_lines)
+                    if m:
+                        self.nodes[result_order[host][res_node_idx]][node_option_name] = m
+
+        return {
+            node_option_name: self._collect_msg(node_option_name, host_group) for node_option_name in patterns.keys()
+        }
+
     def grep_all_data_from_log(self, host_group, grep_text, regex_match, node_option_name, **kwargs):
         """
         Get data for node logs.
@@ -72,36 +150,7 @@ class IgniteLogDataMixin(IgniteNodesMixin):
             for node_idx in self.nodes.keys():
                 self.nodes[node_idx][node_option_name] = default_value
 
-        if 'server' == host_group:
-            node_idx_filter = (
-                    self.get_all_additional_nodes() +
-                    self.get_all_default_nodes()
-            )
-        elif 'client' == host_group:
-            node_idx_filter = (
-                    self.get_all_client_nodes() +
-                    self.get_all_common_nodes()
-            )
-        elif 'alive_server' == host_group:
-            node_idx_filter = (
-                    self.get_alive_additional_nodes() +
-                    self.get_alive_default_nodes()
-            )
-        elif 'alive_client' == host_group:
-            node_idx_filter = (
-                    self.get_alive_client_nodes() +
-                    self.get_alive_common_nodes()
-            )
-        elif 'alive' == host_group:
-            node_idx_filter = (
-                self.get_all_alive_nodes()
-            )
-        elif '*' == host_group:
-            node_idx_filter = (
-                self.get_all_nodes()
-            )
-        else:
-            assert False, "Unknown host group!"
+        node_idx_filter = self._get_host_group_nodes(host_group)
 
         for node_idx in node_idx_filter:
             if 'log' in self.nodes[node_idx]:
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from csv import writer
+from json import dump
+
+from .exchange_info import ExchangesCollection
+from ...util import distribution
+
+
+class ExchangeAnalytics:
+    """
+    Partition map exchange timing analytics over ExchangesCollection.
+
+    Chain of merged exchanges is accounted as single exchange: for every node its time is counted from the earliest
+    'Started exchange init' to the latest 'Finish exchange future' within the chain. Times are in milliseconds.
+    """
+
+    def __init__(self, exchanges: ExchangesCollection):
+        self.exchanges = exchanges
+        self._timings = None
+
+    def get_merged_chains(self):
+        """
+        :return: list of chains of merged exchanges, each chain is sorted list of combined topology versions
+        """
+        parent = {}
+
+        def find(top_ver):
+            while parent.setdefault(top_ver, top_ver) != top_ver:
+                parent[top_ver] = parent[parent[top_ver]]
+                top_ver = parent[top_ver]
+            return top_ver
+
+        for top_ver in self.exchanges.get_top_vers():
+            for merged_top_ver in self.exchanges[top_ver].merged_exchanges:
+                if merged_top_ver in self.exchanges:
+                    parent[find(merged_top_ver)] = find(top_ver)
+
+        chains = {}
+        for top_ver in self.exchanges.get_top_vers():
+            if self.exchanges[top_ver].merged:
+                chains.setdefault(find(top_ver), []).append(top_ver)
+        return sorted([chain for chain in chains.values() if len(chain) > 1])
+
+    def get_exchange_timings(self):
+        """
+        :return: list of exchange timings ordered by topology version:
+            {
+                'topVer': <combined topology version of first exchange in chain>,
+                'exchange': <exchange description>,
+                'merged': [<combined topology versions merged into this exchange>, ...],
+                'nodes': {<node index>: <time>, ...},
+                'x2_time': <time from first start to last finish over all nodes>,
+                'slowest_node': <node index>,
+                'slowest_time': <time>,
+            }
+        """
+        if self._timings is not None:
+            return self._timings
+        chain_of = {}
+        for chain in self.get_merged_chains():
+            for top_ver in chain:
+                chain_of[top_ver] = chain
+
+        timings = []
+        for top_ver in self.exchanges.get_top_vers():
+            chain = chain_of.get(top_ver, [top_ver])
+            if chain[0] != top_ver:
+                continue
+            started = {}
+            finished = {}
+            for chain_top_ver in chain:
+                for node_idx, node_info in self.exchanges[chain_top_ver].nodes_info.items():
+                    if node_info.started_init_time is not None:
+                        started[node_idx] = min(started.get(node_idx, node_info.started_init_time),
+                                                node_info.started_init_time)
+                    if node_info.finished_exchange_time is not None:
+                        finished[node_idx] = max(finished.get(node_idx, node_info.finished_exchange_time),
+                                                 node_info.finished_exchange_time)
+            nodes = {}
+            for node_idx in sorted(set(started.keys()) & set(finished.keys())):
+                node_time = int(finished[node_idx]) - int(started[node_idx])
+                # skip exchanges crossing midnight: log timestamps have no date
+                if node_time >= 0:
+                    nodes[node_idx] = node_time
+            timing = {
+                'topVer': top_ver,
+                'exchange': str(self.exchanges[top_ver]),
+                'merged': chain[1:],
+                'nodes': nodes,
+                'x2_time': None,
+                'slowest_node': None,
+                'slowest_time': None,
+            }
+            if started and finished and max(finished.values()) >= min(started.values()):
+                timing['x2_time'] = int(max(finished.values())) - int(min(started.values()))
+            if nodes:
+                timing['slowest_node'] = max(nodes.keys(), key=lambda node_idx: nodes[node_idx])
+                timing['slowest_time'] = nodes[timing['slowest_node']]
+            timings.append(timing)
+        self._timings = timings
+        return timings
+
+    def get_node_distributions(self):
+        """
+        :return: {<node index>: <distribution of node times over all exchanges>}
+        """
+        node_times = {}
+        for timing in self.get_exchange_timings():
+            for node_idx, node_time in timing['nodes'].items():
+                node_times.setdefault(node_idx, []).append(node_time)
+        return {node_idx: distribution(times) for node_idx, times in sorted(node_times.items())}
+
+    def get_exchange_distributions(self):
+        """
+        :return: {<combined topology version>: <distribution of node times for exchange>}
+        """
+        return {
+            timing['topVer']: distribution(timing['nodes'].values()) for timing in self.get_exchange_timings()
+        }
+
+    def get_summary(self):
+        """
+        :return: distributions of exchange x2 times and of all nodes times over all exchanges
+        """
+        timings = self.get_exchange_timings()
+        return {
+            'exchanges': len(timings),
+            'merged_chains': len(self.get_merged_chains()),
+            'x2_time': distribution([t['x2_time'] for t in timings if t['x2_time'] is not None]),
+            'node_time': distribution([node_time for t in timings for node_time in t['nodes'].values()]),
+        }
+
+    def to_json(self, file_path):
+        data = {
+            'summary': self.get_summary(),
+            'exchanges': [dict(timing, topVer='%s.%s' % ExchangesCollection.split_version_num(timing['topVer']))
+                          for timing in self.get_exchange_timings()],
+            'nodes': self.get_node_distributions(),
+        }
+        with open(file_path, 'w') as w:
+            dump(data, w, indent=2, default=str)
+        return file_path
+
+    def to_csv(self, file_path):
+        """
+        Write one row per exchange and node.
+        """
+        with open(file_path, 'w', newline='') as w:
+            csv_writer = writer(w)
+            csv_writer.writerow(['major_topVer', 'minor_topVer', 'exchange', 'merged', 'node', 'time', 'x2_time',
+                                 'slowest'])
+            for timing in self.get_exchange_timings():
+                major_top_ver, minor_top_ver = ExchangesCollection.split_version_num(timing['topVer'])
+                merged = ' '.join(['%s.%s' % ExchangesCollection.split_version_num(top_ver)
+                                   for top_ver in timing['merged']])
+                for node_idx, node_time in timing['nodes'].items():
+                    csv_writer.writerow([major_top_ver, minor_top_ver, timing['exchange'], merged, node_idx, node_time,
+                                         timing['x2_time'], node_idx == timing['slowest_node']])
+        return file_path
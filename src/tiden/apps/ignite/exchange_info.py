@@ -14,6 +14,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from bisect import bisect_left, bisect_right, insort
 from re import match, findall
 from datetime import timedelta
 from yaml import add_representer, add_constructor
@@ -141,9 +142,72 @@ class ExchangeInfo:
 
 
 class ExchangesCollection(dict):
+    """
+    Exchanges by combined topology version (major_topVer * 10000 + minor_topVer).
+
+    Keeps sorted index of topology versions, so merged exchanges lookup and range queries don't sort all keys.
+    """
 
     run_id = 0
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._top_vers = sorted(self.keys())
+
+    def __setitem__(self, topVer, exchange):
+        if topVer not in self:
+            insort(self.get_top_vers(), topVer)
+        super().__setitem__(topVer, exchange)
+
+    def __delitem__(self, topVer):
+        super().__delitem__(topVer)
+        top_vers = self.get_top_vers()
+        idx = bisect_left(top_vers, topVer)
+        if idx < len(top_vers) and top_vers[idx] == topVer:
+            del top_vers[idx]
+
+    # dict mutators below bypass __setitem__/__delitem__, index is rebuilt on next use
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._top_vers = None
+
+    def pop(self, *args):
+        self._top_vers = None
+        return super().pop(*args)
+
+    def popitem(self):
+        self._top_vers = None
+        return super().popitem()
+
+    def setdefault(self, topVer, default=None):
+        self._top_vers = None
+        return super().setdefault(topVer, default)
+
+    def clear(self):
+        super().clear()
+        self._top_vers = None
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def get_top_vers(self):
+        """
+        :return: sorted list of combined topology versions
+        """
+        top_vers = getattr(self, '_top_vers', None)
+        if top_vers is None or len(top_vers) != len(self):
+            top_vers = self._top_vers = sorted(self.keys())
+        return top_vers
+
+    def get_exchanges_range(self, min_topVer, max_topVer):
+        """
+        Get exchanges with combined topology version in range [min_topVer, max_topVer]
+        :return: list of exchanges ordered by topology version
+        """
+        top_vers = self.get_top_vers()
+        return [self[topVer] for topVer in top_vers[bisect_left(top_vers, min_topVer):bisect_right(top_vers, max_topVer)]]
+
     @staticmethod
     def split_version_num(topVer):
         return divmod(topVer, 10000)
@@ -164,47 +228,37 @@ class ExchangesCollection(dict):
         return self.get(topVer, None)
 
     def get_min_merged_exchange(self, major_topVer):
-        topVers = reversed(sorted(list(self.keys())))
+        top_vers = self.get_top_vers()
         targVer = ExchangesCollection.glue_version_num(major_topVer, 0)
-        found = False
         minVer = None
-        merged_exchanges = set()
-        for topVer in topVers:
-            if not found:
-                if topVer <= targVer:
-                    found = True
-                    minVer = topVer
-                    merged_exchanges |= {topVer} | self[topVer].merged_exchanges
-            else:
-                if self[topVer].merged:
-                    merges_intersect = self[topVer].merged_exchanges & merged_exchanges
-                    if len(merges_intersect) > 0:
-                        minVer = topVer
-                        merged_exchanges = merged_exchanges | {topVer}
-                else:
+        # latest exchange not after target version
+        idx = bisect_right(top_vers, targVer) - 1
+        if idx >= 0:
+            minVer = top_vers[idx]
+            merged_exchanges = {minVer} | self[minVer].merged_exchanges
+            for topVer in reversed(top_vers[:idx]):
+                if not self[topVer].merged:
                     break
+                if len(self[topVer].merged_exchanges & merged_exchanges) > 0:
+                    minVer = topVer
+                    merged_exchanges = merged_exchanges | {topVer}
         return self[minVer]
 
     def get_max_merged_exchange(self, major_topVer):
-        topVers = sorted(list(self.keys()))
+        top_vers = self.get_top_vers()
         targVer = ExchangesCollection.glue_version_num(major_topVer, 0)
-        found = False
         maxVer = None
-        merged_exchanges = set()
-        for topVer in topVers:
-            if not found:
-                if topVer >= targVer:
-                    found = True
-                    maxVer = topVer
-                    merged_exchanges |= {topVer} | self[topVer].merged_exchanges
-            else:
-                if self[topVer].merged:
-                    merges_intersect = self[topVer].merged_exchanges & merged_exchanges
-                    if len(merges_intersect) > 0:
-                        maxVer = topVer
-                        merged_exchanges = merged_exchanges | {topVer}
-                else:
+        # earliest exchange not before target version
+        idx = bisect_left(top_vers, targVer)
+        if idx < len(top_vers):
+            maxVer = top_vers[idx]
+            merged_exchanges = {maxVer} | self[maxVer].merged_exchanges
+            for topVer in top_vers[idx + 1:]:
+                if not self[topVer].merged:
                     break
+                if len(self[topVer].merged_exchanges & merged_exchanges) > 0:
+                    maxVer = topVer
+                    merged_exchanges = merged_exchanges | {topVer}
         return self[maxVer]
 
     def is_exchange_finished(self, major_topVer, minor_topVer, n_expected_nodes):
@@ -336,45 +390,41 @@ class ExchangesCollection(dict):
     def _parse_ignite_log_time(s):
         return LogTimeStamp.parse_timestamp(s)
 
-    @staticmethod
-    def get_exchanges_from_logs(ignite, host_group='alive_server'):
-        start_exch = ignite.grep_all_data_from_log(
-            host_group,
+    exchange_log_patterns = {
+        'started_exchange_init': (
             'Started exchange init',
             '\[([0-9,:]+)\]\[INFO\].*'
             '\[topVer=AffinityTopologyVersion \[(topVer=[0-9]+, minorTopVer=[0-9]+\]).*'
             'evt=([^,]*),.*(customEvt=([^ ]*)?)',
-            'started_exchange_init',
-            default_value='',
-        )
-        finish_exch = ignite.grep_all_data_from_log(
-            host_group,
+        ),
+        'finish_exchange_future': (
             'Finish exchange future',
             '\[([0-9,:]+)\]\[INFO\].*'
             'startVer=AffinityTopologyVersion \[(topVer=[0-9]+, minorTopVer=[0-9]+\]),'
             ' resVer=AffinityTopologyVersion \[(topVer=[0-9]+, minorTopVer=[0-9]+\])',
-            'finish_exchange_future',
-            default_value='',
-        )
-
-        merge_exch = ignite.grep_all_data_from_log(
-            host_group,
+        ),
+        'merge_exchange_future': (
             'Merge exchange future',
             '\[([0-9,:]+)\]\[INFO\].*'
             'curFut=AffinityTopologyVersion \[(topVer=[0-9]+, minorTopVer=[0-9]+\]),'
             ' mergedFut=AffinityTopologyVersion \[(topVer=[0-9]+, minorTopVer=[0-9]+\]).*'
             'evt=([^,]*),',
-            'merge_exchange_future',
+        ),
+    }
+
+    @staticmethod
+    def get_exchanges_from_logs(ignite, host_group='alive_server'):
+        # all three kinds of exchange messages are taken by single grep pass per node log
+        exch_msgs = ignite.grep_all_data_from_log_multi(
+            host_group,
+            ExchangesCollection.exchange_log_patterns,
             default_value='',
         )
-
-        # from tiden.util import write_yaml_file
-        # from os.path import dirname, join
-        # write_yaml_file(join(dirname(__file__), 'start_exch.%d.yaml' % ExchangesCollection.run_id), start_exch)
-        # write_yaml_file(join(dirname(__file__), 'finish_exch.%d.yaml' % ExchangesCollection.run_id), finish_exch)
-        # write_yaml_file(join(dirname(__file__), 'merge_exch.%d.yaml' % ExchangesCollection.run_id), merge_exch)
-        # ExchangesCollection.run_id += 1
-        return ExchangesCollection.create_from_log_data(start_exch, finish_exch, merge_exch)
+        return ExchangesCollection.create_from_log_data(
+            exch_msgs['started_exchange_init'],
+            exch_msgs['finish_exchange_future'],
+            exch_msgs['merge_exchange_future'],
+        )
 
     @staticmethod
     def create_from_log_data(start_exch_msgs, finish_exch_msgs, merge_exch_msgs):
@@ -835,26 +835,30 @@ class Ignite(IgniteComponents, App):
         :param node_idx: node index you are trying to kill.
         :return:
         """
-        from tiden.stress import StressT
+        from tiden.faultscheduler import FaultScheduler
         from tiden.util import util_get_now
 
-        make_stress = StressT(self.ssh)
-
         if self.nodes.get(node_idx) and self.nodes.get(node_idx).get('PID'):
             path, host = self.nodes.get(node_idx).get('ignite_home'), self.nodes.get(node_idx).get('host')
             log_print('Going to load IO for 120 sec. Started at %s' % util_get_now(), color='green')
-            make_stress.fio_start(120, path, host)
-
-            util_sleep_for_a_while(5)
-            # wait for checkpoint starting
-            output = self.wait_for_messages_in_log(node_idx, "Checkpoint started", lines_limit=10)
 
-            if not output:
+            # node is killed on the host right after checkpoint message appears in log
+            scheduler = FaultScheduler(self.ssh, self.config['rt']['remote']['test_dir'])
+            scheduler.fio(host, path, 120)
+            kill = scheduler.kill(host, self.nodes[node_idx]['PID'], at=5,
+                                  on_log=(self.nodes[node_idx]['log'], 'Checkpoint started'), log_timeout=200,
+                                  on_timeout='inject')
+            scheduler.start()
+            try:
+                scheduler.wait_for_fault(kill)
+            finally:
+                scheduler.stop()
+
+            if not [event for event in scheduler.events if event['fault'] == kill.fault_id
+                    and event['event'] == 'triggered']:
                 log_print('Checkpoint has not found in logs for node %s' % node_idx, color='red')
 
             self.kill_node(node_idx)
-
-            make_stress.fio_rm_file(path, host)
         else:
             log_print('No node %s in the grid' % node_idx, color='red')
 
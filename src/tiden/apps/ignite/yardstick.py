@@ -14,13 +14,34 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from os import makedirs, remove
+from os.path import exists, join
+from re import escape
+from tarfile import open as tar_open
+from time import sleep, time
+
 # from ..app import App
 from ..nodestatus import NodeStatus
+from .igniteexception import IgniteException
+from .yardstick_results import YardstickResults
 from ...util import log_print, log_put
 
 
 class Yardstick:  # (App):
 
+    # driver output lines marking benchmark phases, in phases order
+    driver_markers = [
+        ('warmup', 'Starting warmup'),
+        ('benchmark', 'Starting main test'),
+        ('finished', 'Finished main test'),
+    ]
+
+    # seconds between drivers state checks
+    poll_interval = 5
+
+    # seconds given to drivers to start and to stop in addition to warmup and duration
+    finish_timeout = 180
+
     def __init__(self, ignite):
         self.ignite = ignite
         self.driver_options = {
@@ -93,6 +114,8 @@ class Yardstick:  # (App):
     def run(self):
         log_print("Yardstick benchmark, %s driver(s) starting" % self.drivers_count)
         client_cmds = {}
+        # {host: [node index of each driver command]}
+        host_nodes = {}
         driver_nodes = []
         for client in range(1, self.drivers_count+1):
             # Get next client host
@@ -118,7 +141,7 @@ class Yardstick:  # (App):
                   "org.yardstickframework.BenchmarkDriverStartUp " \
                   "--outputFolder {output_dir} " \
                   "{args} " \
-                  "> {log_file_path} 2>&1 &".format(
+                  "> {log_file_path} 2>&1 & echo $!".format(
                       ignite_home=self.ignite.client_ignite_home,
                       class_path=':'.join(self.class_paths),
                       node_jvm_options_str=node_jvm_opts_str,
@@ -129,44 +152,190 @@ class Yardstick:  # (App):
             self.ignite.nodes[node_index] = {
                 'host': host,
                 'log': log_file_path,
+                'output_dir': output_dir,
                 'run_counter': 0,
                 'status': NodeStatus.STARTING
             }
-            if not client_cmds.get(host):
-                client_cmds[host] = [cmd]
-            else:
-                client_cmds[host].append(cmd)
+            client_cmds.setdefault(host, []).append(cmd)
+            host_nodes.setdefault(host, []).append(node_index)
 
         try:
-            self.ignite.ssh.exec(client_cmds)
-            self.ignite.wait_for_topology_snapshot(
-                self.ignite.get_nodes_num('server'),
-                self.drivers_count,
-                '',
-                skip_nodes_check=True
-            )
-            started_nodes = self.ignite.get_started_node_attrs()
+            results = self.ignite.ssh.exec(client_cmds)
             started_drivers_num = 0
-            for node_idx in started_nodes.keys():
-                self.ignite.nodes[node_idx].update(started_nodes[node_idx])
-                if started_nodes[node_idx].get('PID') is not None:
-                    self.ignite.nodes[node_idx]['status'] = NodeStatus.STARTED
-                    # Client node has id that starts from 5000
-                    if int(node_idx) >= 5000:
+            for host, outputs in results.items():
+                for node_idx, output in zip(host_nodes[host], outputs):
+                    pid = output.strip().split('\n')[-1].strip()
+                    if pid.isdigit():
+                        self.ignite.nodes[node_idx]['PID'] = pid
                         started_drivers_num += 1
             log_print("Yardstick benchmark, started drivers: %s/%s" % (started_drivers_num, self.drivers_count))
-            log_print("Yardstick waiting for stopped drivers")
-            self.ignite.wait_for_topology_snapshot(
-                None,
-                0,
-                timeout=int(self.warmup + self.duration + 180),
-                check_only_servers=True
-            )
+            log_print("Yardstick waiting for drivers to finish")
+            self.wait_for_drivers(driver_nodes)
         finally:
             self.ignite.kill_nodes(*driver_nodes)
             for id in driver_nodes:
                 del self.ignite.nodes[id]
 
+    def get_drivers_state(self, driver_nodes):
+        """
+        Check drivers processes, their last phase markers and last throughput probe in one call per host.
+        :return: {node index: {'alive': bool, 'phase': str, 'probe': (time, operations/sec, latency) or None}}
+        """
+        markers = '|'.join([escape(marker) for _, marker in self.driver_markers])
+        commands = {}
+        for node_idx in driver_nodes:
+            node = self.ignite.nodes[node_idx]
+            if not node.get('PID'):
+                continue
+            commands.setdefault(node['host'], []).append(
+                "if kill -0 {pid} 2>/dev/null; then echo '{idx} alive'; else echo '{idx} dead'; fi; "
+                "grep -oE '{markers}' {log} 2>/dev/null | tail -1 | sed 's/^/{idx} marker /'; "
+                "probe=$(ls -t {output_dir}/*/ThroughputLatencyProbe.csv 2>/dev/null | head -1); "
+                "[ -n \"$probe\" ] && tail -1 \"$probe\" | sed 's/^/{idx} probe /'; true".format(
+                    idx=node_idx, pid=node['PID'], markers=markers, log=node['log'], output_dir=node['output_dir'])
+            )
+        states = {}
+        results = self.ignite.ssh.exec({host: ['; '.join(cmds)] for host, cmds in commands.items()})
+        for host, outputs in results.items():
+            for line in ''.join(outputs).split('\n'):
+                values = line.strip().split(' ', 2)
+                if len(values) < 2 or not values[0].isdigit() or int(values[0]) not in driver_nodes:
+                    continue
+                state = states.setdefault(int(values[0]), {'alive': False, 'phase': 'starting', 'probe': None})
+                if values[1] in ('alive', 'dead'):
+                    state['alive'] = values[1] == 'alive'
+                elif values[1] == 'marker' and len(values) > 2:
+                    for phase, marker in self.driver_markers:
+                        if values[2] == marker:
+                            state['phase'] = phase
+                elif values[1] == 'probe' and len(values) > 2:
+                    try:
+                        state['probe'] = tuple(float(value) for value in values[2].split(','))
+                    except ValueError:
+                        pass
+        return states
+
+    def wait_for_drivers(self, driver_nodes, timeout=None):
+        """
+        Wait until all drivers report benchmark finish. Live throughput is reported while waiting.
+        :param driver_nodes: driver node indexes
+        :param timeout: default is warmup + duration + finish_timeout
+        :raises IgniteException: when any driver died before finishing benchmark or timeout reached
+        :return: last drivers state, see `get_drivers_state`
+        """
+        if timeout is None:
+            timeout = int(self.warmup or 0) + int(self.duration or 0) + self.finish_timeout
+        started = time()
+        phases = {}
+        while True:
+            states = self.get_drivers_state(driver_nodes)
+            for node_idx, state in sorted(states.items()):
+                if state['alive'] and self.ignite.nodes[node_idx]['status'] == NodeStatus.STARTING:
+                    self.ignite.nodes[node_idx]['status'] = NodeStatus.STARTED
+                if phases.get(node_idx) != state['phase']:
+                    phases[node_idx] = state['phase']
+                    log_print("Yardstick driver %s: %s" % (node_idx, state['phase']))
+
+            finished = [node_idx for node_idx, state in states.items() if state['phase'] == 'finished']
+            failed = [node_idx for node_idx, state in states.items()
+                      if not state['alive'] and state['phase'] != 'finished']
+            # drivers without PID did not start at all
+            missing = [node_idx for node_idx in driver_nodes if not self.ignite.nodes[node_idx].get('PID')]
+            if failed or missing:
+                for node_idx in failed:
+                    self.ignite.nodes[node_idx]['status'] = NodeStatus.KILLED
+                raise IgniteException('Yardstick driver(s) died before benchmark finished: %s, see logs: %s' % (
+                    ', '.join([str(node_idx) for node_idx in sorted(failed + missing)]),
+                    ', '.join([self.ignite.nodes[node_idx]['log'] for node_idx in sorted(failed + missing)])))
+            if len(finished) == len(driver_nodes):
+                log_print("Yardstick benchmark, all %s driver(s) finished in %s sec" % (
+                    len(driver_nodes), int(time() - started)))
+                return states
+
+            probes = [state['probe'] for state in states.values()
+                      if state['probe'] is not None and len(state['probe']) > 2 and state['phase'] != 'finished']
+            if probes:
+                log_put("Yardstick throughput: %.2f ops/sec, latency: %.2f nsec, drivers finished: %s/%s" % (
+                    sum(probe[1] for probe in probes),
+                    sum(probe[2] for probe in probes) / len(probes),
+                    len(finished), len(driver_nodes)))
+
+            if time() - started > timeout:
+                raise IgniteException('Yardstick drivers did not finish in %s sec' % timeout)
+            sleep(self.poll_interval)
+
+    def collect_results(self, local_dir=None):
+        """
+        Download drivers output folders from driver hosts concurrently.
+        :param local_dir: local directory, default is local test directory
+        :return: local directory with drivers output folders
+        """
+        if local_dir is None:
+            local_dir = join(self.ignite.config['rt']['test_dir'], 'yardstick')
+        makedirs(local_dir, exist_ok=True)
+        commands = {}
+        for host in set(self.driver_hosts):
+            commands[host] = (
+                "sh -c 'cd %s && tar -czf - %s.*'" % (self.method_home, self.ignite.name),
+                join(local_dir, '%s.tar.gz' % host),
+            )
+        results = self.ignite.ssh.exec_to_files(commands)
+        for host, (_, archive) in commands.items():
+            if results.get(host):
+                with tar_open(archive, 'r:gz') as tar:
+                    tar.extractall(local_dir)
+            else:
+                log_print("Yardstick results not found on %s" % host, color='red')
+            if exists(archive):
+                remove(archive)
+        return local_dir
+
+    def get_results(self, local_dir=None):
+        """
+        :return: YardstickResults of drivers of this Ignite app
+        """
+        return YardstickResults.from_dir(self.collect_results(local_dir))
+
+    def check_results(self, baseline_path=None, threshold=0.05, trim_start=None, trim_end=0, local_dir=None):
+        """
+        Collect results, compute statistics and compare them with baseline.
+        :param baseline_path: statistics file of baseline run, statistics of this run are saved there when file
+            doesn't exist
+        :param threshold: relative change of mean not reported as regression
+        :param trim_start: seconds skipped from series start, driver warmup by default
+        :param trim_end: seconds skipped at series end
+        :param local_dir: local directory for drivers output folders
+        :return: (statistics, comparison with baseline or None)
+        """
+        local_dir = self.collect_results(local_dir)
+        results = YardstickResults.from_dir(local_dir)
+        statistics = results.get_statistics(
+            trim_start=int(self.warmup or 0) if trim_start is None else trim_start,
+            trim_end=trim_end,
+        )
+        YardstickResults.save_statistics(statistics, join(local_dir, 'statistics.json'))
+        for metric in ('throughput', 'latency'):
+            if statistics[metric].get('mean') is not None:
+                log_print("Yardstick %s: %.2f +/- %s (%s drivers, %s sec)" % (
+                    metric, statistics[metric]['mean'],
+                    '%.2f' % statistics[metric]['ci95'] if statistics[metric]['ci95'] is not None else 'n/a',
+                    statistics['drivers'], statistics['seconds']))
+
+        comparison = None
+        if baseline_path is not None:
+            if exists(baseline_path):
+                comparison = YardstickResults.compare(statistics, YardstickResults.load_statistics(baseline_path),
+                                                      threshold=threshold)
+                for metric, change in comparison.items():
+                    log_print("Yardstick %s: %.2f vs baseline %.2f (%+.1f%%)%s" % (
+                        metric, change['current'], change['baseline'], change['change'] * 100,
+                        ' REGRESSION' if change['regression'] else ''),
+                        color='red' if change['regression'] else 'green')
+            else:
+                log_print("Yardstick baseline saved to %s" % baseline_path)
+                YardstickResults.save_statistics(statistics, baseline_path)
+        return statistics, comparison
+
     def draw_charts(self):
         log_print(f"Drawing charts for {self.ignite.name}...")
 
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from json import dump, load
+from math import sqrt
+from os import walk
+from os.path import join, relpath
+
+from ...util import distribution
+
+THROUGHPUT_PROBE_FILE = 'ThroughputLatencyProbe.csv'
+
+# two-sided 95% Student's t critical values by degrees of freedom
+T_CRITICAL_95 = [
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+]
+
+# metric: whether bigger value is better
+METRICS = {
+    'throughput': True,
+    'latency': False,
+}
+
+
+def t_critical_95(df):
+    if df < 1:
+        return None
+    if df > len(T_CRITICAL_95):
+        return 1.96
+    return T_CRITICAL_95[int(df) - 1]
+
+
+def parse_probe_file(lines):
+    """
+    Parse Yardstick probe dump.
+    :param lines: iterable of probe file lines
+    :return: list of rows, each row is tuple of floats (time, value, ...), comment and header lines are skipped
+    """
+    rows = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('--') or line.startswith('@@') or line.startswith('**'):
+            continue
+        try:
+            rows.append(tuple(float(value) for value in line.split(',')))
+        except ValueError:
+            continue
+    return rows
+
+
+def merge_series(drivers_rows):
+    """
+    Merge throughput/latency series of drivers by probe time.
+    :param drivers_rows: {driver: [(time, operations/sec, latency nsec), ...]}
+    :return: [(time, total operations/sec, latency nsec weighted by driver throughput), ...] ordered by time,
+        only times reported by all drivers are kept
+    """
+    by_time = {}
+    for rows in drivers_rows.values():
+        for row in rows:
+            if len(row) < 3:
+                continue
+            by_time.setdefault(int(row[0]), []).append((row[1], row[2]))
+    merged = []
+    for time in sorted(by_time.keys()):
+        points = by_time[time]
+        if len(points) != len(drivers_rows):
+            continue
+        throughput = sum(point[0] for point in points)
+        if throughput > 0:
+            latency = sum(point[0] * point[1] for point in points) / throughput
+        else:
+            latency = sum(point[1] for point in points) / len(points)
+        merged.append((time, throughput, latency))
+    return merged
+
+
+def batch_means(values, batches):
+    """
+    Means of consecutive batches: neighbour per-second probe values are correlated, batch means are close to
+    independent, so confidence intervals built on them are not too optimistic.
+    """
+    if len(values) < batches:
+        return list(values)
+    size = len(values) // batches
+    # leftover values at the end are dropped to keep batches equal
+    return [sum(values[i * size:(i + 1) * size]) / size for i in range(batches)]
+
+
+def mean_stats(samples):
+    """
+    :return: {'n': int, 'mean': float, 'stdev': float, 'ci95': half width of 95% confidence interval}
+    """
+    n = len(samples)
+    if n == 0:
+        return {'n': 0, 'mean': None, 'stdev': None, 'ci95': None}
+    mean = sum(samples) / n
+    if n == 1:
+        return {'n': 1, 'mean': mean, 'stdev': 0.0, 'ci95': None}
+    stdev = sqrt(sum((value - mean) ** 2 for value in samples) / (n - 1))
+    return {'n': n, 'mean': mean, 'stdev': stdev, 'ci95': t_critical_95(n - 1) * stdev / sqrt(n)}
+
+
+def welch_test(current, baseline):
+    """
+    Welch's t-test for difference of means at 95% confidence.
+    :param current: mean stats of current run
+    :param baseline: mean stats of baseline run
+    :return: True if means differ significantly, None if there are not enough samples
+    """
+    if current.get('n', 0) < 2 or baseline.get('n', 0) < 2:
+        return None
+    var_current = current['stdev'] ** 2 / current['n']
+    var_baseline = baseline['stdev'] ** 2 / baseline['n']
+    if var_current + var_baseline == 0:
+        return current['mean'] != baseline['mean']
+    t = abs(current['mean'] - baseline['mean']) / sqrt(var_current + var_baseline)
+    df = (var_current + var_baseline) ** 2 / (
+        var_current ** 2 / (current['n'] - 1) + var_baseline ** 2 / (baseline['n'] - 1))
+    return t > t_critical_95(max(1, int(df)))
+
+
+class YardstickResults:
+    """
+    Yardstick benchmark results parsed from drivers output folders.
+
+    Each driver writes probe CSVs into its own output folder, per-driver series are merged by probe time.
+    Statistics are computed over series trimmed by warmup and cool-down seconds, means are compared with Welch's
+    t-test over batch means.
+    """
+
+    batches = 10
+
+    def __init__(self, drivers_rows=None):
+        # {driver: [(time, operations/sec, latency nsec), ...]}
+        self.drivers_rows = drivers_rows if drivers_rows is not None else {}
+
+    @classmethod
+    def from_dir(cls, results_dir, probe_file=THROUGHPUT_PROBE_FILE):
+        """
+        Load probe files found under results directory, driver name is probe file directory relative path.
+        """
+        drivers_rows = {}
+        for root, dirs, files in walk(results_dir):
+            dirs.sort()
+            for file_name in sorted(files):
+                if file_name.endswith(probe_file):
+                    with open(join(root, file_name)) as r:
+                        rows = parse_probe_file(r)
+                    if rows:
+                        drivers_rows[relpath(root, results_dir)] = rows
+        return cls(drivers_rows)
+
+    def get_series(self):
+        return merge_series(self.drivers_rows)
+
+    def get_statistics(self, trim_start=0, trim_end=0):
+        """
+        :param trim_start: seconds to skip from series start (warmup)
+        :param trim_end: seconds to skip at series end (drivers stopping)
+        :return: {
+                'drivers': <number of drivers>,
+                'seconds': <number of seconds accounted>,
+                'throughput': {'n', 'mean', 'stdev', 'ci95', 'count', 'min', 'p50', 'p95', 'p99', 'max'},
+                'latency': {...},
+            }
+        """
+        series = self.get_series()
+        if series:
+            first_time, last_time = series[0][0], series[-1][0]
+            series = [row for row in series if first_time + trim_start <= row[0] <= last_time - trim_end]
+        statistics = {
+            'drivers': len(self.drivers_rows),
+            'seconds': len(series),
+        }
+        for idx, metric in enumerate(METRICS.keys(), start=1):
+            values = [row[idx] for row in series]
+            metric_stats = distribution(values)
+            # mean and confidence interval are over batch means
+            metric_stats.update(mean_stats(batch_means(values, self.batches)))
+            statistics[metric] = metric_stats
+        return statistics
+
+    @staticmethod
+    def compare(statistics, baseline, threshold=0.05):
+        """
+        Compare run statistics with baseline statistics.
+        :param statistics: current run statistics, see `get_statistics`
+        :param baseline: baseline run statistics
+        :param threshold: relative change of mean less than this is never reported as regression
+        :return: {metric: {'current': mean, 'baseline': mean, 'change': relative change, 'significant': bool,
+                           'regression': bool}}
+        """
+        comparison = {}
+        for metric, bigger_is_better in METRICS.items():
+            current = statistics.get(metric, {})
+            base = baseline.get(metric, {})
+            if current.get('mean') is None or not base.get('mean'):
+                continue
+            change = (current['mean'] - base['mean']) / base['mean']
+            significant = welch_test(current, base)
+            worse = change < -threshold if bigger_is_better else change > threshold
+            comparison[metric] = {
+                'current': current['mean'],
+                'baseline': base['mean'],
+                'change': change,
+                'significant': significant,
+                'regression': bool(worse and significant),
+            }
+        return comparison
+
+    @staticmethod
+    def save_statistics(statistics, file_path):
+        with open(file_path, 'w') as w:
+            dump(statistics, w, indent=2)
+        return file_path
+
+    @staticmethod
+    def load_statistics(file_path):
+        with open(file_path) as r:
+            return load(r)
@@ -17,8 +17,43 @@
 from time import sleep, time
 
 from ...util import *
+from ...hostmetrics import HostMetricsCollector, NET_DEV_COUNTERS, parse_net_dev_line
 from ..app import App
 
+# counters reported as rates by Netstat sampling
+NET_RATE_COUNTERS = (
+    'rx_bytes', 'tx_bytes', 'rx_packets', 'tx_packets', 'rx_errs', 'tx_errs', 'rx_drop', 'tx_drop',
+)
+
+
+class NetworkSampler(HostMetricsCollector):
+    """
+    Long-running /proc/net/dev reader, one per host, keeping all samples.
+    """
+
+    collector_name = 'netstat_proc'
+
+    def __init__(self, ssh, remote_dir, interval=1):
+        super().__init__(ssh, remote_dir, interval=interval)
+        # {host: [samples]}
+        self.history = {}
+
+    def get_sample_commands(self):
+        return (
+            "echo \"T $(date +%s.%N)\"; "
+            "tail -n +3 /proc/net/dev | sed \"s/^/N /\"; "
+        )
+
+    def start(self):
+        self.history = {}
+        super().start()
+
+    def read(self):
+        new_samples = super().read()
+        for host, samples in new_samples.items():
+            self.history.setdefault(host, []).extend(samples)
+        return new_samples
+
 
 class Netstat(App):
 
@@ -26,42 +61,30 @@ class Netstat(App):
         super().__init__(*args, **kwargs)
         self.hosts = list(set(self.ssh.hosts))
         self.pids = {}
+        self.sampler = None
+        # [(step name, start time)]
+        self.steps = []
 
     def network(self):
+        """
+        Cumulative RX/TX counters of interfaces from /proc/net/dev.
+        :return: {host: {interface: {'RX': {'packets': str, 'bytes': str}, 'TX': {...}}, 'total': {...}}}
+        """
         result = {}
-        res = self.ssh.exec(['/sbin/ifconfig'])
+        res = self.ssh.exec(['cat /proc/net/dev'])
         for host in res.keys():
             result[host] = {}
-            intf_name = None
-            buffer = []
-            for line in res[host][0].split('\n'):
-                buffer.append(line)
-                m = search('^([a-z0-9]+)\: (.+)$', line)
-                if m:
-                    intf_name = m.group(1)
-                    if not result[host].get(intf_name):
-                        result[host][intf_name] = {}
-                m = search('(TX|RX)\s+(packets)\s+([0-9]+)\s+(bytes)\s+([0-9]+)', line)
-                if m:
-                    traffic_direction = m.group(1)
-                    if not intf_name:
-                        pass
-                        # log_print('WARN: Found TX|TR for unknown interface in buffer\n {}'.format('\n'.join(buffer)),
-                        #           level='debug')
-                    else:
-                        if not result[host][intf_name].get(traffic_direction):
-                            result[host][intf_name][traffic_direction] = {}
-                        else:
-                            pass
-                            # TODO fix debug level
-                            # print_debug(
-                            #     'WARN: Found TX|TR for unknown interface in buffer\n {}'.format('\n'.join(buffer)))
-                        result[host][intf_name][traffic_direction][m.group(2)] = m.group(3)
-                        result[host][intf_name][traffic_direction][m.group(4)] = m.group(5)
-                    # cleanup buffer for current interface as soon as we've fount TX and RX (len == 2) components
-                    if intf_name and len(result[host][intf_name]) == 2:
-                        buffer = []
-                        intf_name = None
+            for line in ''.join(res[host]).split('\n'):
+                intf_name, counters = parse_net_dev_line(line)
+                if intf_name is None:
+                    continue
+                counters = dict(zip(NET_DEV_COUNTERS, counters))
+                result[host][intf_name] = {
+                    direction.upper(): {
+                        'packets': str(counters['%s_packets' % direction]),
+                        'bytes': str(counters['%s_bytes' % direction]),
+                    } for direction in ('rx', 'tx')
+                }
         for host in result.keys():
             total = {}
             for intf_name in result[host].keys():
@@ -76,3 +99,77 @@ class Netstat(App):
             result[host]['total'] = total
         return result
 
+    def start_sampling(self, interval=1, remote_dir=None):
+        """
+        Start sampling /proc/net/dev on all hosts.
+        :param interval: seconds between samples
+        :param remote_dir: directory for samples file, default is remote suite var directory
+        """
+        if remote_dir is None:
+            remote_dir = self.config['remote']['suite_var_dir']
+        self.stop_sampling()
+        self.sampler = NetworkSampler(self.ssh, remote_dir, interval=interval)
+        self.steps = []
+        self.sampler.start()
+
+    def stop_sampling(self):
+        if self.sampler is not None:
+            self.sampler.stop()
+
+    def mark_step(self, name):
+        """
+        Start new test step: rates sampled from now on are accounted to this step until next step starts.
+        """
+        self.steps.append((name, time()))
+
+    def get_rates(self):
+        """
+        Per interface rates between consecutive samples.
+        :return: {host: {interface: [{'time': <sample time>, 'rx_bytes': <per second>, 'tx_bytes': ...,
+            'rx_packets': ..., 'tx_packets': ..., 'rx_errs': ..., 'tx_errs': ..., 'rx_drop': ..., 'tx_drop': ...},
+            ...]}}
+        """
+        if self.sampler is None:
+            return {}
+        self.sampler.read()
+        indexes = [NET_DEV_COUNTERS.index(counter) for counter in NET_RATE_COUNTERS]
+        rates = {}
+        for host, samples in self.sampler.history.items():
+            host_rates = rates.setdefault(host, {})
+            for prev, cur in zip(samples, samples[1:]):
+                duration = cur.time - prev.time
+                if duration <= 0:
+                    continue
+                for intf_name, counters in cur.nets.items():
+                    prev_counters = prev.nets.get(intf_name)
+                    if prev_counters is None:
+                        continue
+                    rate = {'time': cur.time}
+                    for counter, idx in zip(NET_RATE_COUNTERS, indexes):
+                        # counters are reset when interface goes down and up again
+                        rate[counter] = max(counters[idx] - prev_counters[idx], 0) / duration
+                    host_rates.setdefault(intf_name, []).append(rate)
+        return rates
+
+    def get_step_rates(self):
+        """
+        Average rates per test step marked by `mark_step`.
+        :return: {step name: {host: {interface: {'duration': <seconds>, 'rx_bytes': <per second>, ...}}}}
+        """
+        rates = self.get_rates()
+        step_rates = {}
+        for step_idx, (step_name, step_start) in enumerate(self.steps):
+            step_end = self.steps[step_idx + 1][1] if step_idx + 1 < len(self.steps) else None
+            step = step_rates.setdefault(step_name, {})
+            for host, interfaces in rates.items():
+                for intf_name, intf_rates in interfaces.items():
+                    points = [rate for rate in intf_rates
+                              if rate['time'] > step_start and (step_end is None or rate['time'] <= step_end)]
+                    if not points:
+                        continue
+                    duration = points[-1]['time'] - step_start
+                    average = {'duration': round(duration, 3)}
+                    for counter in NET_RATE_COUNTERS:
+                        average[counter] = sum(point[counter] for point in points) / len(points)
+                    step.setdefault(host, {})[intf_name] = average
+        return step_rates
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from html import escape
+from zlib import crc32
+
+
+def parse_collapsed(lines, stacks=None, prefix=None):
+    """
+    Parse collapsed stacks ('frame;frame;frame count' per line) as written by async-profiler `-o collapsed`.
+    :param lines: iterable of lines
+    :param stacks: (optional) {stack: samples} to merge into
+    :param prefix: (optional) frame to put on top of every stack, e.g. node name
+    :return: {stack: samples}
+    """
+    stacks = stacks if stacks is not None else {}
+    for line in lines:
+        stack, _, count = line.strip().rpartition(' ')
+        if not stack or not count.isdigit():
+            continue
+        if prefix:
+            stack = '%s;%s' % (prefix, stack)
+        stacks[stack] = stacks.get(stack, 0) + int(count)
+    return stacks
+
+
+def write_collapsed(stacks, file_path):
+    with open(file_path, 'w') as w:
+        for stack, count in sorted(stacks.items()):
+            w.write('%s %d\n' % (stack, count))
+    return file_path
+
+
+def _frame_color(name):
+    # stable color per frame name: java frames green, native and kernel frames red/orange
+    seed = crc32(name.encode('utf-8'))
+    if name.endswith('_[j]') or name.endswith('_[i]') or '.' in name or '/' in name:
+        return 'rgb(%d,%d,%d)' % (50 + seed % 60, 170 + (seed >> 8) % 60, 50 + (seed >> 16) % 40)
+    if name.endswith('_[k]'):
+        return 'rgb(%d,%d,%d)' % (200 + seed % 50, 140 + (seed >> 8) % 60, 40)
+    return 'rgb(%d,%d,%d)' % (200 + seed % 55, 70 + (seed >> 8) % 80, 50 + (seed >> 16) % 30)
+
+
+def render_flamegraph(stacks, title='Flame Graph', width=1200, frame_height=16, min_width=0.1):
+    """
+    Render collapsed stacks as standalone SVG flame graph, frames narrower than `min_width` pixels are omitted.
+    :param stacks: {stack: samples}
+    :return: SVG text
+    """
+    # tree node: [samples, {frame name: child node}]
+    root = [0, {}]
+    for stack, count in stacks.items():
+        root[0] += count
+        node = root
+        for frame in stack.split(';'):
+            node = node[1].setdefault(frame, [0, {}])
+            node[0] += count
+
+    total = root[0] or 1
+    scale = (width - 20.0) / total
+    frames = []
+    depth_max = 0
+    pending = []
+    x = 10.0
+    for name, child in sorted(root[1].items()):
+        pending.append((name, child, x, 0))
+        x += child[0] * scale
+    while pending:
+        name, node, x, depth = pending.pop()
+        frame_width = node[0] * scale
+        if frame_width < min_width:
+            continue
+        frames.append((name, node[0], x, depth, frame_width))
+        depth_max = max(depth_max, depth)
+        child_x = x
+        for child_name, child in sorted(node[1].items()):
+            pending.append((child_name, child, child_x, depth + 1))
+            child_x += child[0] * scale
+
+    height = (depth_max + 1) * frame_height + 50
+    svg = [
+        '<?xml version="1.0" standalone="no"?>',
+        '<svg version="1.1" width="%d" height="%d" xmlns="http://www.w3.org/2000/svg">' % (width, height),
+        '<style>text { font-family: Verdana, sans-serif; font-size: 11px; fill: #000; }</style>',
+        '<rect x="0" y="0" width="%d" height="%d" fill="#f8f8f8"/>' % (width, height),
+        '<text x="%d" y="24" text-anchor="middle" style="font-size:16px">%s</text>' % (width // 2, escape(title)),
+    ]
+    for name, samples, x, depth, frame_width in frames:
+        y = height - (depth + 1) * frame_height - 10
+        label = escape(name)
+        svg.append('<g><title>%s (%d samples, %.2f%%)</title>' % (label, samples, 100.0 * samples / total))
+        svg.append('<rect x="%.1f" y="%d" width="%.1f" height="%d" fill="%s" rx="2" ry="2"/>' % (
+            x, y, frame_width, frame_height - 1, _frame_color(name)))
+        # about 7 pixels per character
+        chars = int(frame_width / 7)
+        if chars >= 3:
+            text = name if len(name) <= chars else name[:chars - 2] + '..'
+            svg.append('<text x="%.1f" y="%d">%s</text>' % (x + 3, y + frame_height - 4, escape(text)))
+        svg.append('</g>')
+    svg.append('</svg>')
+    return '\n'.join(svg) + '\n'
@@ -15,10 +15,14 @@
 # limitations under the License.
 
 import os
+from tarfile import open as tar_open
+from time import sleep, time
+from uuid import uuid4
 
 from ..app import App
 from ..appexception import AppException, MissedRequirementException
-from ...util import log_print
+from .flamegraph import parse_collapsed, render_flamegraph, write_collapsed
+from ...util import log_print, pkill_pattern
 
 
 class Profiler(App):
@@ -30,6 +34,13 @@ class Profiler(App):
                    "settings={JFC_PATH}"
     available_profilers = ('jfr', 'async_flamegraph')
 
+    # kernel settings required by async_profiler: (file, expected value)
+    # https://github.com/jvm-profiling-tools/async-profiler#basic-usage
+    async_profiler_requirements = (
+        ('/proc/sys/kernel/perf_event_paranoid', '1'),
+        ('/proc/sys/kernel/kptr_restrict', '0'),
+    )
+
     def __init__(self, name, config, ssh, profiler=''):
         super().__init__(name, config, ssh, app_type='profiler')
         self.type = self.config['environment'].get('yardstick', {}).get('profiler')
@@ -41,8 +52,13 @@ class Profiler(App):
         self.options = {
             'warmup': 60,
             'duration': 60,
-            'bench_name': ''
+            'bench_name': '',
+            # async_flamegraph output: 'collapsed' stacks can be merged into cluster-wide flame graph
+            'output': 'collapsed',
         }
+        # current profiling session: {'id': str, 'dir': remote dir, 'files': {node id: (host, remote file)},
+        #   'ends_at': epoch seconds}
+        self.session = None
 
     def check_requirements(self):
         if self.type == 'jfr':
@@ -54,30 +70,6 @@ class Profiler(App):
         if kwargs:
             self.options.update(kwargs)
 
-    def check_hosts_for_async_profiler(self, hosts):
-        # async_profiler requires 'perf_event_paranoid' and 'kptr_restrict' to be set to '1' and '0' respectively
-        # https://github.com/jvm-profiling-tools/async-profiler#basic-usage
-        check_cmd = ['cat /proc/sys/kernel/perf_event_paranoid',
-                     'cat /proc/sys/kernel/kptr_restrict']
-        check_cmds = {}
-        for h in hosts:
-            check_cmds[hosts[h]['host']] = check_cmd
-
-        out = self.ssh.exec(check_cmds)
-
-        err_msg = ""
-        for host in out.keys():
-            res_str = ''.join(out[host])
-            res_str_exp = "1\n0\n"
-            if res_str != res_str_exp:
-                if len(err_msg) == 0:
-                    err_msg += "Unsatisfied requirement for async_profiler found\n"
-                    err_msg += f"Command: {'; '.join(check_cmd)} on host {host}:\n"
-                err_msg += f"Expected:\n{res_str_exp}\n" + \
-                    f"Actual:\n{res_str}\n"
-        if len(err_msg) > 0:
-            raise MissedRequirementException(err_msg)
-
     def get_jvm_options(self):
         if self.type == 'jfr':
             jfr_str = self.jfr_jvm_opts.format(
@@ -92,50 +84,171 @@ class Profiler(App):
             return []
 
     def start(self):
+        """
+        Start profiling session on all nodes from 'nodes' option at once: one command per host, all hosts
+        in parallel, profiling starts at the same wall clock time after warmup on every node.
+        JFR is started by JVM options (see `get_jvm_options`) unless 'attach' option is set, then it is started
+        on running nodes by jcmd.
+        """
         warmup = self.options['warmup']
         duration = self.options['duration']
         nodes = self.options.get('nodes')
 
-        if self.type == "jfr":
+        if self.type == "jfr" and not self.options.get('attach'):
             log_print("Will be used profiler: {profiler}\nYou no need to call start method.".format(
                 profiler=self.type))
-        elif self.type == "async_flamegraph":
-            # Checks
-            if nodes is None:
-                log_print(f"No Ignite nodes info available. Will not start profiler of type {self.type}", color='red')
-                return
-            self.check_hosts_for_async_profiler(nodes)
-
-            output_dir = self.config['rt']['remote']['test_dir']
-            for node_id in nodes.keys():
-                pid = nodes[node_id]['PID']
-                host = nodes[node_id]['host']
-
-                out_file_basename = os.path.join(output_dir, f"fmgrh-pid-{pid}")
-                out_file_fmg = out_file_basename + '.svg'
-                out_file_log = out_file_basename + '.log'
-
-                self.ssh.exec_on_host(host, [
-                    f"chmod +x {self.async_profiler_home}/*.sh",
-                    f"chmod +x {self.async_profiler_home}/build/*"
-                ])
-
-                cmd = f"sleep {warmup}; " + \
-                      f"{self.async_profiler_home}/profiler.sh " + \
-                      f"-d {duration} -i 999000 -b 5000000 -o svg -f {out_file_fmg} {pid}"
-                cmds = [f"nohup bash -c '{cmd}' >{out_file_log} 2>&1 &"]
-
-                log_print(f"Starting profiler on host {host}")
-                log_print('; '.join(cmds), color='debug')
-
-                self.ssh.exec_on_host(host, cmds)
-
-    def stop(self):
-        if self.type == 'jfr':
+            return
+        if nodes is None:
+            log_print(f"No Ignite nodes info available. Will not start profiler of type {self.type}", color='red')
             return
 
-        # Since async profiler is started with 'duration' option,
-        #  there is no need to stop it explicitly
-        if self.type == "async_flamegraph":
+        session_id = uuid4().hex[:8]
+        session_dir = os.path.join(self.config['rt']['remote']['test_dir'], f"profiler-{session_id}")
+        starts_at = int(time()) + int(warmup)
+        extension = 'jfr' if self.type == 'jfr' else self.options['output']
+        self.session = {'id': session_id, 'dir': session_dir, 'files': {}, 'ends_at': starts_at + int(duration)}
+
+        host_cmds = {}
+        for node_id in sorted(nodes.keys()):
+            pid = nodes[node_id].get('PID')
+            host = nodes[node_id]['host']
+            if not pid:
+                log_print(f"No PID for node {node_id}, it will not be profiled", color='red')
+                continue
+            out_file = os.path.join(session_dir, f"node-{node_id}.{extension}")
+            self.session['files'][node_id] = (host, out_file)
+            if self.type == 'jfr':
+                cmd = f"jcmd {pid} JFR.start name=tiden-{session_id} delay={warmup}s " \
+                      f"duration={duration}s filename={out_file}"
+                if self.config.get('artifacts', {}).get('jfr_cfg'):
+                    cmd += f" settings={self.config['artifacts']['jfr_cfg']['remote_path']}"
+                host_cmds.setdefault(host, []).append(f"{cmd} > {session_dir}/node-{node_id}.log 2>&1")
+            else:
+                cmd = f"d=$(( {starts_at} - $(date +%s) )); [ $d -gt 0 ] && sleep $d; " \
+                      f"{self.async_profiler_home}/profiler.sh " \
+                      f"-d {duration} -i 999000 -b 5000000 -o {self.options['output']} -f {out_file} {pid}"
+                host_cmds.setdefault(host, []).append(
+                    f"nohup bash -c '{cmd}' > {session_dir}/node-{node_id}.log 2>&1 &")
+
+        check = ''
+        prepare = f"mkdir -p {session_dir}"
+        if self.type == 'async_flamegraph':
+            check = ' && '.join([f'[ "$(cat {file})" = "{value}" ]'
+                                 for file, value in self.async_profiler_requirements])
+            prepare += f"; chmod +x {self.async_profiler_home}/*.sh {self.async_profiler_home}/build/*"
+
+        cmds = {}
+        for host, node_cmds in host_cmds.items():
+            # background commands end with '&' and must not be followed by ';'
+            start_cmd = '%s; %s echo started' % (
+                prepare, ' '.join([cmd if cmd.endswith('&') else cmd + ';' for cmd in node_cmds]))
+            if check:
+                reqs = ' '.join([f'{os.path.basename(file)}=$(cat {file})'
+                                 for file, _ in self.async_profiler_requirements])
+                start_cmd = f'if {check}; then {start_cmd}; else echo "unsatisfied {reqs}"; fi'
+            cmds[host] = [start_cmd]
+
+        log_print(f"Starting {self.type} profiler session {session_id} on {len(self.session['files'])} node(s), "
+                  f"profiling starts in {warmup} sec")
+        results = self.ssh.exec(cmds)
+
+        unsatisfied = {host: ''.join(out).strip() for host, out in results.items() if 'started' not in ''.join(out)}
+        if unsatisfied:
+            self.stop(wait=False)
+            raise MissedRequirementException(
+                "Unsatisfied requirement for %s found:\n%s" % (
+                    self.type, '\n'.join([f"{host}: {out}" for host, out in sorted(unsatisfied.items())])))
+
+    def _session_pattern(self):
+        return pkill_pattern('profiler-%s' % self.session['id'])
+
+    def is_running(self):
+        """
+        :return: True if any session launcher is still running on any host
+        """
+        if self.session is None or self.type == 'jfr':
+            return False
+        hosts = set([host for host, _ in self.session['files'].values()])
+        results = self.ssh.exec({host: [f"pgrep -f '{self._session_pattern()}' | wc -l"] for host in hosts})
+        return any(''.join(out).strip() not in ('', '0') for out in results.values())
+
+    def stop(self, wait=True, timeout=60):
+        """
+        Finish profiling session.
+        :param wait: wait for session to complete, otherwise profiling is stopped immediately
+        :param timeout: seconds to wait after expected session end
+        """
+        if self.session is None:
             return
+        if wait:
+            while time() < self.session['ends_at'] + timeout:
+                if time() >= self.session['ends_at'] and not self.is_running():
+                    return
+                sleep(min(5, max(1, int(self.session['ends_at'] - time()))))
+            log_print(f"Profiler session {self.session['id']} did not finish in time, stopping it", color='red')
+
+        cmds = {}
+        for node_id, (host, out_file) in self.session['files'].items():
+            pid = self.options['nodes'][node_id]['PID']
+            if self.type == 'jfr':
+                cmd = f"jcmd {pid} JFR.stop name=tiden-{self.session['id']} filename={out_file}"
+            else:
+                cmd = f"{self.async_profiler_home}/profiler.sh stop -o {self.options['output']} -f {out_file} {pid}"
+            cmds.setdefault(host, []).append(f"{cmd} > /dev/null 2>&1")
+        for host in cmds.keys():
+            cmds[host] = [f"pkill -f '{self._session_pattern()}'; " + '; '.join(cmds[host]) + '; true']
+        self.ssh.exec(cmds)
+
+    def collect(self, local_dir=None):
+        """
+        Download session outputs from all hosts in parallel.
+        :param local_dir: local directory, default is local test directory
+        :return: {node id: local file} of downloaded outputs
+        """
+        if self.session is None:
+            return {}
+        if local_dir is None:
+            local_dir = self.config['rt']['test_dir']
+        local_session_dir = os.path.join(local_dir, f"profiler-{self.session['id']}")
+        os.makedirs(local_session_dir, exist_ok=True)
+        hosts = set([host for host, _ in self.session['files'].values()])
+        commands = {
+            host: (f"sh -c 'cd {self.session['dir']} && tar -czf - .'",
+                   os.path.join(local_session_dir, f"{host}.tar.gz"))
+            for host in hosts
+        }
+        results = self.ssh.exec_to_files(commands)
+        for host, (_, archive) in commands.items():
+            if results.get(host):
+                with tar_open(archive, 'r:gz') as tar:
+                    tar.extractall(local_session_dir)
+            if os.path.exists(archive):
+                os.remove(archive)
+        files = {}
+        for node_id, (host, out_file) in self.session['files'].items():
+            local_file = os.path.join(local_session_dir, os.path.basename(out_file))
+            if os.path.isfile(local_file):
+                files[node_id] = local_file
+            else:
+                log_print(f"No profiler output for node {node_id} on host {host}", color='red')
+        return files
+
+    def merge_flamegraph(self, files, local_dir, per_node=False):
+        """
+        Merge collapsed stacks of nodes into cluster-wide flame graph.
+        :param files: {node id: local collapsed stacks file}, see `collect`
+        :param local_dir: directory for merged stacks and SVG
+        :param per_node: put node frame on top of stacks to compare nodes side by side
+        :return: path to SVG file
+        """
+        stacks = {}
+        for node_id, file in sorted(files.items()):
+            with open(file) as r:
+                parse_collapsed(r, stacks, prefix=f"node-{node_id}" if per_node else None)
+        name = 'cluster' if not self.options['bench_name'] else self.options['bench_name']
+        write_collapsed(stacks, os.path.join(local_dir, f"{name}.collapsed"))
+        svg_file = os.path.join(local_dir, f"{name}.svg")
+        with open(svg_file, 'w') as w:
+            w.write(render_flamegraph(stacks, title=f"{name}: {len(files)} node(s)"))
+        return svg_file
 
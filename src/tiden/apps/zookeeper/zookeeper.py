@@ -26,6 +26,12 @@ class ZooException(AppException):
 
 class Zookeeper (App):
 
+    # seconds to wait for ensemble to elect leader
+    quorum_timeout = 60
+
+    # four-letter commands used to poll ensemble state must be whitelisted since ZooKeeper 3.5
+    four_letter_words = 'srvr,mntr,stat,ruok'
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.logger = get_logger('Zookeeper')
@@ -62,8 +68,7 @@ class Zookeeper (App):
                         'zoo_configs': {
                             'zoo.cfg': {
                                     'path': None,
-                                    'values': ['initLimit=5', 'syncLimit=2',
-                                               'clientPort={}'.format(self.zk_ports_prefix.format(node_idx))]
+                                    'values': self._get_default_zoo_cfg(node_idx)
                                 },
                             'env.cfg': {
                                     'path': None,
@@ -91,26 +96,15 @@ class Zookeeper (App):
         log_print("Deploying Zookeeper on hosts {}, nodes count={}, zoo home={}"
                   .format(hosts, len(self.nodes), self.zookeeper_home), color='green')
 
-        prepare_zoo = {}
         artifact_remote_path = self.config['artifacts']['zookeeper']['remote_path']
-        for host in hosts:
-            prepare_zoo[host] = [
-                'mkdir -p {}'.format(self.zookeeper_home),
-                'ls -1 {}'.format(artifact_remote_path)
-            ]
-            resp = self.ssh.exec(prepare_zoo)
-
-            # Create symlink for zookeeper internal folders and files (we don't)
-            symlink_source_dirs = [symlink_dir for symlink_dir in resp[host][1].split('\n')
-                                   if symlink_dir and symlink_dir not in ['docs', 'src', 'dist-maven']]
-
-            prepare_zoo[host] = []
-            for symlink_dir in symlink_source_dirs:
-                prepare_zoo[host].append(
-                    'ln -s {ln_src}/{ln_dir} {ln_dst}/{ln_dir}'.format(
-                        ln_dir=symlink_dir, ln_src=artifact_remote_path, ln_dst=self.zookeeper_home)
-                )
-            self.ssh.exec(prepare_zoo)
+        # one command per host, all hosts at once
+        # create symlink for zookeeper internal folders and files (we don't want to copy the files)
+        prepare_zoo_cmd = 'mkdir -p {ln_dst}; ' \
+                          'for ln_path in {ln_src}/*; do ' \
+                          'case "${{ln_path##*/}}" in docs|src|dist-maven) ;; ' \
+                          '*) ln -sfn "$ln_path" "{ln_dst}/${{ln_path##*/}}" ;; esac; ' \
+                          'done'.format(ln_src=artifact_remote_path, ln_dst=self.zookeeper_home)
+        self.ssh.exec({host: [prepare_zoo_cmd] for host in hosts})
 
     @classmethod
     def get_config_types(cls):
@@ -137,41 +131,63 @@ class Zookeeper (App):
         """
         self._prepare_zk_configs()
 
-        for node_id in self.nodes.keys():
-            self.start_node(node_id)
+        self.start_nodes(list(self.nodes.keys()))
 
-        self.fill_node_role()
+        self.wait_for_quorum()
         log_print('Zookeeper started:\n{}'.format(repr(self)), color='green')
 
     def start_node(self, node_id):
-        started = False
-
-        if node_id not in self.nodes:
-            log_print('Node id {} is not found in nodes\n{}'.format(node_id, self.nodes), color='red')
-            return
+        self.start_nodes([node_id])
 
-        if self.nodes[node_id].get('state') in [NodeStatus.STARTED]:
-            log_print('Node id {} is already started:\n{}'.format(node_id, self.nodes[node_id]), color='red')
+    def start_nodes(self, node_ids):
+        """
+        Start Zookeeper nodes, all hosts at once.
+        :param node_ids: list of node ids
+        :return: none
+        """
+        run_zookeeper = {}
+        for node_id in node_ids:
+            if node_id not in self.nodes:
+                log_print('Node id {} is not found in nodes\n{}'.format(node_id, self.nodes), color='red')
+                continue
+
+            if self.nodes[node_id].get('state') in [NodeStatus.STARTED]:
+                log_print('Node id {} is already started:\n{}'.format(node_id, self.nodes[node_id]), color='red')
+                continue
+
+            # zkServer.sh writes pid file before it reports STARTED
+            start_cmd = "echo 'ZK_NODE {node_id}';export ZOOCFGDIR={cfg_dir};cd {home};bin/zkServer.sh start {cfg};" \
+                        "echo \"ZK_PID $(cat {cfg_dir}/zookeeper_server.pid)\"". \
+                format(node_id=node_id, cfg_dir=self._get_cfg_path(node_id), home=self.nodes[node_id]['home'],
+                       cfg=self.get_config('zoo.cfg', node_id)['path'])
+            run_zookeeper.setdefault(self.nodes[node_id]['host'], []).append(start_cmd)
+
+        if not run_zookeeper:
             return
 
-        start_cmd = "export ZOOCFGDIR={};cd {};bin/zkServer.sh start {}". \
-            format(self._get_cfg_path(node_id), self.nodes[node_id]['home'], self.get_config('zoo.cfg', node_id)['path'])
-
-        run_zookeeper = {
-            self.nodes[node_id]['host']: [start_cmd]
-        }
-        log_print('Starting Zookeeper on host {}'.format(self.nodes[node_id]['host']), color='green')
+        log_print('Starting Zookeeper nodes {} on hosts {}'.format(
+            ', '.join([str(node_id) for node_id in node_ids]), ', '.join(sorted(run_zookeeper.keys()))),
+            color='green')
         result = self.ssh.exec(run_zookeeper)
         log_print(result, color='debug')
-        for line in result[self.nodes[node_id]['host']][0].split('\n'):
-            if 'STARTED' in line:
-                started = True
-        if started:
-            self.nodes[node_id]['PID'] = self.get_pid(node_id)
-            self.nodes[node_id]['state'] = NodeStatus.STARTED
-        else:
-            raise ZooException('Could not start Zookeeper node {} on host {} using command: {}'.
-                               format(node_id, self.nodes[node_id]['host'], run_zookeeper))
+
+        nodes_output = self.parse_nodes_output(result)
+        failed = []
+        for node_id in node_ids:
+            if node_id not in self.nodes or self.nodes[node_id].get('state') in [NodeStatus.STARTED]:
+                continue
+            output = nodes_output.get(node_id, [])
+            if [line for line in output if 'STARTED' in line]:
+                self.nodes[node_id]['PID'] = None
+                for line in output:
+                    m = search(r'^ZK_PID (\d+)', line)
+                    if m:
+                        self.nodes[node_id]['PID'] = m.group(1)
+                self.nodes[node_id]['state'] = NodeStatus.STARTED
+            else:
+                failed.append(node_id)
+        if failed:
+            raise ZooException('Could not start Zookeeper nodes {} using commands: {}'.format(failed, run_zookeeper))
 
     @deprecated
     def stop_zookeeper(self):
@@ -183,31 +199,39 @@ class Zookeeper (App):
         self.stop()
 
     def stop(self):
-        for node_id in self.nodes.keys():
-            self.stop_node(node_id)
+        self.stop_nodes(list(self.nodes.keys()))
 
     def stop_node(self, node_id):
+        self.stop_nodes([node_id])
+
+    def stop_nodes(self, node_ids):
         """
-        Stop Zookeeper server nodes
+        Stop Zookeeper server nodes, all hosts at once.
         :return: none
         """
-
-        stop_cmd = "cd {};bin/zkServer.sh stop {}"\
-            .format(self.nodes[node_id]['home'], self.get_config('zoo.cfg', node_id)['path'])
-        stop_zookeeper_cmd = {
-            self.nodes[node_id]['host']: [stop_cmd]
-        }
-        log_print('Stopping Zookeeper on host %s' % self.nodes[node_id]['host'], color='green')
-        out = self.ssh.exec(stop_zookeeper_cmd)
-        self.nodes[node_id]['state'] = NodeStatus.KILLED
+        stop_zookeeper_cmd = {}
+        for node_id in node_ids:
+            stop_cmd = "cd {};bin/zkServer.sh stop {}"\
+                .format(self.nodes[node_id]['home'], self.get_config('zoo.cfg', node_id)['path'])
+            stop_zookeeper_cmd.setdefault(self.nodes[node_id]['host'], []).append(stop_cmd)
+        log_print('Stopping Zookeeper on hosts %s' % ', '.join(sorted(stop_zookeeper_cmd.keys())), color='green')
+        self.ssh.exec(stop_zookeeper_cmd)
+        for node_id in node_ids:
+            self.nodes[node_id]['state'] = NodeStatus.KILLED
 
     def kill_node(self, node_id):
-        log_print('Killing zookeeper node {}'.format(node_id), color='debug')
-        kill_command = {
-            self.nodes[node_id]['host']: ['nohup kill -9 {} > /dev/null 2>&1'.format(self.nodes[node_id]['PID'])]
-        }
+        self.kill_nodes([node_id])
+
+    def kill_nodes(self, node_ids):
+        log_print('Killing zookeeper nodes {}'.format(', '.join([str(node_id) for node_id in node_ids])),
+                  color='debug')
+        kill_command = {}
+        for node_id in node_ids:
+            kill_command.setdefault(self.nodes[node_id]['host'], []).append(
+                'nohup kill -9 {} > /dev/null 2>&1'.format(self.nodes[node_id]['PID']))
         self.ssh.exec(kill_command)
-        self.nodes[node_id]['state'] = NodeStatus.KILLED
+        for node_id in node_ids:
+            self.nodes[node_id]['state'] = NodeStatus.KILLED
 
     def _prepare_zk_configs(self):
         commands = {}
@@ -241,9 +265,10 @@ class Zookeeper (App):
             commands[host] += [
                 'echo -e "{}" > {}/myid'.format(node_id, conf_path)
             ]
+            commands[host] += self._get_write_config_commands(['env.cfg', 'zoo.cfg'], node_id)
 
+        # all nodes configs are rendered above and written by single call
         self.ssh.exec(commands)
-        self._write_config_file(['env.cfg', 'zoo.cfg'])
 
     def reset_zookeeper_config(self, node_id):
         """
@@ -254,8 +279,7 @@ class Zookeeper (App):
         zoo_configs = self.nodes[node_id]['zoo_configs']
 
         if zoo_configs.get('zoo.cfg') and zoo_configs.get('zoo.cfg').get('values'):
-            zoo_configs['zoo.cfg']['values'] = ['initLimit=5', 'syncLimit=2',
-                                                'clientPort={}'.format(self.zk_ports_prefix.format(node_id))]
+            zoo_configs['zoo.cfg']['values'] = self._get_default_zoo_cfg(node_id)
         if zoo_configs.get('env.cfg') and zoo_configs.get('env.cfg').get('values'):
             zoo_configs['env.cfg']['values'] = ['ZOO_LOG4J_PROP=\"DEBUG,CONSOLE,ROLLINGFILE\"']
 
@@ -298,14 +322,19 @@ class Zookeeper (App):
         """
         nodes = self.nodes.keys() if not node_id else [node_id]
 
+        commands = {}
         for node_id in nodes:
-            commands = {self.nodes[node_id]['host']: []}
-            configs = config if isinstance(config, list) else [config]
-            for current_config in configs:
-                zoo_configs = self.nodes[node_id]['zoo_configs'][current_config]
-                commands[self.nodes[node_id]['host']] +=\
-                    ['echo -e "{}" > {}'.format('\n'.join(zoo_configs['values']), zoo_configs['path'])]
-            self.ssh.exec(commands)
+            commands.setdefault(self.nodes[node_id]['host'], []).extend(
+                self._get_write_config_commands(config, node_id))
+        self.ssh.exec(commands)
+
+    def _get_write_config_commands(self, config, node_id):
+        configs = config if isinstance(config, list) else [config]
+        commands = []
+        for current_config in configs:
+            zoo_configs = self.nodes[node_id]['zoo_configs'][current_config]
+            commands.append('echo -e "{}" > {}'.format('\n'.join(zoo_configs['values']), zoo_configs['path']))
+        return commands
 
     def get_config(self, config_name, node_id):
         """
@@ -335,13 +364,97 @@ class Zookeeper (App):
 
     def fill_node_role(self):
         """
-        Get current zookeeper role - leader/follower and refill self.nodes[node]['mode']
+        Get current zookeeper role - leader/follower and refill self.nodes[node]['role']
+        """
+        self.get_ensemble_state()
+
+    def get_ensemble_state(self, node_ids=None):
+        """
+        Poll `srvr` and `mntr` of nodes by single call to all hosts and refill self.nodes[node]['role'].
+        :param node_ids: (optional) nodes to poll, default all nodes
+        :return: {node_id: {'role': <leader/follower/observer/standalone or None when not serving>,
+                            'zxid': <last zxid>, <mntr key>: <mntr value>, ...}}
+        """
+        node_ids = list(self.nodes.keys()) if node_ids is None else node_ids
+        commands = {}
+        for node_id in node_ids:
+            commands.setdefault(self.nodes[node_id]['host'], []).append(
+                "echo 'ZK_NODE {node_id}'; "
+                "(echo srvr | nc localhost {port}; echo mntr | nc localhost {port}) 2>/dev/null; true".format(
+                    node_id=node_id, port=self.nodes[node_id]['client_port']))
+        # commands of a host are joined to make one round trip per host
+        result = self.ssh.exec({host: ['; '.join(host_commands)] for host, host_commands in commands.items()})
+        states = self.parse_ensemble_state(result)
+        for node_id in node_ids:
+            self.nodes[node_id]['role'] = states.get(node_id, {}).get('role')
+        return states
+
+    def has_quorum(self, states):
+        """
+        :param states: nodes state, see `get_ensemble_state`
+        :return: True if ensemble has leader and majority of voting nodes are serving
+        """
+        roles = [state.get('role') for state in states.values()]
+        if len(self.nodes) == 1:
+            return roles == ['standalone'] or roles == ['leader']
+        return roles.count('leader') == 1 and \
+            roles.count('leader') + roles.count('follower') >= len(self.nodes) // 2 + 1
+
+    def wait_for_quorum(self, timeout=None, node_ids=None):
+        """
+        Wait until ensemble elects leader and nodes given (all started nodes by default) are serving.
+        :return: nodes state, see `get_ensemble_state`
         """
-        for node in self.nodes.keys():
-            get_mode_command = "echo stat | nc localhost {} | grep Mode | sed 's/Mode: //g'".format(
-                self.nodes[node]['client_port'])
-            out = self.ssh.exec_on_host(self.nodes[node]['host'], [get_mode_command])
-            self.nodes[node]['role'] = ''.join(out[self.nodes[node]['host']]).split('\n')[0]
+        timeout = self.quorum_timeout if timeout is None else timeout
+        if node_ids is None:
+            node_ids = [node_id for node_id, node in self.nodes.items() if node.get('state') == NodeStatus.STARTED]
+        end_time = time() + timeout
+        while True:
+            states = self.get_ensemble_state()
+            if self.has_quorum(states) and all([states.get(node_id, {}).get('role') for node_id in node_ids]):
+                log_print('Zookeeper quorum is ready: {}'.format(
+                    ', '.join(['{}={}'.format(node_id, state.get('role')) for node_id, state in sorted(states.items())])
+                ), color='debug')
+                return states
+            if time() > end_time:
+                raise ZooException('Zookeeper quorum is not ready in {} sec: {}'.format(timeout, states))
+            sleep(0.5)
+
+    @staticmethod
+    def parse_nodes_output(result):
+        """
+        Split output of per-node commands by 'ZK_NODE <id>' lines.
+        :param result: ssh exec result
+        :return: {node_id: [output lines]}
+        """
+        nodes = {}
+        for outputs in result.values():
+            node = None
+            for line in '\n'.join(outputs).split('\n'):
+                line = line.strip()
+                if line.startswith('ZK_NODE '):
+                    node = nodes.setdefault(int(line.split()[1]), [])
+                elif node is not None and line:
+                    node.append(line)
+        return nodes
+
+    @staticmethod
+    def parse_ensemble_state(result):
+        """
+        Parse output of `srvr` and `mntr` commands, see `get_ensemble_state`.
+        """
+        states = {}
+        for node_id, lines in Zookeeper.parse_nodes_output(result).items():
+            state = states.setdefault(node_id, {'role': None})
+            for line in lines:
+                if line.startswith('Mode:'):
+                    state['role'] = line[len('Mode:'):].strip()
+                elif line.startswith('Zxid:'):
+                    state['zxid'] = line[len('Zxid:'):].strip()
+                elif line.startswith('zk_'):
+                    key, value = line.split(None, 1) if len(line.split(None, 1)) == 2 else (line, '')
+                    state[key] = int(value) if value.isdigit() else value
+        return states
 
     def get_zookeeper_specific_role(self, role='leader'):
         """
@@ -373,6 +486,10 @@ class Zookeeper (App):
                               color='red')
             break
 
+    def _get_default_zoo_cfg(self, node_id):
+        return ['initLimit=5', 'syncLimit=2', 'clientPort={}'.format(self.zk_ports_prefix.format(node_id)),
+                '4lw.commands.whitelist={}'.format(self.four_letter_words)]
+
     def _get_servers_cfg(self):
         fmt_str = 'server.{idx}={host}:288{idx}:388{idx}'
         return '\n'.join(
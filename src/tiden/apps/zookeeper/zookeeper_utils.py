@@ -18,7 +18,7 @@ from threading import Thread
 # from random import choices
 
 from ...util import log_print, util_sleep
-from .zookeeper import Zookeeper
+from .zookeeper import Zookeeper, ZooException
 
 
 class ZkNodesRestart(Thread):
@@ -45,6 +45,11 @@ class ZkNodesRestart(Thread):
                 util_sleep(self.restart_timeout)
                 log_print('Starting ZK node {}'.format(node_id), color='debug')
                 self.zk.start_node(node_id)
+                # next node is killed only when restarted one has rejoined ensemble
+                try:
+                    self.zk.wait_for_quorum(node_ids=[node_id])
+                except ZooException as e:
+                    log_print(str(e), color='red')
 
     def set_params(self, **kwargs):
         self.order = kwargs.get('order', self.order)
@@ -17,9 +17,6 @@
 from ..apps.appscontainer import AppsContainer
 from ..apps.app import App
 from ..tidenexception import TidenException
-from ..util import unix_path
-from os.path import isfile
-from glob import glob
 from ..tidenfabric import TidenFabric
 from copy import deepcopy
 from ..sshpool import AbstractSshPool
@@ -53,12 +50,8 @@ class AppTestCase:
         self.upload_resources()
 
     def upload_resources(self):
-        files = []
-        resources_dir = self.tiden.config['rt']['test_resource_dir']
-        for file in glob(f"{resources_dir}/*"):
-            if isfile(file):
-                files.append(unix_path(file))
-        self.tiden.ssh.upload(files, self.tiden.config['rt']['remote']['test_module_dir'])
+        self.tiden.ssh.deploy_resources(self.tiden.config['rt']['test_resource_dir'],
+                                        self.tiden.config['rt']['remote']['test_module_dir'])
 
     def util_exec_on_all_hosts(self, ignite, commands_to_exec):
         commands = {}
@@ -88,12 +88,8 @@ class GeneralTestCase:
         pass
 
     def deploy(self):
-        # Upload resources
-        files = []
-        for file in glob("%s/*" % self.config['rt']['test_resource_dir']):
-            if path.isfile(file):
-                files.append(unix_path(file))
-        self.ssh.upload(files, self.config['rt']['remote']['test_module_dir'])
+        # Upload new and changed resources
+        self.ssh.deploy_resources(self.config['rt']['test_resource_dir'], self.config['rt']['remote']['test_module_dir'])
 
     def get_suite_dir(self):
         return self.config['suite_dir']
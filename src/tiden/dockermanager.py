@@ -14,9 +14,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from os.path import basename
+import gzip
+import tarfile
+from json import loads as json_loads
+from os import makedirs
+from os.path import basename, dirname, exists, getmtime, join
 from pprint import PrettyPrinter
 from re import match
+from shutil import copyfileobj
 from uuid import uuid4
 
 from .tidenexception import *
@@ -29,6 +34,9 @@ class DockerManager:
     Common actions with docker
     """
 
+    # networks docker creates by itself
+    builtin_networks = ('bridge', 'host', 'none', 'ingress', 'docker_gwbridge')
+
     def __init__(self, config, ssh):
         self.ssh: SshPool = ssh
         self.config = config
@@ -127,6 +135,7 @@ class DockerManager:
         """
         hosts = self.get_containers_info()
         removed_containers = []
+        remove_ids = {}
         for _host, containers in hosts.items():
             if host is not None and _host != host:
                 continue
@@ -138,12 +147,135 @@ class DockerManager:
                 elif image_name is not None and image_name != container['image']:
                     continue
                 log_print("Remove container '{}' on host {}".format(container['name'], _host))
-                self.ssh.exec_on_host(_host, ['docker rm -f {}'.format(container['id'])])
+                remove_ids.setdefault(_host, []).append(container['id'])
                 if _host in self.running_containers and container['name'] in self.running_containers[_host]:
                     del self.running_containers[_host][container['name']]
                 removed_containers.append(container)
+        # single command per host, all hosts at once
+        if remove_ids:
+            self.ssh.exec({_host: ['docker rm -f {}'.format(' '.join(ids))] for _host, ids in remove_ids.items()})
         return removed_containers
 
+    def get_inventory(self, hosts=None):
+        """
+        Collect containers, networks and volumes of all hosts by single call to all hosts
+
+        :param hosts:   (optional) hosts to collect, default all hosts
+        :return:        {host: {
+                            'containers': [{'id', 'image', 'status', 'name', 'running'}, ...],
+                            'networks': [{'id', 'name', 'driver'}, ...],
+                            'volumes': [{'name', 'driver'}, ...],
+                        }}
+        """
+        hosts = self.ssh.hosts if hosts is None else hosts
+        inventory_cmd = "echo '#containers'; " \
+                        "docker ps -a --no-trunc --format '{{.ID}}|{{.Image}}|{{.Status}}|{{.Names}}'; " \
+                        "echo '#networks'; " \
+                        "docker network ls --no-trunc --format '{{.ID}}|{{.Name}}|{{.Driver}}'; " \
+                        "echo '#volumes'; " \
+                        "docker volume ls --format '{{.Name}}|{{.Driver}}'; true"
+        res = self.ssh.exec({host: [inventory_cmd] for host in hosts})
+        fields = {
+            'containers': ('id', 'image', 'status', 'name'),
+            'networks': ('id', 'name', 'driver'),
+            'volumes': ('name', 'driver'),
+        }
+        inventory = {}
+        for host, out in res.items():
+            host_inventory = inventory.setdefault(host, {kind: [] for kind in fields.keys()})
+            kind = None
+            for line in ''.join(out).split('\n'):
+                line = line.strip()
+                if line.startswith('#') and line[1:] in fields:
+                    kind = line[1:]
+                    continue
+                if kind is None or line.count('|') != len(fields[kind]) - 1:
+                    continue
+                item = dict(zip(fields[kind], [value.strip() for value in line.split('|')]))
+                if kind == 'containers':
+                    item['running'] = item['status'].startswith('Up')
+                host_inventory[kind].append(item)
+        return inventory
+
+    def get_leftovers(self, inventory, keep=None):
+        """
+        Diff inventory against desired state of the run: containers started by this manager, builtin networks
+        and items matching keep patterns are kept, everything else is leftover
+
+        :param inventory:   see `get_inventory`
+        :param keep:        (optional) {'containers': [name regex, ...], 'networks': [...], 'volumes': [...]}
+        :return:            {host: {'containers': [...], 'networks': [...], 'volumes': [...]}} only for hosts with
+                            leftovers
+        """
+        keep = keep or {}
+        leftovers = {}
+        for host, host_inventory in inventory.items():
+            desired = {
+                'containers': set(self.running_containers.get(host, {}).keys()),
+                'networks': set(self.builtin_networks),
+                'volumes': set(),
+            }
+            host_leftovers = {}
+            for kind, items in host_inventory.items():
+                kind_leftovers = [
+                    item for item in items
+                    if item['name'] not in desired.get(kind, set())
+                    and not [pattern for pattern in keep.get(kind, []) if match(pattern, item['name'])]
+                ]
+                if kind_leftovers:
+                    host_leftovers[kind] = kind_leftovers
+            if host_leftovers:
+                leftovers[host] = host_leftovers
+        return leftovers
+
+    def remove_leftovers(self, leftovers):
+        """
+        Remove leftovers with single command per host, all hosts at once.
+        Containers go first, so that networks and volumes they use can be removed after them.
+        Networks and volumes still used by kept containers are skipped by docker.
+        """
+        commands = {}
+        for host, host_leftovers in leftovers.items():
+            host_commands = []
+            if host_leftovers.get('containers'):
+                host_commands.append('docker rm -f -v {}'.format(
+                    ' '.join([item['id'] for item in host_leftovers['containers']])))
+            if host_leftovers.get('networks'):
+                host_commands.append('docker network rm {}'.format(
+                    ' '.join([item['id'] for item in host_leftovers['networks']])))
+            if host_leftovers.get('volumes'):
+                host_commands.append('docker volume rm {}'.format(
+                    ' '.join([item['name'] for item in host_leftovers['volumes']])))
+            if host_commands:
+                # docker refuses to remove items in use, that must not stop removal of others
+                commands[host] = ['; '.join(host_commands) + '; true']
+        if commands:
+            self.ssh.exec(commands)
+
+    def reconcile(self, keep=None, kinds=('containers',), dry_run=False):
+        """
+        Bring hosts to desired state of the run: collect inventory, find leftovers and remove them
+
+        :param keep:        see `get_leftovers`
+        :param kinds:       kinds of items to remove, networks and volumes are removed only when listed explicitly
+        :param dry_run:     only find leftovers
+        :return:            leftovers found, see `get_leftovers`
+        """
+        leftovers = self.get_leftovers(self.get_inventory(), keep=keep)
+        leftovers = {
+            host: {kind: items for kind, items in host_leftovers.items() if kind in kinds}
+            for host, host_leftovers in leftovers.items()
+        }
+        leftovers = {host: host_leftovers for host, host_leftovers in leftovers.items() if host_leftovers}
+        if leftovers and not dry_run:
+            log_print('Remove docker leftovers: {}'.format(', '.join([
+                '{} ({})'.format(host, ', '.join(
+                    ['{} {}'.format(len(items), kind) for kind, items in sorted(host_leftovers.items())]))
+                for host, host_leftovers in sorted(leftovers.items())
+            ])))
+            self.remove_leftovers(leftovers)
+        return leftovers
+
     def get_pulled_images(self):
         """
         Get information about all pulled images for all hosts
@@ -167,6 +299,102 @@ class DockerManager:
                     pulled_images[host] = pulled_images.get(host, []) + [info]
         return pulled_images
 
+    def get_image_ids(self, hosts=None):
+        """
+        Get full IDs of images present on hosts by single call to all hosts
+
+        :param hosts:   (optional) hosts to check, default all hosts
+        :return:        {host: set(image ID, ...)}
+        """
+        hosts = self.ssh.hosts if hosts is None else hosts
+        res = self.ssh.exec({host: ['docker images -q --no-trunc'] for host in hosts})
+        image_ids = {host: set() for host in hosts}
+        for host, out in res.items():
+            for line in ''.join(out).split('\n'):
+                if line.strip().startswith('sha256:'):
+                    image_ids.setdefault(host, set()).add(line.strip())
+        return image_ids
+
+    @staticmethod
+    def get_image_dump_id(dump_path):
+        """
+        Read image ID from `docker save` archive (plain or gzipped) manifest
+
+        :param dump_path:   local path of image archive
+        :return:            image ID or None if archive has no manifest
+        """
+        with tarfile.open(dump_path, 'r:*') as tar:
+            for member in tar:
+                if member.name.lstrip('./') != 'manifest.json':
+                    continue
+                manifest = json_loads(tar.extractfile(member).read().decode('utf-8'))
+                if not manifest:
+                    return None
+                # legacy format has '<id>.json', OCI layout has 'blobs/sha256/<id>'
+                config_name = basename(manifest[0]['Config'])
+                if config_name.endswith('.json'):
+                    config_name = config_name[:-len('.json')]
+                return 'sha256:{}'.format(config_name)
+        return None
+
+    @staticmethod
+    def get_compressed_dump(dump_path):
+        """
+        Gzip image archive next to it once, later calls reuse compressed file while it is up to date
+
+        :return:    compressed archive path
+        """
+        if dump_path.endswith('.gz') or dump_path.endswith('.tgz'):
+            return dump_path
+        compressed_path = '{}.gz'.format(dump_path)
+        if not exists(compressed_path) or getmtime(compressed_path) < getmtime(dump_path):
+            # image layers are compressed already mostly, so fastest level gives almost the same size
+            with open(dump_path, 'rb') as src, gzip.open(compressed_path, 'wb', compresslevel=1) as dst:
+                copyfileobj(src, dst, 1024 * 1024)
+        return compressed_path
+
+    def distribute_image(self, dump_path, image_id=None, hosts=None):
+        """
+        Load image from local archive on hosts which have no such image yet.
+        Archive is compressed once and uploaded to all hosts missing the image in parallel.
+
+        :param dump_path:   local path of `docker save` archive
+        :param image_id:    (optional) image ID, read from archive if not set
+        :param hosts:       (optional) target hosts, default all hosts
+        :return:            list of hosts where image was loaded
+        """
+        hosts = self.ssh.hosts if hosts is None else hosts
+        if image_id is None:
+            image_id = self.get_image_dump_id(dump_path)
+        present = self.get_image_ids(hosts) if image_id else {}
+        missing_hosts = [host for host in hosts if image_id is None or image_id not in present.get(host, set())]
+        if not missing_hosts:
+            log_print('Image {} is present on all hosts'.format(basename(dump_path)), color='debug')
+            return []
+
+        compressed_path = self.get_compressed_dump(dump_path)
+        remote_dir = self.config.get('remote', {}).get('artifacts_dir', self.config['rt']['remote']['test_dir'])
+        remote_path = '{}/{}'.format(remote_dir, basename(compressed_path))
+        log_print('Distribute image {} to {}'.format(basename(dump_path), ', '.join(missing_hosts)))
+        self.ssh.upload_for_hosts(missing_hosts, [compressed_path], remote_dir)
+        self.ssh.exec({
+            host: ['gunzip -c {path} | docker image load; rm -f {path}'.format(path=remote_path)]
+            for host in missing_hosts
+        })
+        return missing_hosts
+
+    def save_image(self, host, image_name, local_path):
+        """
+        Save image from host to local gzipped archive streamed over SSH
+
+        :return:    local archive path
+        """
+        makedirs(dirname(local_path) or '.', exist_ok=True)
+        written = self.ssh.exec_to_files({host: ('docker save {} | gzip -1'.format(image_name), local_path)})
+        if not written.get(host):
+            raise TidenException("Can't save image {} on host {}".format(image_name, host))
+        return local_path
+
     def remove_images(self, host=None, name=None, name_pattern=None):
         """
         Remove containers from host
@@ -217,11 +445,34 @@ class DockerManager:
             return image_name
 
     def build_image(self, host, path, **kwargs):
+        """
+        Build image on host
+
+        :param host:    host to build image on
+        :param path:    build context path on host
+        :param kwargs:  tag - image tag
+                        hosts - other hosts to distribute built image to, image is saved once
+                                and loaded only on hosts which have no such image
+        """
         cmd = f'docker build {path}'
         if 'tag' in kwargs:
             cmd += f" -t {kwargs['tag']}"
         self.ssh.exec_on_host(host, [cmd])
 
+        other_hosts = [other_host for other_host in kwargs.get('hosts', []) if other_host != host]
+        if other_hosts and 'tag' in kwargs:
+            image_id = self.get_image_id(host, kwargs['tag'])
+            present = self.get_image_ids(other_hosts)
+            if [other_host for other_host in other_hosts if image_id not in present.get(other_host, set())]:
+                local_path = join(self.config['tmp_dir'], '{}.tar.gz'.format(sub('/|:', '-', kwargs['tag'])))
+                self.save_image(host, kwargs['tag'], local_path)
+                self.distribute_image(local_path, image_id=image_id, hosts=other_hosts)
+
+    def get_image_id(self, host, image_name):
+        output = self.ssh.exec_on_host(host, ["docker image inspect -f '{{{{.Id}}}}' {}".format(image_name)])[host]
+        image_id = ''.join(output).strip()
+        return image_id if image_id.startswith('sha256:') else None
+
     def restart_container(self, host, container):
         cmd = f'docker restart {container}'
         self.ssh.exec_on_host(host, [cmd])
@@ -240,19 +491,27 @@ class DockerManager:
         :return:            True - condition was correct
                             False - can't wait for condition execute
         """
-        cmd = "grep '{}' {}".format(grep_text, log_file)
+        # host waits for new matching line itself, so every check is one blocking call instead of
+        # a round trip per interval
+        wait_cmd = "timeout {timeout} sh -c 'while [ $(cat {log} 2>/dev/null | grep -c -e \"{text}\") -le {seen} ]; " \
+                   "do sleep 0.2; done'; cat {log} 2>/dev/null | grep -c -e '{text}'; grep -e '{text}' {log}; true"
+        seen = -1
         end_time = time() + timeout
         while True:
-            output = self.ssh.exec_on_host(host, [cmd])[host]
-            last_line = output[-1:][0] if output else ""
-            if compare(last_line):
+            remaining = max(1, int(end_time - time()))
+            output = self.ssh.exec_on_host(host, [wait_cmd.format(
+                timeout=remaining, text=grep_text, log=log_file, seen=seen)])[host]
+            count, _, found = ''.join(output).partition('\n')
+            if count.strip().isdigit():
+                seen = int(count.strip())
+            if compare(found):
                 return True
             if time() > end_time:
                 if strict:
                     raise AssertionError("Can't wait '{}' on {} in '{}' log".format(grep_text, host, log_file))
                 else:
                     return False
-            sleep(interval)
+            sleep(min(interval, 0.2))
 
     def load_images(self, artifacts_filter=None):
         """
@@ -261,19 +520,47 @@ class DockerManager:
         :param artifacts_filter     str regex to filter artifacts for load
         """
         log_print("Unpack images")
-        load_cmd = "docker image load -i {}"
-        packed_image_paths = []
+        artifacts = {}
         for name, artifact in self.config["artifacts"].items():
             if artifacts_filter is not None:
                 if not search(artifacts_filter, name):
                     continue
             if artifact.get("type") != "image_dump":
                 continue
-            packed_image_paths.append(artifact["remote_path"])
-        if not packed_image_paths:
+            artifacts[name] = artifact
+        if not artifacts:
             return
-        commands = [load_cmd.format(path) for path in packed_image_paths]
-        self.ssh.exec(commands)
+
+        image_ids = {}
+        for name, artifact in artifacts.items():
+            if artifact.get('path') and exists(artifact['path']):
+                image_ids[name] = self.get_image_dump_id(artifact['path'])
+        present = self.get_image_ids()
+
+        # load images missing on host from its artifact copy, all hosts at once
+        load_cmd = "if [ -f {path} ]; then docker image load -i {path}; else echo 'IMAGE_DUMP_MISSING {name}'; fi"
+        commands = {}
+        for host in self.ssh.hosts:
+            for name, artifact in artifacts.items():
+                if image_ids.get(name) and image_ids[name] in present.get(host, set()):
+                    continue
+                commands.setdefault(host, []).append(load_cmd.format(path=artifact['remote_path'], name=name))
+        if not commands:
+            log_print("All images are present on hosts", color='debug')
+            return
+        res = self.ssh.exec(commands)
+
+        # hosts without artifact copy get image streamed from local archive
+        missing = {}
+        for host, out in res.items():
+            for line in ''.join(out).split('\n'):
+                if line.startswith('IMAGE_DUMP_MISSING '):
+                    missing.setdefault(line.split()[1], []).append(host)
+        for name, hosts in missing.items():
+            if artifacts[name].get('path') and exists(artifacts[name]['path']):
+                self.distribute_image(artifacts[name]['path'], image_id=image_ids.get(name), hosts=hosts)
+            else:
+                log_print("Can't find image dump {} for hosts {}".format(name, ', '.join(hosts)), color='red')
 
     def run(self, image_name, host, **kwargs):
         """
@@ -316,6 +603,73 @@ class DockerManager:
 
         return image_id, log_file, kwargs["kw_params"]["name"]
 
+    def run_containers(self, containers):
+        """
+        Run several containers by single call per host, all hosts at once
+
+        :param containers:  list of (image name, host, kwargs), see `run`
+        :return:            list of tuple(Container ID, log file path, container name) in the same order
+        """
+        commands = {}
+        names = []
+        for image_name, host, kwargs in containers:
+            image, params, kw_params, commands_str, container_name = self.get_params(image_name, kwargs)
+            log_file = kwargs.get('log_file', "{}/{}.log".format(self.config["rt"]["remote"]["test_dir"],
+                                                                 container_name))
+            # container ID goes to output, only container output logging (as in `run`) is left in background
+            commands.setdefault(host, []).append(
+                "container_id=$(docker run -d {params} {kw_params} {image} {commands}); "
+                "echo \"CONTAINER {name} $container_id\"; "
+                "if [ -n \"$container_id\" ]; then "
+                "cd {log_dir}; nohup docker logs -f $container_id > {log} 2>&1 < /dev/null & "
+                "fi".format(
+                    params=params, kw_params=kw_params, image=image, commands=commands_str, name=container_name,
+                    log_dir=self.config["rt"]["remote"]["test_dir"], log=log_file))
+            names.append((host, container_name, log_file))
+
+        log_print("Running containers {}".format(', '.join([name for _, name, _ in names])))
+        res = self.ssh.exec({host: ['; '.join(host_commands)] for host, host_commands in commands.items()})
+        container_ids = {}
+        for host, out in res.items():
+            for line in ''.join(out).split('\n'):
+                if line.startswith('CONTAINER '):
+                    fields = line.split()
+                    if len(fields) == 3:
+                        container_ids[(host, fields[1])] = fields[2]
+
+        started = []
+        for host, container_name, log_file in names:
+            container_id = container_ids.get((host, container_name), '')
+            assert len(container_id) > 30, "Can't run container {} on host {}".format(container_name, host)
+            started.append((container_id, log_file, container_name))
+        return started
+
+    def wait_for_containers(self, containers, state='running', timeout=60):
+        """
+        Wait for containers state, each host waits for its containers itself and all hosts are waited at once
+
+        :param containers:  {host: [container ID or name, ...]}
+        :param state:       'running' or 'healthy' (container with health check passed)
+        :param timeout:     timeout for wait
+        :return:            {host: [containers not reached state]}
+        """
+        inspect_format = '{{.State.Health.Status}}' if state == 'healthy' else '{{.State.Status}}'
+        wait_cmd = "timeout {timeout} sh -c 'until [ \"$(docker inspect -f \"{fmt}\" {container} 2>/dev/null)\" " \
+                   "= \"{state}\" ]; do sleep 0.2; done' || echo 'CONTAINER_NOT_READY {container}'"
+        commands = {}
+        for host, host_containers in containers.items():
+            commands[host] = ['; '.join([
+                wait_cmd.format(timeout=timeout, fmt=inspect_format, container=container, state=state)
+                for container in host_containers
+            ]) + '; true']
+        res = self.ssh.exec(commands)
+        not_ready = {}
+        for host, out in res.items():
+            for line in ''.join(out).split('\n'):
+                if line.startswith('CONTAINER_NOT_READY '):
+                    not_ready.setdefault(host, []).append(line.split()[1])
+        return not_ready
+
     def log_container_output(self, host, image_id, log_file):
         logs_dir = self.config["rt"]["remote"]["test_dir"]
         # log_file = "{}/{}".format(logs_dir, log_file)
@@ -78,24 +78,27 @@ class FileSystemErrorMaker:
         self.operation_with_remote_files(host, 'chmod -R 0444', remote_path)
 
     def operation_with_remote_files(self, host, op, remote_path):
-        commands = dict()
         self.logger.debug("Making operation: %s on file: %s ... " % (op, remote_path))
 
-        if isinstance(remote_path, list):
-            remote_files = list(remote_path)
-        else:
-            remote_files = [str(remote_path)]
-
-        for r_file in remote_files:
-            if commands.get(host):
-                commands[host].append('%s %s' % (op, r_file))
-            else:
-                commands = {host: ['%s %s' % (op, r_file)]}
+        commands = {host: self.get_operation_commands(op, remote_path)}
 
         self.logger.debug(commands)
         results = self.ssh.exec(commands)
         self.logger.debug(results)
 
+    @staticmethod
+    def get_operation_commands(op, remote_path):
+        """
+        :param op: operation command, e.g. 'rm' or 'chmod -R 0444'
+        :param remote_path: remote file or list of files
+        :return: list of commands applying operation to every file
+        """
+        if isinstance(remote_path, list):
+            remote_files = list(remote_path)
+        else:
+            remote_files = [str(remote_path)]
+        return ['%s %s' % (op, r_file) for r_file in remote_files]
+
 
 class IOErrorMaker:
     ignite = None
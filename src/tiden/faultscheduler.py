@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from os import makedirs, path
+from shlex import quote
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import sleep, time
+from uuid import uuid4
+
+from .error_maker import FileSystemErrorMaker
+from .stress import StressT
+from .tidenexception import TidenException
+from .util import log_print, pkill_pattern
+
+# helpers of remote scheduler script, POSIX shell with GNU date and sleep
+SCHEDULER_FUNCTIONS = '''now_ms() { date +%s%3N; }
+event() { echo "$(now_ms) $*" >> "$EVENTS"; }
+sleep_until() {
+    d=$(( $1 - $(now_ms) ))
+    if [ $d -gt 0 ]; then sleep $(( d / 1000 )).$(printf '%03d' $(( d % 1000 ))); fi
+}
+log_count() { cat "$1" 2>/dev/null | grep -c -e "$2"; }
+wait_log() {
+    end=$(( $(now_ms) + $4 ))
+    while [ $(log_count "$1" "$2") -le $3 ]; do
+        if [ $(now_ms) -ge $end ]; then return 1; fi
+        sleep 0.05
+    done
+}
+'''
+
+
+class Fault:
+    """
+    Single fault of the timeline.
+
+    Fault is injected at `at` seconds after scheduler start or, when `on_log` is set, as soon as new line
+    matching pattern appears in log after `at` seconds (plus optional `delay`). Fault with `duration` is rolled back
+    `duration` seconds after injection, fault without `duration` is kept until `FaultScheduler.stop`.
+    """
+
+    def __init__(self, fault_id, host, inject, rollback=None, at=0, duration=None, on_log=None, log_timeout=60,
+                 on_timeout='skip', delay=0, name=None):
+        """
+        :param fault_id: fault index in scheduler
+        :param host: host to inject fault on
+        :param inject: shell command to inject fault
+        :param rollback: (optional) shell command to roll fault back
+        :param at: seconds since scheduler start to inject fault or to start waiting for log trigger
+        :param duration: (optional) seconds to keep fault before rollback
+        :param on_log: (optional) tuple(log file, grep pattern) to trigger fault
+        :param log_timeout: seconds to wait for log trigger
+        :param on_timeout: 'skip' or 'inject' fault when log trigger is not found
+        :param delay: seconds to wait after log trigger
+        :param name: fault name for reports
+        """
+        if on_timeout not in ('skip', 'inject'):
+            raise TidenException("Unknown on_timeout action '%s' for fault %s" % (on_timeout, name or fault_id))
+        self.fault_id = fault_id
+        self.host = host
+        self.inject = inject
+        self.rollback = rollback
+        self.at = at
+        self.duration = duration
+        self.on_log = on_log
+        self.log_timeout = log_timeout
+        self.on_timeout = on_timeout
+        self.delay = delay
+        self.name = name or 'fault_%s' % fault_id
+
+    def get_script(self):
+        """
+        :return: shell script lines executing fault in background subshell
+        """
+        lines = ['(', '    sleep_until $(( T0 + %d ))' % int(self.at * 1000)]
+        if self.on_log:
+            log_file, pattern = self.on_log
+            lines += [
+                '    if wait_log %s %s $BASE_%s %d; then' % (
+                    quote(log_file), quote(pattern), self.fault_id, int(self.log_timeout * 1000)),
+                '        event %s triggered' % self.fault_id,
+                '    else',
+                '        event %s trigger_timeout' % self.fault_id,
+            ]
+            if self.on_timeout == 'skip':
+                lines.append('        exit 0')
+            lines.append('    fi')
+        if self.delay:
+            lines.append('    sleep_until $(( $(now_ms) + %d ))' % int(self.delay * 1000))
+        lines += [
+            '    started=$(now_ms)',
+            '    echo "$started %s inject" >> "$EVENTS"' % self.fault_id,
+            '    ( %s ) >> fault-%s.log 2>&1' % (self.inject, self.fault_id),
+            '    event %s injected $?' % self.fault_id,
+        ]
+        if self.rollback and self.duration is not None:
+            lines += [
+                '    sleep_until $(( started + %d ))' % int(self.duration * 1000),
+                '    event %s rollback' % self.fault_id,
+                '    ( %s ) >> fault-%s.log 2>&1' % (self.rollback, self.fault_id),
+                '    event %s rolled_back $?' % self.fault_id,
+            ]
+        lines.append(') &')
+        return lines
+
+
+class FaultScheduler:
+    """
+    Executes declared timeline of faults on hosts.
+
+    Timeline of every host is compiled to shell script run by single scheduler process on the host, so faults are
+    injected with millisecond precision and without SSH round trips between them. All hosts share the same start time
+    (hosts clocks are expected to be synchronized), injection and rollback times are recorded by hosts to correlate
+    them with node logs.
+
+    Example:
+        scheduler = FaultScheduler(ssh, remote_dir)
+        scheduler.fio(host, ignite_home, at=0, duration=120)
+        scheduler.kill(host, pid, on_log=(node_log, 'Checkpoint started'), log_timeout=120, on_timeout='inject')
+        scheduler.run()
+        scheduler.get_report()
+    """
+
+    # seconds between start command and timeline start, enough to start schedulers on all hosts
+    start_lead = 2
+
+    # scheduler methods allowed in declarative timeline
+    fault_types = ('add', 'sigstop', 'kill', 'netem', 'fio', 'cpu', 'file_operation')
+
+    poll_interval = 0.5
+
+    def __init__(self, ssh, remote_dir):
+        self.ssh = ssh
+        self.remote_dir = remote_dir
+        self.stress = StressT(ssh)
+        self.faults = []
+        self.scheduler_id = uuid4().hex[:8]
+        self.script_name = 'faults-%s.sh' % self.scheduler_id
+        self.events_name = 'faults-%s.events' % self.scheduler_id
+        self.start_time = None
+        self.events = []
+
+    @classmethod
+    def from_timeline(cls, ssh, remote_dir, timeline):
+        """
+        Create scheduler from declarative timeline.
+        :param timeline: list of dicts, 'fault' key is scheduler method name, e.g.:
+            [
+                {'fault': 'sigstop', 'host': '172.25.1.11', 'pid': 1234, 'at': 5, 'duration': 10},
+                {'fault': 'netem', 'host': '172.25.1.12', 'dest_host': '172.25.1.11', 'at': 20, 'duration': 30},
+            ]
+        """
+        scheduler = cls(ssh, remote_dir)
+        for fault in timeline:
+            fault = dict(fault)
+            fault_type = fault.pop('fault')
+            if fault_type not in cls.fault_types:
+                raise TidenException("Unknown fault '%s'" % fault_type)
+            getattr(scheduler, fault_type)(**fault)
+        return scheduler
+
+    def add(self, host, inject, rollback=None, **kwargs):
+        """
+        Add fault with arbitrary inject/rollback commands, see `Fault` for trigger arguments.
+        :return: fault
+        """
+        fault = Fault(len(self.faults) + 1, host, inject, rollback=rollback, **kwargs)
+        self.faults.append(fault)
+        return fault
+
+    def sigstop(self, host, pid, **kwargs):
+        return self.add(host, 'kill -STOP %s' % pid, 'kill -CONT %s' % pid, name=kwargs.pop('name', 'sigstop'),
+                        **kwargs)
+
+    def kill(self, host, pid, **kwargs):
+        return self.add(host, 'kill -9 %s' % pid, name=kwargs.pop('name', 'kill'), **kwargs)
+
+    def netem(self, host, dest_host, type='loss', rate='100.0%', dev=None, **kwargs):
+        return self.add(host,
+                        ' && '.join(self.stress.get_netem_commands(dest_host, type, rate, dev=dev)),
+                        self.stress.get_netem_rollback_command(dev=dev),
+                        name=kwargs.pop('name', 'netem %s %s' % (type, rate)), **kwargs)
+
+    def fio(self, host, path, duration, **kwargs):
+        return self.add(host, self.stress.get_fio_command(int(duration), path),
+                        "pkill -f '%s'; %s" % (pkill_pattern('fio --name=test'),
+                                               self.stress.get_fio_rm_file_command(path)),
+                        duration=duration, name=kwargs.pop('name', 'fio'), **kwargs)
+
+    def cpu(self, host, duration, cpu=None, **kwargs):
+        return self.add(host, self.stress.get_stress_cpu_command(int(duration), cpu or '$(nproc)'),
+                        name=kwargs.pop('name', 'cpu'), **kwargs)
+
+    def file_operation(self, host, op, remote_path, rollback_op=None, **kwargs):
+        """
+        Apply `FileSystemErrorMaker` operation (e.g. 'chmod -R 0444') to remote files.
+        """
+        rollback = None
+        if rollback_op:
+            rollback = '; '.join(FileSystemErrorMaker.get_operation_commands(rollback_op, remote_path))
+        return self.add(host, '; '.join(FileSystemErrorMaker.get_operation_commands(op, remote_path)), rollback,
+                        name=kwargs.pop('name', op), **kwargs)
+
+    def get_hosts(self):
+        return sorted(set([fault.host for fault in self.faults]))
+
+    def get_script(self, host, start_time_ms):
+        """
+        :return: scheduler script of host
+        """
+        faults = [fault for fault in self.faults if fault.host == host]
+        lines = [
+            '#!/bin/sh',
+            'cd "$(dirname "$0")"',
+            'EVENTS=%s' % self.events_name,
+            SCHEDULER_FUNCTIONS,
+            'T0=%d' % start_time_ms,
+        ]
+        # log triggers wait for lines appeared after scheduler start
+        for fault in faults:
+            if fault.on_log:
+                lines.append('BASE_%s=$(log_count %s %s)' % (
+                    fault.fault_id, quote(fault.on_log[0]), quote(fault.on_log[1])))
+        lines.append('event 0 started')
+        for fault in faults:
+            lines += fault.get_script()
+        lines += ['wait', 'event 0 finished', '']
+        return '\n'.join(lines)
+
+    def start(self):
+        """
+        Upload schedulers to hosts and start them with common start time.
+        """
+        self.events = []
+        self.start_time = time() + self.start_lead
+        local_dir = mkdtemp()
+        try:
+            for host in self.get_hosts():
+                makedirs(path.join(local_dir, host))
+                local_file = path.join(local_dir, host, self.script_name)
+                with open(local_file, 'w') as w:
+                    w.write(self.get_script(host, int(self.start_time * 1000)))
+                self.ssh.upload_on_host(host, [local_file], self.remote_dir)
+        finally:
+            rmtree(local_dir, ignore_errors=True)
+
+        log_print('Start faults schedulers on %s: %s' % (
+            ', '.join(self.get_hosts()),
+            ', '.join(['%s at %ss' % (fault.name, fault.at) for fault in self.faults])), color='debug')
+        self.ssh.exec({
+            host: ['cd %s; nohup sh %s > %s.out 2>&1 < /dev/null &' % (
+                self.remote_dir, self.script_name, self.script_name)]
+            for host in self.get_hosts()
+        })
+
+    def wait(self, timeout=None):
+        """
+        Wait for schedulers to finish on all hosts.
+        :param timeout: seconds to wait, default is whole timeline plus log trigger timeouts
+        :return: events, see `get_events`
+        """
+        if timeout is None:
+            timeout = self.start_lead + 60 + sum([
+                fault.at + (fault.duration or 0) + (fault.log_timeout if fault.on_log else 0) + fault.delay
+                for fault in self.faults
+            ])
+        end_time = time() + timeout
+        while True:
+            events = self.get_events()
+            finished = set([event['host'] for event in events if event['fault'] == 0 and event['event'] == 'finished'])
+            if finished >= set(self.get_hosts()):
+                return events
+            if time() > end_time:
+                raise TidenException('Faults schedulers not finished in %s sec on %s' % (
+                    timeout, ', '.join(sorted(set(self.get_hosts()) - finished))))
+            sleep(self.poll_interval)
+
+    def wait_for_fault(self, fault, timeout=None):
+        """
+        Wait until fault is injected (or skipped by log trigger timeout), rollback is not waited for.
+        :return: events, see `get_events`
+        """
+        if timeout is None:
+            timeout = self.start_lead + 60 + fault.at + (fault.log_timeout if fault.on_log else 0) + fault.delay
+        end_time = time() + timeout
+        final_events = ['injected'] + (['trigger_timeout'] if fault.on_timeout == 'skip' else [])
+        while True:
+            events = self.get_events()
+            if [event for event in events if event['fault'] == fault.fault_id and event['host'] == fault.host
+                    and event['event'] in final_events]:
+                return events
+            if time() > end_time:
+                raise TidenException('Fault %s is not injected in %s sec' % (fault.name, timeout))
+            sleep(self.poll_interval)
+
+    def run(self, timeout=None):
+        self.start()
+        return self.wait(timeout)
+
+    def stop(self):
+        """
+        Stop schedulers and roll back faults which were injected but not rolled back yet.
+        """
+        self.ssh.exec({host: ["pkill -f '%s'; true" % pkill_pattern(self.script_name)] for host in self.get_hosts()})
+        events = self.get_events()
+        done = set([(event['fault'], event['event']) for event in events])
+        rollback = {}
+        for fault in self.faults:
+            if fault.rollback and (fault.fault_id, 'inject') in done and (fault.fault_id, 'rollback') not in done:
+                # run in scheduler directory as rollback in scheduler script
+                rollback.setdefault(fault.host, []).append('cd %s; %s' % (self.remote_dir, fault.rollback))
+        if rollback:
+            log_print('Roll back faults on %s' % ', '.join(sorted(rollback.keys())), color='debug')
+            self.ssh.exec(rollback)
+
+    def get_events(self):
+        """
+        Read events recorded by schedulers.
+        :return: list of events ordered by time:
+            {'host': host, 'fault': fault id (0 for scheduler itself), 'event': event, 'time': seconds since epoch,
+             'rc': exit code of inject/rollback command or None}
+        """
+        results = self.ssh.exec({
+            host: ['cat %s/%s 2>/dev/null; true' % (self.remote_dir, self.events_name)] for host in self.get_hosts()
+        })
+        events = []
+        for host, outputs in results.items():
+            for line in ''.join(outputs).split('\n'):
+                fields = line.split()
+                if len(fields) < 3 or not fields[0].isdigit() or not fields[1].isdigit():
+                    continue
+                events.append({
+                    'host': host,
+                    'fault': int(fields[1]),
+                    'event': fields[2],
+                    'time': int(fields[0]) / 1000.0,
+                    'rc': int(fields[3]) if len(fields) > 3 and fields[3].lstrip('-').isdigit() else None,
+                })
+        self.events = sorted(events, key=lambda event: (event['time'], event['host'], event['fault']))
+        return self.events
+
+    def get_report(self):
+        """
+        :return: {fault name: {'host': host, 'inject': time, 'injected': time, 'rollback': time, 'rolled_back': time,
+                               'triggered': time, 'trigger_timeout': time, 'rc': inject exit code,
+                               'offset': inject time relative to timeline start}}
+                 only events happened are set
+        """
+        faults = dict([(fault.fault_id, fault) for fault in self.faults])
+        report = {}
+        for event in self.events:
+            if event['fault'] not in faults:
+                continue
+            fault = faults[event['fault']]
+            fault_report = report.setdefault('%s#%s' % (fault.name, fault.fault_id), {'host': fault.host})
+            fault_report[event['event']] = event['time']
+            if event['event'] == 'injected':
+                fault_report['rc'] = event['rc']
+            if event['event'] == 'inject' and self.start_time is not None:
+                fault_report['offset'] = round(event['time'] - self.start_time, 3)
+        return report
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from re import match
+
+# whole disks only, partitions would be accounted twice
+DISK_NAME_PATTERN = r'^(sd[a-z]+|hd[a-z]+|vd[a-z]+|xvd[a-z]+|nvme[0-9]+n[0-9]+|mmcblk[0-9]+)$'
+
+DISK_SECTOR_SIZE = 512
+
+# /proc/net/dev counters order
+NET_DEV_COUNTERS = (
+    'rx_bytes', 'rx_packets', 'rx_errs', 'rx_drop', 'rx_fifo', 'rx_frame', 'rx_compressed', 'rx_multicast',
+    'tx_bytes', 'tx_packets', 'tx_errs', 'tx_drop', 'tx_fifo', 'tx_colls', 'tx_carrier', 'tx_compressed',
+)
+
+
+def parse_net_dev_line(line):
+    """
+    Parse interface line of /proc/net/dev.
+    :return: (interface name, tuple of counters in NET_DEV_COUNTERS order) or (None, None)
+    """
+    name, _, counters = line.partition(':')
+    counters = counters.split()
+    if len(counters) < len(NET_DEV_COUNTERS):
+        return None, None
+    try:
+        return name.strip(), tuple(int(value) for value in counters[:len(NET_DEV_COUNTERS)])
+    except ValueError:
+        return None, None
+
+
+class HostSample:
+    """
+    Single /proc snapshot of a host.
+    """
+    __slots__ = ('time', 'cpu', 'mem_total', 'mem_available', 'disks', 'nets')
+
+    def __init__(self, sample_time):
+        self.time = sample_time
+        self.cpu = None
+        self.mem_total = None
+        self.mem_available = None
+        # {device: (sectors read, sectors written, ms doing io)}
+        self.disks = {}
+        # {interface: counters in NET_DEV_COUNTERS order}
+        self.nets = {}
+
+
+class HostMetricsCollector:
+    """
+    Samples /proc/stat, /proc/meminfo, /proc/diskstats and /proc/net/dev on all hosts of the pool.
+
+    Remote collector is a plain shell loop appending one compact text record per interval to a file, no tools
+    besides coreutils are needed on hosts. Controller reads only records appended since previous read and summarizes
+    them per window (e.g. per test): CPU, disk and network counters are cumulative, so utilization over window
+    is computed from the last sample before the window and the last sample of the window.
+    """
+
+    collector_name = 'hoststat_proc'
+
+    def __init__(self, ssh, remote_dir, interval=1):
+        self.ssh = ssh
+        self.remote_file = '%s/%s.log' % (remote_dir, self.collector_name)
+        self.pid_file = '%s/%s.pid' % (remote_dir, self.collector_name)
+        self.interval = interval
+        # number of lines read per host
+        self.offsets = {}
+        # last sample per host
+        self.last_samples = {}
+        self.window_baseline = None
+        self.window_samples = {}
+
+    def get_sample_commands(self):
+        """
+        :return: shell commands printing one record, run in loop by remote collector
+        """
+        return (
+            "echo \"T $(date +%s.%N)\"; "
+            "head -1 /proc/stat; "
+            "grep -E \"^(MemTotal|MemAvailable):\" /proc/meminfo; "
+            "sed \"s/^/D /\" /proc/diskstats; "
+            "tail -n +3 /proc/net/dev | sed \"s/^/N /\"; "
+        )
+
+    def get_start_command(self):
+        # collector pid is kept to stop exactly this loop
+        return (
+            "nohup sh -c 'while :; do {sample_commands}echo E; sleep {interval}; done' "
+            ">> {remote_file} 2>&1 < /dev/null & echo $! > {pid_file}"
+        ).format(sample_commands=self.get_sample_commands(), interval=self.interval, remote_file=self.remote_file,
+                 pid_file=self.pid_file)
+
+    def get_kill_command(self):
+        return "if [ -f {pid_file} ]; then kill $(cat {pid_file}) 2>/dev/null; rm -f {pid_file}; fi; true".format(
+            pid_file=self.pid_file)
+
+    def start(self):
+        self.offsets = {}
+        self.last_samples = {}
+        self.window_baseline = None
+        self.window_samples = {}
+        # collector left from previous run would keep writing to the same file
+        self.ssh.exec(['%s; rm -f %s; %s' % (self.get_kill_command(), self.remote_file, self.get_start_command())])
+
+    def stop(self):
+        self.ssh.exec([self.get_kill_command()])
+        self.read()
+
+    def begin_window(self):
+        """
+        Start new metrics window: samples collected so far are not accounted in it.
+        """
+        self.read()
+        self.window_baseline = dict(self.last_samples)
+        self.window_samples = {}
+
+    def end_window(self):
+        """
+        :return: metrics summary per host for samples collected since `begin_window`
+        """
+        if self.window_baseline is None:
+            return {}
+        self.read()
+        summary = {}
+        for host, samples in self.window_samples.items():
+            baseline = [self.window_baseline[host]] if host in self.window_baseline else []
+            host_summary = self.summarize(baseline + samples)
+            if host_summary:
+                summary[host] = host_summary
+        self.window_baseline = None
+        self.window_samples = {}
+        return summary
+
+    def read(self):
+        """
+        Read records appended since previous read on all hosts in one remote call.
+        :return: {host: [new samples]}
+        """
+        results = self.ssh.exec({
+            host: ['tail -n +%d %s' % (self.offsets.get(host, 0) + 1, self.remote_file)] for host in self.ssh.hosts
+        })
+        new_samples = {}
+        for host, outputs in results.items():
+            samples, lines_num = self.parse_samples(''.join(outputs))
+            self.offsets[host] = self.offsets.get(host, 0) + lines_num
+            if samples:
+                new_samples[host] = samples
+                self.last_samples[host] = samples[-1]
+                if self.window_baseline is not None:
+                    self.window_samples.setdefault(host, []).extend(samples)
+        return new_samples
+
+    @staticmethod
+    def parse_samples(text):
+        """
+        Parse collector records.
+        :param text: collector output
+        :return: (list of complete samples, number of lines in complete records)
+        """
+        samples = []
+        lines_num = 0
+        sample = None
+        for idx, line in enumerate(text.split('\n')):
+            if line.startswith('T '):
+                try:
+                    sample = HostSample(float(line[2:].strip()))
+                except ValueError:
+                    sample = None
+            elif sample is None:
+                continue
+            elif line == 'E':
+                samples.append(sample)
+                lines_num = idx + 1
+                sample = None
+            elif line.startswith('cpu '):
+                sample.cpu = [int(value) for value in line.split()[1:]]
+            elif line.startswith('MemTotal:'):
+                sample.mem_total = int(line.split()[1]) * 1024
+            elif line.startswith('MemAvailable:'):
+                sample.mem_available = int(line.split()[1]) * 1024
+            elif line.startswith('D '):
+                fields = line.split()
+                if len(fields) > 13 and match(DISK_NAME_PATTERN, fields[3]):
+                    sample.disks[fields[3]] = (int(fields[6]), int(fields[10]), int(fields[13]))
+            elif line.startswith('N '):
+                name, counters = parse_net_dev_line(line[2:])
+                if name is not None:
+                    sample.nets[name] = counters
+        return samples, lines_num
+
+    @staticmethod
+    def summarize(samples):
+        """
+        Summarize host samples.
+        :param samples: list of samples ordered by time, first sample is the window baseline
+        :return: {
+                'duration': <seconds>,
+                'samples': <number of samples>,
+                'cpu_util': <% of non-idle CPU time>,
+                'cpu_iowait': <% of CPU time waiting for io>,
+                'mem_used_avg': <bytes>, 'mem_used_max': <bytes>, 'mem_total': <bytes>,
+                'disk_read_bps': <bytes per second>, 'disk_write_bps': <bytes per second>,
+                'disk_busy_max': <% of time busiest disk was doing io>,
+                'net_rx_bps': <bytes per second>, 'net_tx_bps': <bytes per second>,
+            }
+            or None if there are less than two samples
+        """
+        if len(samples) < 2:
+            return None
+        first, last = samples[0], samples[-1]
+        duration = last.time - first.time
+        if duration <= 0:
+            return None
+        summary = {
+            'duration': round(duration, 3),
+            'samples': len(samples) - 1,
+        }
+        if first.cpu and last.cpu:
+            deltas = [b - a for a, b in zip(first.cpu, last.cpu)]
+            # user nice system idle iowait irq softirq steal, guest time is already accounted in user
+            total = sum(deltas[:8])
+            if total > 0:
+                idle = deltas[3] + (deltas[4] if len(deltas) > 4 else 0)
+                summary['cpu_util'] = round(100.0 * (total - idle) / total, 2)
+                summary['cpu_iowait'] = round(100.0 * (deltas[4] if len(deltas) > 4 else 0) / total, 2)
+        mem_used = [s.mem_total - s.mem_available for s in samples[1:]
+                    if s.mem_total is not None and s.mem_available is not None]
+        if mem_used:
+            summary['mem_used_avg'] = int(sum(mem_used) / len(mem_used))
+            summary['mem_used_max'] = max(mem_used)
+            summary['mem_total'] = last.mem_total
+        disks = set(first.disks.keys()) & set(last.disks.keys())
+        if disks:
+            summary['disk_read_bps'] = int(sum(
+                last.disks[d][0] - first.disks[d][0] for d in disks) * DISK_SECTOR_SIZE / duration)
+            summary['disk_write_bps'] = int(sum(
+                last.disks[d][1] - first.disks[d][1] for d in disks) * DISK_SECTOR_SIZE / duration)
+            summary['disk_busy_max'] = round(min(100.0, max(
+                (last.disks[d][2] - first.disks[d][2]) / 10.0 / duration for d in disks)), 2)
+        nets = (set(first.nets.keys()) & set(last.nets.keys())) - {'lo'}
+        if nets:
+            rx, tx = NET_DEV_COUNTERS.index('rx_bytes'), NET_DEV_COUNTERS.index('tx_bytes')
+            summary['net_rx_bps'] = int(sum(last.nets[n][rx] - first.nets[n][rx] for n in nets) / duration)
+            summary['net_tx_bps'] = int(sum(last.nets[n][tx] - first.nets[n][tx] for n in nets) / duration)
+        return summary
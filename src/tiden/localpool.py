@@ -17,28 +17,107 @@
 from .sshpool import SshPool
 from .util import log_print
 from .logger import get_logger
+from .tidenexception import RemoteOperationTimeout
 import sys
-from os import path, makedirs, environ
+from os import path, makedirs, environ, read
 from datetime import datetime
 from shutil import copy, copy2, copyfile
+from selectors import DefaultSelector, EVENT_READ
+from threading import Lock
+from time import time
+from uuid import uuid4
 import subprocess
 
+import psutil
+
 if 'win' in sys.platform and not 'darwin' in sys.platform:
     raise NotImplementedError("LocalPool not yet supported for Windows")
 
 debug_local_pool = False
 
 
+class LocalShellWorker:
+    """
+    Resident POSIX shell bound to emulated host directory.
+    Commands are fed to shell stdin one by one and each is executed in a subshell, so that `cd` or variables set
+    by one command don't leak into next one. The end of command output is detected by unique marker line
+    carrying the command exit code.
+    """
+
+    def __init__(self, cwd, env):
+        self.proc = subprocess.Popen(
+            ['/bin/sh'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            cwd=cwd,
+            env=env,
+        )
+        self.selector = DefaultSelector()
+        self.selector.register(self.proc.stdout, EVENT_READ)
+
+    def is_alive(self):
+        return self.proc.poll() is None
+
+    def run(self, command, timeout, on_line=None):
+        """
+        Execute command and wait for its completion
+        :param command: shell command
+        :param timeout: seconds to wait for command completion
+        :param on_line: (optional) callback called with each output line as soon as it is read
+        :return: tuple(exit code, output)
+        """
+        marker = '__TIDEN_LOCAL_POOL_%s__' % uuid4().hex
+        script = "( %s\n) < /dev/null\nprintf '\\n%s %%s\\n' \"$?\"\n" % (command, marker)
+        self.proc.stdin.write(script.encode('utf-8'))
+        self.proc.stdin.flush()
+
+        deadline = time() + timeout
+        output = b''
+        pending = b''
+        marker_bytes = marker.encode('utf-8')
+        while True:
+            time_left = deadline - time()
+            if time_left <= 0 or not self.selector.select(timeout=time_left):
+                self.close()
+                raise RemoteOperationTimeout('Timeout %s reached while executing command:\n%s' % (timeout, command))
+            chunk = read(self.proc.stdout.fileno(), 65536)
+            if not chunk:
+                raise ChildProcessError('Local shell died while executing command:\n%s' % command)
+            pending += chunk
+            lines = pending.split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                if line.startswith(marker_bytes):
+                    # marker is printed with extra new line before it to always have marker at line start
+                    output = output[:-1] if output.endswith(b'\n') else output
+                    return int(line.split()[-1]), output.decode('utf-8', errors='replace')
+                output += line + b'\n'
+                if on_line is not None and line.strip():
+                    on_line(line.decode('utf-8', errors='replace'))
+
+    def close(self):
+        # only shell itself is killed, processes started in background by commands survive it
+        self.proc.kill()
+        self.selector.close()
+        self.proc.wait()
+
+
 class LocalPool(SshPool):
     """
     Local pool emulates N hosts by faking config['environment']['home'] to unique local directory per each 'host'.
     All commands are actually executed locally (POSIX compatible shell required!).
     NB: this may result in unexpected behaviour, use with caution, beware of hedgehogs!
     """
+    default_local_timeout = 60
+
     def __init__(self, ssh_config, **kwargs):
         super(LocalPool, self).__init__(ssh_config, **kwargs)
         for host in self.hosts:
             assert host.startswith('127.0'), "Mixing local and remote hosts is not supported!"
+        self.workers = {}
+        self.workers_lock = Lock()
+        self.timeout = int(self.config.get('local_timeout', self.default_local_timeout))
 
     @staticmethod
     def _now():
@@ -85,7 +164,43 @@ class LocalPool(SshPool):
                 copy2(remote_path, local_path)
         return {}
 
-    def exec_on_host(self, host, commands):
+    def _acquire_worker(self, host):
+        with self.workers_lock:
+            idle_workers = self.workers.setdefault(host, [])
+            while idle_workers:
+                worker = idle_workers.pop()
+                if worker.is_alive():
+                    return worker
+        env = environ.copy()
+        if self.config.get('env_vars'):
+            env.update({name: str(val) for name, val in self.config['env_vars'].items()})
+        return LocalShellWorker(path.join(self.home, host), env)
+
+    def _release_worker(self, host, worker):
+        if worker.is_alive():
+            with self.workers_lock:
+                self.workers.setdefault(host, []).append(worker)
+
+    def close(self):
+        """
+        Stop all resident shell workers
+        """
+        with self.workers_lock:
+            for workers in self.workers.values():
+                for worker in workers:
+                    worker.close()
+            self.workers = {}
+
+    def exec_on_host(self, host, commands, **kwargs):
+        """
+        Execute commands in host directory by resident shell worker.
+        :param host: emulated host
+        :param commands: list of commands
+        :param kwargs:
+            timeout - (optional) seconds per command, defaults to 'local_timeout' pool option (60 seconds)
+            on_line - (optional) callback(host, line) to stream output lines while command is running
+        :return: {host: [<output of each successful command>]}
+        """
         if debug_local_pool:
             print("%s: exec_on_host(%s, %s)" % (
                 LocalPool._now(),
@@ -94,90 +209,161 @@ class LocalPool(SshPool):
             ))
         output = []
         host_home = path.join(self.home, host)
-        timeout = 60
-        env = environ.copy()
-        if self.config.get('env_vars'):
-            env.update(self.config['env_vars'])
+        timeout = kwargs.get('timeout', self.timeout)
+        on_line = None
+        if kwargs.get('on_line'):
+            on_line = lambda line: kwargs['on_line'](host, line)
 
         for command in commands:
+            worker = None
             try:
-                # remove trailing redirect to stderr because we do it via stderr argument to check_output already
+                # remove trailing redirect to stderr because worker merges stderr to stdout already
                 if command.endswith('2>&1'):
                     command = command[:-(len('2>&1'))]
                 if self.home in command:
                     command = command.replace(self.home, host_home)
                 get_logger('tiden').debug('%s >> %s' % (host, command))
 
-                proc_args = ['/usr/bin/env']
-                proc_args.extend(command.split(" "))
-
-                stdout = subprocess.check_output(
-                    command,
-                    shell=True,
-                    # args=proc_args,
-                    # executable=proc_args[0],
-                    env=env,
-                    cwd=host_home,
-                    timeout=timeout,
-                    stderr=subprocess.STDOUT
-                ).decode('utf-8')
-
-                output.append(stdout) #.strip())
+                worker = self._acquire_worker(host)
+                with self.tracer.span('exec', cat='ssh', host=host, command=command) as span:
+                    exit_code, stdout = worker.run(command, timeout, on_line=on_line)
+                    span['bytes'] = len(stdout)
+                self._release_worker(host, worker)
+                worker = None
+                if exit_code != 0:
+                    raise subprocess.CalledProcessError(exit_code, command, output=stdout)
+
+                output.append(stdout)
                 get_logger('tiden').debug('<< %s' % output)
             except Exception as e:
+                if worker is not None:
+                    worker.close()
                 get_logger('tiden').error("%s" % e)
 
         return {host: output}
 
+    def exec_to_file_on_host(self, host, command, local_file, **kwargs):
+        """
+        Execute command in host directory and write its standard output to local file.
+        :return: (number of bytes written or None if command failed, seconds)
+        """
+        started = time()
+        if debug_local_pool:
+            print("%s: exec_to_file_on_host(%s, %s, %s)" % (
+                LocalPool._now(),
+                host,
+                command,
+                local_file,
+            ))
+        host_home = path.join(self.home, host)
+        if self.home in command:
+            command = command.replace(self.home, host_home)
+        env = environ.copy()
+        if self.config.get('env_vars'):
+            env.update({name: str(val) for name, val in self.config['env_vars'].items()})
+        timeout = kwargs.get('timeout', self.timeout)
+        with self.tracer.span('exec_to_file', cat='ssh', host=host, command=command) as span:
+            with open(local_file, 'wb') as w:
+                proc = subprocess.Popen(['/bin/sh', '-c', command], stdin=subprocess.DEVNULL, stdout=w,
+                                        stderr=subprocess.DEVNULL, cwd=host_home, env=env)
+                try:
+                    exit_code = proc.wait(timeout=timeout)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+                    proc.wait()
+                    raise RemoteOperationTimeout('Timeout %s reached while executing command:\n%s' % (timeout, command))
+            span['bytes'] = path.getsize(local_file)
+        if exit_code != 0:
+            get_logger('tiden').error('%s: command exited with code %s: %s' % (host, exit_code, command))
+            return None, time() - started
+        return span['bytes'], time() - started
+
     def get_process_and_owners(self):
         return self.jps()
 
-    def jps(self):
+    def _bound_host(self, cwd, cmdline):
         """
-        jps is hacked to execute on single 'host' and reorder PIDs per 'host' basing on cwd of the process.
-        process must be either started from host directory (config['environment']['home']/<host>/) or have host
-        directory in cmdline. otherwise it will left bound to first host.
-        :return:
+        Find emulated host for process by its working directory or command line.
+        """
+        for host in self.hosts:
+            host_home = path.join(self.home, host)
+            if cwd == host_home or cwd.startswith(host_home + '/'):
+                return host
+        for host in self.hosts:
+            host_home = path.join(self.home, host)
+            if host_home + '/' in cmdline or cmdline.endswith(host_home):
+                return host
+        return None
+
+    @staticmethod
+    def _java_main_class(args):
+        """
+        Extract name shown by `jps -l` from java command line: main class name or jar path.
+        """
+        options_with_value = ['-cp', '-classpath', '--class-path', '-p', '--module-path', '--add-modules']
+        idx = 1
+        while idx < len(args):
+            arg = args[idx]
+            if arg == '-jar':
+                return args[idx + 1] if idx + 1 < len(args) else ''
+            if arg in options_with_value:
+                idx += 2
+                continue
+            if not arg.startswith('-'):
+                return arg
+            idx += 1
+        return ''
+
+    def _processes(self, name):
+        """
+        Local processes with given executable name bound to emulated hosts.
+        Process must be either started from host directory (config['environment']['home']/<host>/) or have host
+        directory in cmdline, otherwise it is bound to the first host.
+        :return: list of (host, psutil.Process, cmdline arguments)
+        """
+        results = []
+        for proc in psutil.process_iter(['pid', 'name', 'cmdline', 'cwd']):
+            args = proc.info.get('cmdline') or []
+            if proc.info.get('name') != name and not (args and path.basename(args[0]) == name):
+                continue
+            bound_to_host = self._bound_host(proc.info.get('cwd') or '', ' '.join(args))
+            if bound_to_host is None:
+                bound_to_host = self.hosts[0]
+            results.append((bound_to_host, proc, args))
+        return results
+
+    def jps(self, jps_args=None, hosts=None, skip_reserved_java_processes=True):
+        """
+        jps is emulated by reading local processes table, each java process is bound to emulated host
+        by its cwd or cmdline.
+        :return: list of dictionaries:
+           'host': host
+           'pid': java process pid
+           'name': java process name
         """
         if debug_local_pool:
             print("%s: jps()" % (
                 LocalPool._now(),
             ))
-        first_host = self.hosts[0]
-        raw_results = super(LocalPool, self).jps(hosts=[first_host])
         results = []
-        for result in raw_results:
-            bound_to_host = None
-            proc_pid = int(result['pid'])
-            cwd = self.exec_on_host(first_host, ['ls -l /proc/%d/cwd' % (proc_pid + 1)])
-            if len(cwd) == 0 or first_host not in cwd.keys() or len(cwd[first_host]) == 0:
-                # something wrong with process, it might have died, skip it
+        for host, proc, args in self._processes('java'):
+            if hosts is not None and host not in hosts:
                 continue
-            cwd = cwd[first_host][0]
-            cmdline = self.exec_on_host(first_host, ['cat /proc/%d/cmdline | tr "\\0" " "' % (proc_pid+1)])
-            if len(cmdline) == 0 or first_host not in cmdline.keys() or len(cmdline[first_host]) == 0:
-                # something wrong with process, it might have died, skip it
+            main_class = self._java_main_class(args)
+            reserved = SshPool._reserved_java_processes() if skip_reserved_java_processes else \
+                SshPool._reserved_java_processes()[:1]
+            if any(proc_name in main_class for proc_name in reserved):
                 continue
-            cmdline = cmdline[first_host][0]
-
-            for host in self.hosts:
-                host_home = path.join(self.home, host)
-                if host_home in cwd:
-                    bound_to_host = host
-                    break
-                if host_home in cmdline:
-                    bound_to_host = host
-                    break
-            if bound_to_host is None:
-                bound_to_host = first_host
-            results.append({'host': bound_to_host, 'pid': result['pid'], 'name': result['name']})
+            results.append({'host': host, 'pid': str(proc.pid), 'name': main_class})
         return results
 
-    def killall(self, name, sig=-9):
+    def killall(self, name, sig=-9, skip_reserved_java_processes=True, hosts=None):
         """
-        killall is also hacked to be executed on first host only
-        :param name:
-        :param sig:
+        Send signal to local processes with given name bound to all (or given) emulated hosts.
+        :param name: name of processes to kill
+        :param sig: signal to send, default -9 (SIG_KILL)
+        :param skip_reserved_java_processes: (default True) skip known developer/debugger java processes
+        :param hosts: hosts where to kill processes (default None means all hosts)
         :return:
         """
         if debug_local_pool:
@@ -186,7 +372,20 @@ class LocalPool(SshPool):
                 name,
                 sig,
             ))
-        return super(LocalPool, self).killall(name, sig=sig, hosts=[self.hosts[0]])
+        if name == 'java':
+            pids = [int(proc['pid']) for proc in self.jps(
+                hosts=hosts, skip_reserved_java_processes=skip_reserved_java_processes)]
+        else:
+            pids = [proc.pid for host, proc, args in self._processes(name) if hosts is None or host in hosts]
+        results = {}
+        for pid in pids:
+            try:
+                psutil.Process(pid).send_signal(abs(int(sig)))
+            except (psutil.NoSuchProcess, psutil.AccessDenied) as e:
+                get_logger('tiden').debug('Unable to kill %s: %s' % (pid, e))
+        for host in (hosts if hosts is not None else self.hosts):
+            results[host] = ['']
+        return results
 
     # === after goes simple delegates, the only actual meaning of them is to dump debug info.
 
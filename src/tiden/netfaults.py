@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from os import makedirs, path
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import time
+from uuid import uuid4
+
+from .stress import StressT
+from .tidenexception import TidenException
+from .util import log_print
+
+DROP = 'drop'
+
+# tc prio qdisc has at most 16 bands, first 3 bands keep default traffic priomap
+TC_MAX_BANDS = 16
+TC_DEFAULT_BANDS = 3
+
+# netem options allowed in link spec
+NETEM_OPTIONS = ('delay', 'jitter', 'loss', 'duplicate', 'corrupt', 'reorder', 'rate')
+
+
+def partition(*groups):
+    """
+    Connectivity matrix splitting hosts into isolated groups, hosts stay connected inside group.
+    :param groups: lists of hosts
+    :return: {(src, dst): 'drop'}
+    """
+    links = {}
+    for group in groups:
+        for other_group in groups:
+            if other_group is group:
+                continue
+            for src in group:
+                for dst in other_group:
+                    links[(src, dst)] = DROP
+    return links
+
+
+def get_netem_args(spec):
+    """
+    :param spec: {'delay': '100ms', 'jitter': '10ms', 'loss': '5%', ...}
+    :return: netem arguments, e.g. 'delay 100ms 10ms loss 5%'
+    """
+    unknown = set(spec.keys()) - set(NETEM_OPTIONS)
+    if unknown:
+        raise TidenException('Unknown netem options: %s' % ', '.join(sorted(unknown)))
+    args = []
+    if spec.get('delay'):
+        args.append('delay %s' % spec['delay'])
+        if spec.get('jitter'):
+            args.append(spec['jitter'])
+    for option in NETEM_OPTIONS[2:]:
+        if spec.get(option):
+            args.append('%s %s' % (option, spec[option]))
+    if not args:
+        raise TidenException('Empty netem spec')
+    return ' '.join(args)
+
+
+class NetworkFaults:
+    """
+    Network faults described by connectivity matrix.
+
+    Matrix is a dict {(src, dst): link}, where link is 'drop' (packets from src to dst are dropped, so asymmetric
+    links are possible) or netem spec {'delay': '100ms', 'loss': '5%', ...} applied to packets sent from src to dst.
+    Links absent in matrix are healthy.
+
+    Drop rules of a host live in own iptables chains which are replaced by single `iptables-restore --noflush`
+    transaction, netem links are set by single `tc -batch`. On `apply` only hosts whose rules differ from the
+    previous matrix are touched: batch files are uploaded first, then all changed hosts switch at the same moment
+    (hosts clocks are expected to be synchronized). `teardown` removes chains and qdisc on all hosts regardless of
+    what was applied, so it is safe to call after failed `apply`.
+
+    Example:
+        with NetworkFaults(ssh, remote_dir, hosts) as net:
+            net.apply(partition([host1, host2], [host3]))
+            ...
+            net.apply({(host1, host3): {'delay': '200ms'}, (host3, host1): 'drop'})
+            ...
+            net.heal()
+    """
+
+    chain_in = 'TIDEN_NETFAULT_IN'
+    chain_out = 'TIDEN_NETFAULT_OUT'
+
+    # seconds between apply command and switch time, enough to reach all hosts
+    switch_lead = 1
+
+    def __init__(self, ssh, remote_dir, hosts=None, dev=None):
+        """
+        :param ssh: ssh pool
+        :param remote_dir: remote directory for batch files
+        :param hosts: (optional) hosts to manage, default is all pool hosts
+        :param dev: (optional) network device for netem, detected by route to other hosts by default
+        """
+        self.ssh = ssh
+        self.remote_dir = remote_dir
+        self.hosts = sorted(hosts if hosts is not None else ssh.hosts)
+        self.dev = dev
+        self.devices = {}
+        self.batch_name = 'netfaults-%s' % uuid4().hex[:8]
+        self.links = {}
+        # {host: (iptables rules, tc batch)} applied on host, None if applying failed
+        self.applied = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.teardown()
+
+    def get_iptables_rules(self, host, links):
+        """
+        :return: iptables-restore input replacing drop rules of host
+        """
+        rules = [
+            '*filter',
+            ':%s - [0:0]' % self.chain_in,
+            ':%s - [0:0]' % self.chain_out,
+        ]
+        for (src, dst), link in sorted(links.items()):
+            if link != DROP:
+                continue
+            if src == host:
+                rules.append('-A %s -d %s -j DROP' % (self.chain_out, dst))
+            if dst == host:
+                rules.append('-A %s -s %s -j DROP' % (self.chain_in, src))
+        rules += ['COMMIT', '']
+        return '\n'.join(rules)
+
+    def get_tc_batch(self, host, links, dev):
+        """
+        :return: tc batch with netem qdisc per link from host or empty string if host has no netem links
+        """
+        host_links = [(dst, link) for (src, dst), link in sorted(links.items()) if src == host and link != DROP]
+        if not host_links:
+            return ''
+        bands = TC_DEFAULT_BANDS + len(host_links)
+        if bands > TC_MAX_BANDS:
+            raise TidenException('Too many netem links from host %s: %s, at most %s supported' % (
+                host, len(host_links), TC_MAX_BANDS - TC_DEFAULT_BANDS))
+        batch = ['qdisc add dev %s root handle 1: prio bands %d priomap %s' % (
+            dev, bands, ' '.join(['1', '2', '2', '2', '1', '2', '0', '0'] + ['1'] * 8))]
+        for idx, (dst, link) in enumerate(host_links, start=TC_DEFAULT_BANDS + 1):
+            # class and handle ids are hex
+            batch += [
+                'qdisc add dev %s parent 1:%x handle %x: netem %s' % (dev, idx, 0x100 + idx, get_netem_args(link)),
+                'filter add dev %s protocol ip parent 1:0 prio 1 u32 match ip dst %s/32 flowid 1:%x' % (
+                    dev, dst, idx),
+            ]
+        return '\n'.join(batch) + '\n'
+
+    def get_devices(self):
+        """
+        :return: {host: network device used to reach other hosts}
+        """
+        if self.dev:
+            return {host: self.dev for host in self.hosts}
+        if not self.devices:
+            results = self.ssh.exec({
+                host: ["ip -o route get %s | sed -n 's/.* dev \\([^ ]*\\).*/\\1/p'; true" % (
+                    [other for other in self.hosts if other != host] or [host])[0]]
+                for host in self.hosts
+            })
+            for host in self.hosts:
+                device = ''.join(results.get(host, [])).strip()
+                # loopback route means single host setup, netem on it would affect everything
+                self.devices[host] = device if device and device != 'lo' else StressT.network_device
+        return self.devices
+
+    def get_switch_command(self, host, switch_time_ms, rules, tc_batch):
+        batch_path = '%s/%s' % (self.remote_dir, self.batch_name)
+        dev = self.get_devices()[host]
+        commands = [
+            'd=$(( %d - $(date +%%s%%3N) ))' % switch_time_ms,
+            "if [ $d -gt 0 ]; then sleep $(( d / 1000 )).$(printf '%03d' $(( d % 1000 ))); fi",
+            'sudo iptables-restore -w --noflush < %s.iptables' % batch_path,
+            'echo IPTABLES $?',
+            self.get_jump_commands(),
+            'sudo tc qdisc del dev %s root 2>/dev/null' % dev,
+        ]
+        if tc_batch:
+            commands += ['sudo tc -batch %s.tc' % batch_path, 'echo TC $?']
+        return '; '.join(commands) + '; true'
+
+    def get_jump_commands(self):
+        # jumps are added once, chains content is replaced by iptables-restore
+        return '; '.join([
+            'sudo iptables -w -C {chain} -j {target} 2>/dev/null || sudo iptables -w -I {chain} -j {target}'.format(
+                chain=chain, target=target)
+            for chain, target in (('INPUT', self.chain_in), ('OUTPUT', self.chain_out))
+        ])
+
+    def apply(self, links):
+        """
+        Switch hosts to connectivity matrix.
+        :param links: {(src, dst): 'drop' or netem spec}
+        :return: list of hosts which rules were changed
+        """
+        for (src, dst), link in links.items():
+            if src == dst:
+                raise TidenException('Link from host %s to itself' % src)
+            if link != DROP and not isinstance(link, dict):
+                raise TidenException("Unknown link %s -> %s: %s" % (src, dst, link))
+        devices = self.get_devices()
+        changes = {}
+        for host in self.hosts:
+            host_rules = (self.get_iptables_rules(host, links), self.get_tc_batch(host, links, devices[host]))
+            empty = (self.get_iptables_rules(host, {}), '')
+            if self.applied.get(host, empty) != host_rules:
+                changes[host] = host_rules
+        self.links = dict(links)
+        if not changes:
+            return []
+
+        local_dir = mkdtemp()
+        try:
+            for host, (rules, tc_batch) in changes.items():
+                makedirs(path.join(local_dir, host))
+                files = []
+                for ext, text in (('iptables', rules), ('tc', tc_batch)):
+                    files.append(path.join(local_dir, host, '%s.%s' % (self.batch_name, ext)))
+                    with open(files[-1], 'w') as w:
+                        w.write(text)
+                self.ssh.upload_on_host(host, files, self.remote_dir)
+        finally:
+            rmtree(local_dir, ignore_errors=True)
+
+        switch_time_ms = int((time() + self.switch_lead) * 1000)
+        log_print('Switch network faults on %s' % ', '.join(sorted(changes.keys())), color='debug')
+        results = self.ssh.exec({
+            host: [self.get_switch_command(host, switch_time_ms, rules, tc_batch)]
+            for host, (rules, tc_batch) in changes.items()
+        })
+        failed = []
+        for host in changes.keys():
+            output = ''.join(results.get(host, []))
+            if 'IPTABLES 0' not in output or (changes[host][1] and 'TC 0' not in output):
+                # state of host is unknown, rules are sent again by next apply whatever matrix is
+                self.applied[host] = None
+                failed.append(host)
+            else:
+                self.applied[host] = changes[host]
+        if failed:
+            raise TidenException('Network faults are not applied on %s' % ', '.join(failed))
+        return sorted(changes.keys())
+
+    def heal(self):
+        """
+        Restore full connectivity, chains are kept for next `apply`.
+        """
+        return self.apply({})
+
+    def teardown(self):
+        """
+        Remove netfault chains and netem qdisc on all hosts.
+        """
+        devices = self.get_devices()
+        log_print('Remove network faults on %s' % ', '.join(self.hosts), color='debug')
+        self.ssh.exec({
+            host: ['; '.join([
+                'sudo iptables -w -D {chain} -j {target} 2>/dev/null; '
+                'sudo iptables -w -F {target} 2>/dev/null; '
+                'sudo iptables -w -X {target} 2>/dev/null'.format(chain=chain, target=target)
+                for chain, target in (('INPUT', self.chain_in), ('OUTPUT', self.chain_out))
+            ] + [
+                'sudo tc qdisc del dev %s root 2>/dev/null' % devices[host],
+                'rm -f %s/%s.*' % (self.remote_dir, self.batch_name),
+                'true',
+            ])]
+            for host in self.hosts
+        })
+        self.links = {}
+        self.applied = {}
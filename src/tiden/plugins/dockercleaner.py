@@ -23,22 +23,54 @@ TIDEN_PLUGIN_VERSION = '1.0.0'
 
 
 class DockerCleaner(TidenPlugin):
+    """
+    Reconciles docker state of hosts before run: containers left from previous runs are found by single sweep over
+    all hosts and removed with single command per host. Networks and volumes are reconciled only when listed in
+    `kinds` explicitly.
+
+    Options:
+        force_setup: remove leftovers, otherwise run is stopped when running leftover containers found
+        keep: {'containers': [name regex, ...], 'networks': [...], 'volumes': [...]} items never removed
+        kinds: kinds of items to reconcile: 'containers', 'networks', 'volumes', default containers only
+    """
     pp = PrettyPrinter()
 
+    kinds = ('containers',)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.keep = self.options.get('keep', {})
+        self.kinds = tuple(self.options.get('kinds', self.kinds))
 
     def before_hosts_setup(self, *args, **kwargs):
         self.dockermanager = DockerManager(self.config, self.ssh)
         force_setup = self.config.get('force_setup', False) or self.options.get('force_setup', False)
-        containers_count = self.dockermanager.print_and_terminate_containers(force_setup)
-        if containers_count == 0:
-            self.log_print('all containers removed successfully', color='green')
-        elif containers_count > 0:
-            if self.options.get('force_setup', False):
+
+        leftovers = self.dockermanager.reconcile(keep=self.keep, kinds=self.kinds, dry_run=True)
+        if not leftovers:
+            self.log_print('No docker leftovers found on hosts', color='green')
+            return
+
+        self.log_print('Found docker leftovers:', color='red')
+        self.log_print(self.pp.pformat({
+            host: {kind: [item['name'] for item in items] for kind, items in host_leftovers.items()}
+            for host, host_leftovers in leftovers.items()
+        }))
+
+        if force_setup:
+            self.log_print('Going to remove those docker leftovers!', color='red')
+            self.dockermanager.remove_leftovers(leftovers)
+            leftovers = self.dockermanager.reconcile(keep=self.keep, kinds=self.kinds, dry_run=True)
+            if self.running_containers_count(leftovers):
                 exit('some containers don\'t deleted.  The runner will be stopped')
-            else:
-                exit('WARNING: Found docker containers and flag force_setup for DockerCleaner isn\'t set. '
-                     'The runner will be stopped')
-        else:
-            self.log_print('No running docker containers found on hosts', color='green')
\ No newline at end of file
+            self.log_print('all containers removed successfully', color='green')
+        elif self.running_containers_count(leftovers):
+            exit('WARNING: Found docker containers and flag force_setup for DockerCleaner isn\'t set. '
+                 'The runner will be stopped')
+
+    @staticmethod
+    def running_containers_count(leftovers):
+        return sum([
+            len([container for container in host_leftovers.get('containers', []) if container['running']])
+            for host_leftovers in leftovers.values()
+        ])
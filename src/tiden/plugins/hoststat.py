@@ -15,6 +15,7 @@
 # limitations under the License.
 
 from tiden.tidenplugin import TidenPlugin, TidenPluginScope
+from tiden.hostmetrics import HostMetricsCollector
 from time import sleep
 from re import search
 
@@ -46,6 +47,9 @@ class HostStat(TidenPlugin):
 
     pids = {}
 
+    # /proc sampling interval, seconds
+    proc_interval = 1
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -53,6 +57,13 @@ class HostStat(TidenPlugin):
 
         self.cleanup = self.options.get('cleanup', self.cleanup)
 
+        # 'proc' app samples /proc on hosts and summarizes host metrics per test
+        self.proc = 'proc' in self.options.get('apps', {})
+        if self.proc:
+            self.proc_interval = self.options['apps']['proc'].get('interval', self.proc_interval)
+        self.metrics = None
+        self.test_metrics = None
+
         # Remove unused apps
         for stat_app in self.start_commands_template.copy().keys():
             if stat_app not in self.options.get('apps', {}):
@@ -97,6 +108,21 @@ class HostStat(TidenPlugin):
         if self.scope == TidenPluginScope.METHOD:
             self.__stop(*args, **kwargs)
 
+    def before_test_method(self, *args, **kwargs):
+        if self.metrics is not None:
+            self.metrics.begin_window()
+
+    def after_test_method(self, *args, **kwargs):
+        if self.metrics is not None and self.metrics.window_baseline is not None:
+            self.test_metrics = self.metrics.end_window()
+        if self.test_metrics:
+            for host, summary in sorted(self.test_metrics.items()):
+                self.log_print('%s: %s' % (host, ', '.join(['%s=%s' % item for item in summary.items()])),
+                               color='debug')
+            if kwargs.get('result') is not None:
+                kwargs['result'].add_test_metrics('host', self.test_metrics)
+        self.test_metrics = None
+
     def __reset(self):
         self.start_commands = {}
         self.stop_commands = {}
@@ -118,6 +144,15 @@ class HostStat(TidenPlugin):
     def __start(self, *args, **kwargs):
         # self.__stop(*args, **kwargs)
         self.__apply_vars()
+        if self.proc:
+            self.log_print("Start /proc sampling every %s sec" % self.proc_interval)
+            self.metrics = HostMetricsCollector(self.ssh, self.scope.scoped_remote_dir(self.config),
+                                                interval=self.proc_interval)
+            self.metrics.start()
+            if self.scope == TidenPluginScope.METHOD:
+                self.metrics.begin_window()
+        if not self.start_commands:
+            return
         self.log_print("Start %s" % ', '.join(self.start_commands.keys()))
         # start
         self.ssh.exec(list(self.start_commands.values()))
@@ -135,6 +170,13 @@ class HostStat(TidenPlugin):
                     self.pids[command][host] = m.group(1)
 
     def __stop(self, *args, **kwargs):
+        if self.metrics is not None:
+            if self.metrics.window_baseline is not None:
+                self.test_metrics = self.metrics.end_window()
+            self.metrics.stop()
+            self.metrics = None
+        if not self.start_commands:
+            return
         self.log_print("Stop %s" % ', '.join(self.start_commands.keys()))
         # self.ssh.exec(list(self.stop_commands.values()))
         for command in self.pids.keys():
@@ -17,8 +17,12 @@
 from tiden.tidenplugin import TidenPlugin, TidenPluginScope
 from time import time
 from re import search
-from os import listdir, makedirs
+from os import listdir, makedirs, remove
 from os.path import join, isfile
+from multiprocessing.dummy import Pool as ThreadPool
+from shlex import quote
+from struct import unpack
+from tarfile import open as tar_open, TarError
 from zipfile import ZipFile
 from tiden.util import is_enabled
 
@@ -43,13 +47,31 @@ class TestResultsCollector(TidenPlugin):
 
     unpack_logs = False
 
+    # gzip level of streamed archives, 'auto' tunes level per host by observed throughput
+    compression_level = 'auto'
+    default_compression_level = 6
+
+    # {file mask: max bytes}, bigger files are collected as head and tail of max bytes in total
+    size_caps = {}
+
+    archive_name = '_logs.tar.gz'
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # custom remote commands produce archives to be downloaded the old way
+        self.stream = True
         if self.options.get('remote_commands'):
             self.remote_commands = self.options['remote_commands']
+            self.stream = False
 
         if self.options.get('download_masks'):
             self.download_masks = self.options['download_masks']
+            self.stream = False
+
+        self.compression_level = self.options.get('compression_level', self.compression_level)
+        self.size_caps = {mask: self.parse_size(cap) for mask, cap in self.options.get('size_caps', {}).items()}
+        # {host: [(level, raw bytes per second), ...]} last measurements per host
+        self.throughput = {}
 
         self.scope = TidenPluginScope.from_options(self.name, self.options, self.scope)
 
@@ -101,6 +123,168 @@ class TestResultsCollector(TidenPlugin):
                 self.scope.scoped_local_dir(self.config)
             )
 
+    @staticmethod
+    def parse_size(size):
+        """
+        :param size: bytes, may have K, M or G suffix
+        """
+        size = str(size).strip().upper()
+        multiplier = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}.get(size[-1:], 1)
+        return int(float(size.rstrip('KMGB') or 0) * multiplier)
+
+    @staticmethod
+    def _path_mask(mask):
+        # masks are relative to collected directory as in zip include/exclude options
+        if mask.startswith('./') or mask.startswith('*') or mask.startswith('/'):
+            return mask
+        return './%s' % mask
+
+    def get_archive_command(self, remote_dir, include_masks, exclude_masks, level):
+        """
+        Build shell command writing gzipped tar of matching files to stdout.
+        Files matching size caps masks and bigger than cap are replaced by their head and tail.
+        """
+        def any_path(masks):
+            return ' -o '.join(['-path %s' % quote(self._path_mask(mask)) for mask in masks])
+
+        find_files = 'find . -type f \\( %s \\) ! -name %s' % (any_path(include_masks), quote(self.archive_name))
+        if exclude_masks:
+            find_files += ' ! \\( %s \\)' % any_path(exclude_masks)
+
+        script = [
+            'cd %s || exit 1' % quote(remote_dir),
+            'S=$(mktemp -d) || exit 1',
+            'trap \'rm -rf "$S"\' EXIT',
+            '%s > "$S/files"' % find_files,
+            ': > "$S/capped"',
+        ]
+        capped_masks = []
+        for mask, cap in self.size_caps.items():
+            find_capped = '%s -path %s -size +%dc' % (find_files, quote(self._path_mask(mask)), cap)
+            if capped_masks:
+                find_capped += ' ! \\( %s \\)' % any_path(capped_masks)
+            capped_masks.append(mask)
+            script.append(
+                '%s | while IFS= read -r f; do '
+                'mkdir -p "$S/capped.d/$(dirname "$f")"; '
+                '{ head -c %d "$f"; printf \'\\n[... truncated ...]\\n\'; tail -c %d "$f"; } > "$S/capped.d/$f"; '
+                'echo "$f" >> "$S/capped"; '
+                'done' % (find_capped, cap // 2, cap - cap // 2)
+            )
+        script.extend([
+            '{ grep -vxF -f "$S/capped" "$S/files" || true; } > "$S/plain"',
+            'mkdir -p "$S/capped.d"',
+            'tar -cf - -T "$S/plain" -C "$S/capped.d" -T "$S/capped" | gzip -%d' % level,
+        ])
+        return 'sh -c %s' % quote('; '.join(script))
+
+    def get_compression_level(self, host):
+        """
+        Pick gzip level for host. With 'auto' level, level is moved by one step in direction that gave better
+        raw throughput last time: slow links gain from stronger compression, slow CPUs from weaker one.
+        """
+        if str(self.compression_level) != 'auto':
+            return int(self.compression_level)
+        history = self.throughput.get(host, [])
+        if not history:
+            return self.default_compression_level
+        if len(history) == 1:
+            return max(1, history[-1][0] - 1)
+        (prev_level, prev_rate), (last_level, last_rate) = history[-2:]
+        step = 1 if last_level > prev_level else -1
+        if last_rate < prev_rate:
+            step = -step
+            last_level = prev_level
+        return min(9, max(1, last_level + step))
+
+    @staticmethod
+    def get_raw_size(archive):
+        """
+        Uncompressed size from gzip trailer (modulo 4G).
+        """
+        with open(archive, 'rb') as r:
+            r.seek(-4, 2)
+            return unpack('<I', r.read(4))[0]
+
+    @staticmethod
+    def is_empty_archive(archive):
+        """
+        :return: True if archive has no members, read errors are raised
+        """
+        with tar_open(archive, 'r:gz') as tar:
+            return tar.next() is None
+
+    def _stream_test_results(self, remote_dir, include_masks, exclude_masks, local_dir):
+        """
+        Stream gzipped tar of test results from all hosts concurrently into local directory
+        :return: list of downloaded archives
+        """
+        started = time()
+        makedirs(local_dir, exist_ok=True)
+        commands = {}
+        levels = {}
+        for host in self.ssh.hosts:
+            levels[host] = self.get_compression_level(host)
+            commands[host] = (
+                self.get_archive_command(remote_dir, include_masks, exclude_masks, levels[host]),
+                join(local_dir, '%s%s' % (host, self.archive_name)),
+            )
+        self.log_print("Stream results from %s ..." % remote_dir)
+        results = self.ssh.exec_to_files_timed(commands)
+
+        archives = []
+        total_size = 0
+        for host, (written, elapsed) in results.items():
+            archive = commands[host][1]
+            if not written:
+                if isfile(archive):
+                    remove(archive)
+                continue
+            raw_size = self.get_raw_size(archive)
+            # throughput of each host is measured by its own transfer time
+            self.throughput[host] = (self.throughput.get(host, []) + [
+                (levels[host], raw_size / max(elapsed, 0.001))])[-2:]
+            try:
+                if self.is_empty_archive(archive):
+                    remove(archive)
+                    continue
+            except (TarError, EOFError, OSError) as e:
+                # partial archive still may be unpacked, so it is kept
+                self.log_print("WARN: archive %s from host %s is damaged: %s" % (archive, host, e), color='red')
+            total_size += written
+            archives.append(archive)
+        if archives:
+            self.log_put("Downloaded %s bytes in %s sec" % (total_size, int(time() - started)))
+            self.log_print()
+        return archives
+
+    @staticmethod
+    def _unpack(archive):
+        if archive.endswith('.zip'):
+            extract_dir = archive[:-len('.zip')]
+            makedirs(extract_dir, exist_ok=True)
+            with ZipFile(archive, "r") as old_zip:
+                old_zip.extractall(extract_dir)
+        elif archive.endswith('.tar.gz'):
+            extract_dir = archive[:-len('.tar.gz')]
+            makedirs(extract_dir, exist_ok=True)
+            try:
+                with tar_open(archive, 'r:gz') as tar:
+                    tar.extractall(extract_dir)
+            except (TarError, EOFError, OSError) as e:
+                return '%s: %s' % (archive, e)
+        return None
+
+    def _unpack_archives(self, archives):
+        if not archives:
+            return
+        pool = ThreadPool(min(len(archives), self.ssh.threads_num))
+        errors = [error for error in pool.map(self._unpack, archives) if error]
+        pool.close()
+        pool.join()
+        for error in errors:
+            self.log_print("WARN: unable to unpack %s" % error, color='red')
+
     def _collect_test_results(self, remote_dir, include_masks, exclude_masks, local_dir):
         """
         Execute remote commands and download results
@@ -110,14 +294,22 @@ class TestResultsCollector(TidenPlugin):
         :param local_dir: ... and download archives to this local directory
         :return:
         """
-        started = time()
-        self.log_print("Execute remote commands in %s ..." % remote_dir)
-
         if type(include_masks) != type([]):
             include_masks = list(include_masks)
         if type(exclude_masks) != type([]):
             exclude_masks = list(exclude_masks)
 
+        if self.stream:
+            archives = self._stream_test_results(remote_dir, include_masks, exclude_masks, local_dir)
+            if not archives:
+                self.log_print("WARN: Nothing found to download", color='red')
+            elif self.unpack_logs:
+                self._unpack_archives(archives)
+            return
+
+        started = time()
+        self.log_print("Execute remote commands in %s ..." % remote_dir)
+
         include_mask = ' '.join(include_masks)
         exclude_mask = ' '.join(exclude_masks)
 
@@ -160,12 +352,7 @@ class TestResultsCollector(TidenPlugin):
 
             if self.unpack_logs:
                 log_dir = self.scope.scoped_local_dir(self.config)
-                for file in listdir(log_dir):
-                    full_path = "%s/%s" % (log_dir, file)
-                    if isfile(full_path) and full_path.endswith('.zip'):
-                        extract_dir = join(log_dir, file.replace('.zip', ''))
-                        with ZipFile(full_path, "r") as old_zip:
-                            makedirs(extract_dir, exist_ok=True)
-                            old_zip.extractall(extract_dir)
+                self._unpack_archives([join(log_dir, file) for file in listdir(log_dir)
+                                       if isfile(join(log_dir, file)) and file.endswith('.zip')])
         else:
             self.log_print("WARN: Nothing found to download", color='red')
@@ -19,6 +19,7 @@ from tiden.zabbix_api import ZabbixApi
 from tiden.util import get_host_list, print_red
 
 from datetime import datetime
+from os import path
 
 TIDEN_PLUGIN_VERSION = '1.0.0'
 
@@ -61,7 +62,12 @@ class Zabbix(TidenPlugin):
             self.url = self.options.get('url')
             self.login = self.options.get('login')
             self.passwd = self.options.get('password')
-            self.zabbix_api = ZabbixApi(self.url, self.login, self.passwd)
+            item_cache_path = self.options.get('item_cache')
+            if item_cache_path is None and self.config.get('var_dir'):
+                item_cache_path = path.join(self.config['var_dir'], 'zabbix_items.json')
+            self.zabbix_api = ZabbixApi(self.url, self.login, self.passwd,
+                                        item_cache_path=item_cache_path,
+                                        history_threads=self.options.get('history_threads'))
         else:
             raise ZabbixException('Zabbix credentials have not found in zabbix plugin configuration. %s' % check_msg)
 
@@ -91,6 +97,9 @@ class Zabbix(TidenPlugin):
         stop_time = datetime.now()
         self.collect_metrics(self.start_time, stop_time)
 
+    def after_tests_run(self, *args, **kwargs):
+        self.zabbix_api.close()
+
     def collect_metrics(self, start_time, end_time):
         # TODO: replace this with method that knows all hosts
         hosts = get_host_list(self.config['environment']['server_hosts'],
@@ -202,6 +202,17 @@ class Result:
 
         self.update_xunit()
 
+    def add_test_metrics(self, name, metrics, test=None):
+        """
+        Attach metrics summary to test result.
+        :param name: metrics group name, e.g. 'host'
+        :param metrics: metrics summary
+        :param test: test name, default is current test
+        """
+        test = test if test is not None else self.current_test
+        if test in self.tests:
+            self.tests[test].setdefault('metrics', {})[name] = metrics
+
     def update_xunit(self):
         if self.xunit is not None:
             for xunit_status, status in zip(
@@ -22,6 +22,7 @@ from os import path, mkdir, listdir
 from os.path import isdir, join, exists, basename
 from re import search
 from shutil import rmtree
+from uuid import uuid4
 
 import yaml
 
@@ -238,30 +239,48 @@ def setup_test_environment(config):
 
 
 def init_remote_hosts(ssh_pool, config):
-    # Print available disk space
-    total_space, min_space = ssh_pool.available_space()
-    log_print('Available space: total {} GB, min {}'.format(total_space, min_space),
-              color='red' if isinstance(min_space, set) else 'info')
+    """
+    Bootstrap remote hosts with a single script per host executed on all hosts concurrently:
+    move data to be cleaned up aside and delete it in background, make remote directories, report disk space.
+    Removal of huge work directories left by previous runs does not block the new run.
+    :param ssh_pool:
+    :param config:
+    :return:
+    """
+    home = str(config['environment']['home'])
+    script = []
 
     # clean tests space
+    clean_items = None
     if config['clean'] == 'all':
-        clean_remote_path = '{}/*'.format(config['environment']['home'])
-        log_print('Clean up {} on remote hosts'.format(clean_remote_path))
-        cmd = 'rm -rvf {}'.format(clean_remote_path)
-        ssh_pool.exec([cmd])
-        total_space, min_space = ssh_pool.available_space()
-        log_print('Available space after clean up: total {} GB, min {} GB'.format(total_space, min_space))
+        log_print('Clean up {}/* on remote hosts'.format(home))
+        clean_items = '{}/*'.format(home)
     elif config['clean'] == 'tests' or config['clean'] == 'remote_tests':
         log_print('Clean up tests data on remote hosts')
-        cmd = "cd {} && ls | grep -E '^.+-.+?' | xargs rm -rf".format(config['environment']['home'])
-        ssh_pool.exec([cmd])
-        total_space, min_space = ssh_pool.available_space()
-        log_print('Available space after clean up: total {} GB, min {} GB'.format(total_space, min_space))
+        clean_items = "$(cd {} && ls | grep -E '^.+-.+?' | sed 's|^|{}/|')".format(home, home)
+    if clean_items:
+        # trash directory must be on the same filesystem as home to make moving to trash a cheap rename:
+        # prefer sibling of home directory, fallback to hidden directory inside home
+        trash_name = '.tiden-trash-{}'.format(uuid4().hex[:8])
+        script.append(
+            'trash={home}{trash_name}; mkdir -p $trash 2>/dev/null; '
+            'if [ "$(df -P {home} | tail -1 | cut -d" " -f1)" != "$(df -P $trash | tail -1 | cut -d" " -f1)" ]; then '
+            'rmdir $trash; trash={home}/{trash_name}; mkdir -p $trash; '
+            'fi; '
+            'for item in {items}; do [ -e "$item" ] && mv "$item" $trash/; done; '
+            '(nohup rm -rf $trash > /dev/null 2>&1 < /dev/null &)'.format(
+                home=home, trash_name=trash_name, items=clean_items))
 
     # Make suite remote directory
     for remote_dir in config['remote'].values():
         log_print('Make remote directory %s' % remote_dir)
-        ssh_pool.exec(['mkdir -p %s' % remote_dir])
+    script.append('mkdir -p {} > /dev/null 2>&1'.format(' '.join(config['remote'].values())))
+
+    # Print available disk space
+    script.append('df -l')
+    total_space, min_space = ssh_pool.parse_available_space(ssh_pool.exec(['; '.join(script)]))
+    log_print('Available space: total {} GB, min {}'.format(total_space, min_space),
+              color='red' if isinstance(min_space, set) else 'info')
 
 
 def skip_process_termination(ssh_pool, config):
@@ -300,8 +319,10 @@ def upload_artifacts(ssh_pool, config, remote_unzip_files):
     else:
         log_print('Nothing found for upload')
 
-    log_print('Remote unzip artifacts')
-    ssh_pool.exec(remote_unzip_files)
+    if remote_unzip_files:
+        log_print('Remote unzip artifacts')
+        # all archives are extracted concurrently by single command per host
+        ssh_pool.exec([' '.join(['(%s) &' % cmd for cmd in remote_unzip_files]) + ' wait'])
 
 
 def known_issue_str(know_issue):
@@ -14,24 +14,31 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import tarfile
+from glob import glob
 from hashlib import md5
 from multiprocessing.dummy import Pool as ThreadPool
-from time import sleep
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import sleep, time
 
 from paramiko import AutoAddPolicy, SSHClient, SSHException
 from paramiko.buffered_pipe import PipeTimeout
 import socket
 from re import search, split
 from .util import log_print, log_put, log_add, get_logger
-from os import path
+from os import path, stat
 from .tidenexception import RemoteOperationTimeout,TidenException
+from .tracing import Tracer
 from random import choice
+from uuid import uuid4
 
 
 class AbstractSshPool:
     def __init__(self, ssh_config=None, **kwargs):
         self.config = ssh_config if ssh_config is not None else {}
         self.hosts = self.config.get('hosts', [])
+        self.tracer = Tracer()
 
     def get_random_host(self):
         return choice(self.hosts)
@@ -54,6 +61,12 @@ class AbstractSshPool:
     def exec_on_host(self, host, commands, **kwargs):
         raise NotImplementedError
 
+    def exec_to_files(self, commands, **kwargs):
+        raise NotImplementedError
+
+    def exec_to_files_timed(self, commands, **kwargs):
+        raise NotImplementedError
+
     def jps(self, jps_args=None, hosts=None, skip_reserved_java_processes=True):
         raise NotImplementedError
 
@@ -66,6 +79,9 @@ class AbstractSshPool:
     def not_uploaded(self, files, remote_path):
         raise NotImplementedError
 
+    def deploy_resources(self, resource_dir, remote_path, hosts=None):
+        raise NotImplementedError
+
     def killall(self, name, sig=-9, skip_reserved_java_processes=True, hosts=None):
         raise NotImplementedError
 
@@ -86,6 +102,9 @@ class SshPool(AbstractSshPool):
         if self.retries is None:
             self.retries = 3
         self.clients = {}
+        # {host: {remote_path: {file name: md5}}} of resources found or deployed by last deploy_resources
+        self.resources_manifest = {}
+        self._local_md5 = {}
 
         self.trace_info()
 
@@ -101,14 +120,23 @@ class SshPool(AbstractSshPool):
         calculate available disk space per host
         :return:
         """
+        return self.parse_available_space(self.exec(['df -l']))
+
+    def parse_available_space(self, results):
+        """
+        calculate available disk space per host from `df -l` output
+        :param results: exec results, last output of each host must contain `df -l` output
+        :return:
+        """
         total_size = 0
         min_size = None
         threshold = 10
         problem_hosts = set()
         to_gb = lambda x: int(int(x) / 1048576)
-        results = self.exec(['df -l'])
         for host in results.keys():
-            lines = results[host][0]
+            if not results[host]:
+                continue
+            lines = results[host][-1]
             for line in lines.split('\n'):
                 storage_items = split('\s+', line)
                 if len(storage_items) == 6:
@@ -203,8 +231,9 @@ class SshPool(AbstractSshPool):
 
     def download_from_host(self, host, remote_path, local_path):
         try:
-            sftp = self.clients.get(host).open_sftp()
-            sftp.get(remote_path, local_path)
+            with self.tracer.span('download', cat='ssh', host=host, command=remote_path):
+                sftp = self.clients.get(host).open_sftp()
+                sftp.get(remote_path, local_path)
         except SSHException as e:
             print(str(e))
 
@@ -246,6 +275,9 @@ class SshPool(AbstractSshPool):
         Execute the list of commands on the particular host
         :param host:        host or ip address
         :param commands:    the command or the list of commands
+        :param kwargs:
+            timeout - (optional) seconds per command
+            on_line - (optional) callback(host, line) to stream output lines while command is running
         :return:            dictionary:
             <host>: [ <string containing the output of executed commands>, ... ]
         """
@@ -266,14 +298,18 @@ class SshPool(AbstractSshPool):
                     command = f"{env_vars}{command}"
                 # TODO we should handle stderr
                 get_logger('ssh_pool').debug(f'{host} >> {command}')
-                stdin, stdout, stderr = client.exec_command(command, timeout=timeout)
-                command_output = ''
-                for line in stdout:
-                    if line.strip() != '':
-                        command_output += line
-                for line in stderr:
-                    if line.strip() != '':
-                        command_output += line
+                with self.tracer.span('exec', cat='ssh', host=host, command=command) as span:
+                    stdin, stdout, stderr = client.exec_command(command, timeout=timeout)
+                    command_output = ''
+                    for line in stdout:
+                        if line.strip() != '':
+                            command_output += line
+                            if kwargs.get('on_line'):
+                                kwargs['on_line'](host, line.rstrip('\n'))
+                    for line in stderr:
+                        if line.strip() != '':
+                            command_output += line
+                    span['bytes'] = len(command_output)
                 output.append(command_output)
                 formatted_output = ''.join(output).encode('utf-8')
                 get_logger('ssh_pool').debug(f'{host} << {formatted_output}')
@@ -297,6 +333,64 @@ class SshPool(AbstractSshPool):
                                              f'{command}')
         return {host: output}
 
+    def exec_to_files(self, commands, **kwargs):
+        """
+        Execute command on hosts concurrently streaming its standard output to local files.
+        :param commands: {host: (command, local file path)}
+        :return: {host: number of bytes written or None if command failed}
+        """
+        return {host: written for host, (written, _) in self.exec_to_files_timed(commands, **kwargs).items()}
+
+    def exec_to_files_timed(self, commands, **kwargs):
+        """
+        Same as `exec_to_files`, but also report how long each host transfer took.
+        :return: {host: (number of bytes written or None if command failed, seconds)}
+        """
+        from functools import partial
+        pool = ThreadPool(self.threads_num)
+        raw_results = pool.starmap(partial(self.exec_to_file_on_host, **kwargs),
+                                   [(host, command, local_file) for host, (command, local_file) in commands.items()])
+        pool.close()
+        pool.join()
+        return dict(zip(commands.keys(), raw_results))
+
+    def exec_to_file_on_host(self, host, command, local_file, **kwargs):
+        """
+        Execute command on host and write its binary standard output to local file as it is received.
+        Standard error is discarded.
+        :return: (number of bytes written or None if command failed, seconds)
+        """
+        started = time()
+        client = self.clients[host]
+        timeout = kwargs.get('timeout', int(self.config['default_timeout']))
+        # unread stderr would stall the channel
+        command = '%s 2>/dev/null' % command
+        get_logger('ssh_pool').debug(f'{host} >> {command} > {local_file}')
+        try:
+            with self.tracer.span('exec_to_file', cat='ssh', host=host, command=command) as span:
+                stdin, stdout, stderr = client.exec_command(command, timeout=timeout)
+                written = 0
+                with open(local_file, 'wb') as w:
+                    while True:
+                        chunk = stdout.read(1 << 20)
+                        if not chunk:
+                            break
+                        w.write(chunk)
+                        written += len(chunk)
+                span['bytes'] = written
+                exit_code = stdout.channel.recv_exit_status()
+        except (PipeTimeout, socket.timeout) as e:
+            raise RemoteOperationTimeout(f'Timeout {timeout} reached while executing command:\n'
+                                         f'Host: {host}\n'
+                                         f'{command}')
+        except SSHException as e:
+            get_logger('ssh_pool').error(f'{host}: {e}')
+            return None, time() - started
+        if exit_code != 0:
+            get_logger('ssh_pool').error(f'{host}: command exited with code {exit_code}: {command}')
+            return None, time() - started
+        return written, time() - started
+
     @staticmethod
     def _reserved_java_processes():
         """
@@ -440,28 +534,166 @@ class SshPool(AbstractSshPool):
         pool.join()
 
     def not_uploaded(self, files, remote_path):
+        if not files:
+            return []
+        remote_files = ' '.join(["%s/%s" % (remote_path, path.basename(file)) for file in files])
+        results = self.exec(['md5sum %s' % remote_files])
+        remote_md5 = {}
+        for host in results.keys():
+            remote_md5[host] = {}
+            for output in results[host]:
+                for line in output.splitlines():
+                    m = search('^([0-9a-f]{32})\\s+(.+)$', line)
+                    if m:
+                        remote_md5[host][path.basename(m.group(2))] = m.group(1)
         outdated = []
         for file in files:
             file_name = path.basename(file)
-            local_md5 = md5(open(file, 'rb').read()).hexdigest()
-            remote_file = "%s/%s" % (remote_path, file_name)
-            results = self.exec(['md5sum %s' % remote_file])
-            matched_count = 0
-            for host in results.keys():
-                if len(results[host]) > 0:
-                    if '%s ' % local_md5 in results[host][0]:
-                        matched_count += 1
+            with open(file, 'rb') as r:
+                local_md5 = md5(r.read()).hexdigest()
+            matched_count = len([host for host in remote_md5.keys() if remote_md5[host].get(file_name) == local_md5])
             if matched_count < len(results.keys()):
                 outdated.append(file)
         return outdated
 
+    def deploy_resources(self, resource_dir, remote_path, hosts=None):
+        """
+        Upload files of local resource directory that are new or changed on remote hosts.
+
+        Remote directory is checked with single md5sum call per host on every deployment, so files removed or edited
+        on hosts since previous deployment are uploaded again. Changed files are bundled into one archive per distinct
+        change set and extracted by single command per host.
+        :param resource_dir: local directory
+        :param remote_path: remote directory
+        :param hosts: hosts to deploy to (default all hosts of the pool)
+        :return: dictionary {host: [<uploaded file name>, ...]}
+        """
+        if hosts is None:
+            hosts = self.hosts
+        files = {}
+        for file in sorted(glob("%s/*" % resource_dir)):
+            if path.isfile(file):
+                files[path.basename(file)] = file
+        if not files:
+            return {}
+        local_md5 = {file_name: self._get_local_md5(file) for file_name, file in files.items()}
+
+        results = self.exec({host: ['md5sum %s/*' % remote_path] for host in hosts})
+        for host in hosts:
+            self.resources_manifest.setdefault(host, {})[remote_path] = self._parse_md5sum(results.get(host, []))
+
+        changed_for_hosts = {}
+        for host in hosts:
+            deployed = self.resources_manifest[host][remote_path]
+            changed = tuple(file_name for file_name in files.keys() if deployed.get(file_name) != local_md5[file_name])
+            if changed:
+                changed_for_hosts.setdefault(changed, []).append(host)
+
+        uploaded = {}
+        for changed, changed_hosts in changed_for_hosts.items():
+            get_logger('ssh_pool').debug('deploy resources to %s on hosts %s: %s' % (
+                remote_path, ', '.join(changed_hosts), ', '.join(changed)))
+            try:
+                if len(changed) == 1:
+                    self.upload_for_hosts(changed_hosts, [files[changed[0]]], remote_path)
+                    failed_hosts = []
+                else:
+                    failed_hosts = self._deploy_archive(changed_hosts, [files[file_name] for file_name in changed],
+                                                        remote_path)
+                # upload errors are only logged by upload_on_host, so deployed files are checked
+                failed_hosts = set(failed_hosts) | set(self._not_deployed(
+                    changed_hosts, {file_name: local_md5[file_name] for file_name in changed}, remote_path))
+            except Exception:
+                for host in changed_hosts:
+                    self.resources_manifest[host].pop(remote_path, None)
+                raise
+            for host in changed_hosts:
+                if host in failed_hosts:
+                    # unknown state, check remote directory on next deployment
+                    self.resources_manifest[host].pop(remote_path, None)
+                    continue
+                self.resources_manifest[host][remote_path].update({
+                    file_name: local_md5[file_name] for file_name in changed
+                })
+                uploaded[host] = list(changed)
+        return uploaded
+
+    @staticmethod
+    def _parse_md5sum(outputs):
+        """
+        :return: {file name: md5} from md5sum outputs
+        """
+        remote_md5 = {}
+        for output in outputs:
+            for line in output.splitlines():
+                m = search('^([0-9a-f]{32})\\s+(.+)$', line)
+                if m:
+                    remote_md5[path.basename(m.group(2))] = m.group(1)
+        return remote_md5
+
+    def _not_deployed(self, hosts, files_md5, remote_path):
+        """
+        Check md5 of deployed files by single call per host.
+        :param files_md5: {file name: expected md5}
+        :return: list of hosts where some of files differ
+        """
+        results = self.exec({
+            host: ['md5sum %s' % ' '.join(['%s/%s' % (remote_path, file_name) for file_name in sorted(files_md5)])]
+            for host in hosts
+        })
+        failed_hosts = []
+        for host in hosts:
+            remote_md5 = self._parse_md5sum(results.get(host, []))
+            if any([remote_md5.get(file_name) != file_md5 for file_name, file_md5 in files_md5.items()]):
+                log_print('Resources are not deployed to %s on host %s' % (remote_path, host), color='red')
+                failed_hosts.append(host)
+        return failed_hosts
+
+    def _deploy_archive(self, hosts, files, remote_path):
+        """
+        Upload files as single gzipped tar archive and extract it on hosts.
+        :return: list of hosts where extraction has failed
+        """
+        archive_name = 'tiden-resources-%s.tar.gz' % uuid4().hex[:8]
+        tmp_dir = mkdtemp()
+        try:
+            archive_path = path.join(tmp_dir, archive_name)
+            with tarfile.open(archive_path, 'w:gz') as tar:
+                for file in files:
+                    tar.add(file, arcname=path.basename(file))
+            self.upload_for_hosts(hosts, [archive_path], remote_path)
+        finally:
+            rmtree(tmp_dir, ignore_errors=True)
+        results = self.exec({
+            host: ['cd %s && tar -xzf %s && rm -f %s && echo %s' % (remote_path, archive_name, archive_name, 'Extracted')]
+            for host in hosts
+        })
+        failed_hosts = []
+        for host in hosts:
+            output = ''.join(results.get(host, []))
+            if 'Extracted' not in output:
+                log_print('Unable to extract resources on host %s: %s' % (host, output), color='red')
+                failed_hosts.append(host)
+        return failed_hosts
+
+    def _get_local_md5(self, file):
+        file_stat = stat(file)
+        cached = self._local_md5.get(file)
+        if cached and cached[0] == file_stat.st_mtime and cached[1] == file_stat.st_size:
+            return cached[2]
+        with open(file, 'rb') as r:
+            file_md5 = md5(r.read()).hexdigest()
+        self._local_md5[file] = (file_stat.st_mtime, file_stat.st_size, file_md5)
+        return file_md5
+
     def upload_on_host(self, host, files, remote_dir):
         try:
             sftp = self.clients.get(host).open_sftp()
             for local_file in files:
                 remote_path = remote_dir + '/' + path.basename(local_file)
                 get_logger('ssh_pool').debug('sftp_put on host %s: %s -> %s' % (host, local_file, remote_path))
-                sftp.put(local_file, remote_path)
+                with self.tracer.span('upload', cat='ssh', host=host, command=remote_path) as span:
+                    span['bytes'] = sftp.put(local_file, remote_path).st_size
         except SSHException as e:
             print(str(e))
 
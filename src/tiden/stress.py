@@ -21,6 +21,9 @@ class StressT:
     fio_path = ''
     default_timeout = 100000
 
+    # network device for tc netem
+    network_device = 'p2p1'
+
     def __init__(self, ssh):
         self.ssh = ssh
 
@@ -89,10 +92,12 @@ class StressT:
         :param host: host for io load
         :return: result of fio run command
         """
-        fio_command = 'fio --name=test --rw=randrw --rwmixread=20 --size=20g --direct=1 ' \
-                      '--runtime=%s --ioengine=libaio --iodepth=4 --numjobs=32 ' \
-                      '--directory="%s" --filename=io.test.file >%s/fio_log.log 2>&1 &' % (timeout, path, path)
-        return self.ssh.exec_on_host(host, [fio_command])
+        return self.ssh.exec_on_host(host, [self.get_fio_command(timeout, path)])
+
+    def get_fio_command(self, timeout, path, rw='randrw', rwmixread=20):
+        return 'fio --name=test --rw=%s --rwmixread=%s --size=20g --direct=1 ' \
+               '--runtime=%s --ioengine=libaio --iodepth=4 --numjobs=32 ' \
+               '--directory="%s" --filename=io.test.file >%s/fio_log.log 2>&1 &' % (rw, rwmixread, timeout, path, path)
 
     def fio_stop(self, timeout, path, host):
         """
@@ -102,10 +107,7 @@ class StressT:
         :param host: host for io load
         :return: result of fio run command
         """
-        fio_command = 'fio --name=test --rw=randwrite --rwmixread=0 --size=20g --direct=1 ' \
-                      '--runtime=%s --ioengine=libaio --iodepth=4 --numjobs=32 ' \
-                      '--directory="%s" --filename=io.test.file >%s/fio_log.log 2>&1 &' % (timeout, path, path)
-        return self.ssh.exec_on_host(host, [fio_command])
+        return self.ssh.exec_on_host(host, [self.get_fio_command(timeout, path, rw='randwrite', rwmixread=0)])
 
     def fio_rm_file(self, path, host):
         """
@@ -114,8 +116,10 @@ class StressT:
         :param host: host for delete file after io
         :return: result of delete fio file
         """
-        fio_delete = 'rm %s/io.test.file' % path
-        return self.ssh.exec_on_host(host, [fio_delete])
+        return self.ssh.exec_on_host(host, [self.get_fio_rm_file_command(path)])
+
+    def get_fio_rm_file_command(self, path):
+        return 'rm %s/io.test.file' % path
 
     def load_disk(self, path, host, **kwargs):
         """
@@ -190,31 +194,34 @@ class StressT:
         timeout = kwargs.get('timeout', self.default_timeout)
         lost_rate = kwargs.get('lost_rate', '5.0%')
 
-        tc_root = 'sudo tc qdisc add dev p2p1 root handle 1: prio'
-        tc_parent = 'sudo tc qdisc add dev p2p1 parent 1:3 handle 30: netem %s %s' % (kwargs['type'], lost_rate)
-        tc_filter = 'sudo tc filter add dev p2p1 protocol ip parent 1:0 prio 3 u32 match ip dst %s/32 flowid 1:3' \
-                    % dest_host
-        self.ssh.exec_on_host(host, [tc_root])
-        self.ssh.exec_on_host(host, [tc_parent])
-        self.ssh.exec_on_host(host, [tc_filter])
+        for tc_command in self.get_netem_commands(dest_host, kwargs['type'], lost_rate):
+            self.ssh.exec_on_host(host, [tc_command])
         util_sleep_for_a_while(timeout, msg='Emulate network troubles for')
-        tc_stop = 'sudo tc qdisc delete dev p2p1 root'
-        self.ssh.exec_on_host(host, [tc_stop])
+        self.ssh.exec_on_host(host, [self.get_netem_rollback_command()])
 
     def network_emulate_packet_loss(self, host, dest_host, **kwargs):
         lost_rate = kwargs.get('lost_rate', '100.0%')
         trouble_type = kwargs.get('type', 'loss')
-        tc_root = 'sudo tc qdisc add dev p2p1 root handle 1: prio'
-        tc_parent = 'sudo tc qdisc add dev p2p1 parent 1:3 handle 30: netem %s %s' % (trouble_type, lost_rate)
-        tc_filter = 'sudo tc filter add dev p2p1 protocol ip parent 1:0 prio 3 u32 match ip dst %s/32 flowid 1:3' \
-                    % dest_host
-        self.ssh.exec_on_host(host, [tc_root])
-        self.ssh.exec_on_host(host, [tc_parent])
-        self.ssh.exec_on_host(host, [tc_filter])
+        for tc_command in self.get_netem_commands(dest_host, trouble_type, lost_rate):
+            self.ssh.exec_on_host(host, [tc_command])
 
     def network_emulate_packet_loss_rollback(self, host):
-        tc_stop = 'sudo tc qdisc delete dev p2p1 root'
-        self.ssh.exec_on_host(host, [tc_stop])
+        self.ssh.exec_on_host(host, [self.get_netem_rollback_command()])
+
+    def get_netem_commands(self, dest_host, trouble_type, lost_rate, dev=None):
+        """
+        :return: list of tc commands to lost/dublicate/corrupt network packets sent to dest_host
+        """
+        dev = dev or self.network_device
+        return [
+            'sudo tc qdisc add dev %s root handle 1: prio' % dev,
+            'sudo tc qdisc add dev %s parent 1:3 handle 30: netem %s %s' % (dev, trouble_type, lost_rate),
+            'sudo tc filter add dev %s protocol ip parent 1:0 prio 3 u32 match ip dst %s/32 flowid 1:3'
+            % (dev, dest_host),
+        ]
+
+    def get_netem_rollback_command(self, dev=None):
+        return 'sudo tc qdisc delete dev %s root' % (dev or self.network_device)
 
     def iperf_start_server(self, timeout, host):
         """
@@ -254,8 +261,10 @@ class StressT:
         :param cpu: count of cpu used
         :return: result of ssh call stress
         """
-        stress_cpu = 'stress --cpu %s -t %s' % (cpu, timeout)
-        return self.ssh.exec_on_host(host, [stress_cpu])
+        return self.ssh.exec_on_host(host, [self.get_stress_cpu_command(timeout, cpu)])
+
+    def get_stress_cpu_command(self, timeout, cpu):
+        return 'stress --cpu %s -t %s' % (cpu, timeout)
 
     def stress_load_ram(self, timeout, host, ram):
         """
@@ -265,6 +274,8 @@ class StressT:
         :param ram: count of ram used (in bytes)
         :return: result of ssh call stress
         """
-        stress_ram = 'stress --vm-bytes %sk --vm-keep -m 16 -t %s' % (ram, timeout)
-        return self.ssh.exec_on_host(host, [stress_ram])
+        return self.ssh.exec_on_host(host, [self.get_stress_ram_command(timeout, ram)])
+
+    def get_stress_ram_command(self, timeout, ram):
+        return 'stress --vm-bytes %sk --vm-keep -m 16 -t %s' % (ram, timeout)
 
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict
+from hashlib import md5
+from os import path, stat
+from pickle import PicklingError, dumps
+from threading import Lock
+
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, TemplateNotFound, meta
+
+from .logger import get_logger
+from .singleton import singleton
+
+
+@singleton
+class TemplateEngine:
+    """
+    Shared Jinja2 engine for configuration templates.
+
+    One environment is kept per templates directory, so compiled templates are reused until template file
+    mtime changes; compiled bytecode is also cached on disk between runs. Rendered text is memoized by mtimes of
+    template and templates it includes, extends or imports and by digest of variables, so same config rendered for
+    many config sets is not rendered again. Only variables used by templates are accounted in memo key.
+    """
+
+    render_cache_size = 256
+
+    def __init__(self):
+        self.bytecode_cache = None
+        self.environments = {}
+        self.rendered = OrderedDict()
+        # {(template path, mtime, size): (names of templates referenced by template, names of used variables)}
+        self.references = {}
+        self._lock = Lock()
+
+    def configure(self, config):
+        """
+        :param config: tiden config, `template_cache_dir` sets directory for compiled templates bytecode,
+            user temporary directory is used by default
+        """
+        cache_dir = config.get('template_cache_dir')
+        with self._lock:
+            self.bytecode_cache = FileSystemBytecodeCache(cache_dir) if cache_dir else None
+            self.environments = {}
+            self.rendered.clear()
+            self.references = {}
+        return self
+
+    def get_environment(self, templates_dir):
+        templates_dir = path.abspath(templates_dir)
+        with self._lock:
+            env = self.environments.get(templates_dir)
+            if env is None:
+                if self.bytecode_cache is None:
+                    self.bytecode_cache = FileSystemBytecodeCache()
+                env = Environment(loader=FileSystemLoader(templates_dir),
+                                  trim_blocks=True,
+                                  auto_reload=True,
+                                  bytecode_cache=self.bytecode_cache)
+                self.environments[templates_dir] = env
+            return env
+
+    def render(self, templates_dir, template_name, variables):
+        """
+        Render template from templates directory.
+        :param templates_dir: directory with templates
+        :param template_name: template file name relative to templates directory
+        :param variables: dictionary of template variables
+        :return: rendered text
+        """
+        key = self._render_key(templates_dir, template_name, variables)
+        if key is not None:
+            with self._lock:
+                rendered_string = self.rendered.get(key)
+                if rendered_string is not None:
+                    self.rendered.move_to_end(key)
+                    return rendered_string
+
+        rendered_string = self.get_environment(templates_dir).get_template(template_name).render(variables)
+
+        if key is not None:
+            with self._lock:
+                self.rendered[key] = rendered_string
+                while len(self.rendered) > self.render_cache_size:
+                    self.rendered.popitem(last=False)
+        return rendered_string
+
+    def _render_key(self, templates_dir, template_name, variables):
+        dependencies = self._get_dependencies(self.get_environment(templates_dir), template_name, set())
+        if dependencies is None:
+            return None
+        templates, names = dependencies
+        # only variables used by templates are accounted, pickle keeps types (int vs str keys, tuple vs list)
+        used_variables = [(name, variables[name]) for name in sorted(names) if name in variables]
+        try:
+            variables_digest = md5(dumps(used_variables, protocol=4)).hexdigest()
+        except (PicklingError, TypeError, AttributeError) as e:
+            get_logger('tiden').debug('Template %s variables can not be pickled, render is not memoized: %s' % (
+                template_name, e))
+            return None
+        return tuple(templates), variables_digest
+
+    def _get_dependencies(self, env, template_name, seen):
+        """
+        :return: (list of (path, mtime, size) of template and all templates it references,
+                  set of variable names used by these templates)
+            or None if template is not a plain file or references are not resolvable statically
+        """
+        if template_name in seen:
+            return [], set()
+        seen.add(template_name)
+        try:
+            template_path = path.abspath(env.loader.get_source(env, template_name)[1])
+            template_stat = stat(template_path)
+        except (OSError, TemplateNotFound):
+            return None
+        template_key = (template_path, template_stat.st_mtime, template_stat.st_size)
+        with self._lock:
+            parsed = self.references.get(template_key)
+        if parsed is None:
+            with open(template_path) as r:
+                template_ast = env.parse(r.read())
+            parsed = (list(meta.find_referenced_templates(template_ast)), meta.find_undeclared_variables(template_ast))
+            with self._lock:
+                self.references[template_key] = parsed
+        references, names = parsed
+        templates = [template_key]
+        names = set(names)
+        for reference in references:
+            if reference is None:
+                # template name is computed at render time
+                return None
+            reference_dependencies = self._get_dependencies(env, reference, seen)
+            if reference_dependencies is None:
+                return None
+            templates.extend(reference_dependencies[0])
+            names |= reference_dependencies[1]
+        return templates, names
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import ast
+from glob import glob
+from os import path, stat, replace
+
+from yaml import YAMLError
+
+from .util import load_yaml, save_yaml, get_logger
+
+TIDEN_PLUGINS_INDEX = 'plugins_index.yaml'
+
+
+class PluginIndex:
+    """
+    Persistent index of plugin modules found in plugin paths.
+
+    For every module file the index stores its mtime and size together with plugin classes declared in it:
+    class name, TIDEN_PLUGIN_VERSION and names of hooks overridden by the class. Module files are parsed
+    only when their mtime or size has changed since the previous scan, nothing is imported here.
+    """
+
+    # bump when format of entries changes, stale index is discarded then
+    index_version = 1
+
+    plugin_base_class = 'TidenPlugin'
+
+    version_constant = 'TIDEN_PLUGIN_VERSION'
+
+    def __init__(self, index_path=None):
+        self.index_path = index_path
+        self.files = {}
+        self.parsed_files = []
+        self.changed = False
+        self.load()
+
+    def load(self):
+        if not self.index_path:
+            return
+        try:
+            data = load_yaml(self.index_path)
+        except (YAMLError, OSError) as e:
+            get_logger('tiden').debug('Unable to read plugins index %s: %s' % (self.index_path, e))
+            data = {}
+        if isinstance(data, dict) and data.get('version') == self.index_version:
+            self.files = data.get('files', {})
+
+    def save(self):
+        if not self.index_path or not self.changed:
+            return
+        tmp_path = '%s.tmp' % self.index_path
+        try:
+            save_yaml(tmp_path, {'version': self.index_version, 'files': self.files})
+            replace(tmp_path, self.index_path)
+            self.changed = False
+        except OSError as e:
+            get_logger('tiden').debug('Unable to write plugins index %s: %s' % (self.index_path, e))
+
+    def scan(self, plugins_paths, ignore_files=()):
+        """
+        Refresh index for all modules in given plugin paths.
+        :param plugins_paths: list of directories to look for *.py plugin modules
+        :param ignore_files: base names or absolute paths of modules to skip
+        :return: dictionary of found plugins:
+            <class name>: {
+                'file': <module path>,
+                'class': <class name>,
+                'version': <TIDEN_PLUGIN_VERSION or None>,
+                'hooks': [<overridden hook name>, ...],
+            }
+        """
+        plugins = {}
+        seen_files = set()
+        for plugins_path in plugins_paths:
+            for plugin_file in sorted(glob(path.join(plugins_path, '*.py'))):
+                if path.basename(plugin_file) in ignore_files or path.abspath(plugin_file) in ignore_files:
+                    continue
+                seen_files.add(plugin_file)
+                for plugin in self.get_file_plugins(plugin_file):
+                    # modules from later plugin paths override earlier ones
+                    plugins[plugin['class']] = dict(plugin, file=plugin_file)
+
+        # forget removed modules of scanned paths
+        scanned_dirs = set(path.abspath(p) for p in plugins_paths)
+        for plugin_file in list(self.files.keys()):
+            if path.dirname(path.abspath(plugin_file)) in scanned_dirs and plugin_file not in seen_files:
+                del self.files[plugin_file]
+                self.changed = True
+        return plugins
+
+    def get_file_plugins(self, plugin_file):
+        try:
+            file_stat = stat(plugin_file)
+        except OSError:
+            return []
+        entry = self.files.get(plugin_file)
+        if entry and entry.get('mtime') == file_stat.st_mtime and entry.get('size') == file_stat.st_size:
+            return entry.get('plugins', [])
+
+        plugins = self.parse_module(plugin_file)
+        self.parsed_files.append(plugin_file)
+        self.files[plugin_file] = {
+            'mtime': file_stat.st_mtime,
+            'size': file_stat.st_size,
+            'plugins': plugins,
+        }
+        self.changed = True
+        return plugins
+
+    @classmethod
+    def parse_module(cls, plugin_file):
+        """
+        Find TidenPlugin subclasses in module source without importing it.
+        :param plugin_file: path to module
+        :return: list of {'class', 'version', 'hooks'} dictionaries
+        """
+        try:
+            with open(plugin_file, 'rb') as r:
+                tree = ast.parse(r.read(), filename=plugin_file)
+        except (SyntaxError, ValueError, OSError) as e:
+            get_logger('tiden').debug('Unable to parse plugin module %s: %s' % (plugin_file, e))
+            return []
+
+        from .tidenplugin import TidenPlugin
+        known_hooks = set(name for name in dir(TidenPlugin) if name.startswith(('before_', 'after_')))
+
+        version = None
+        plugins = []
+        for node in tree.body:
+            if isinstance(node, ast.Assign):
+                for target in node.targets:
+                    if isinstance(target, ast.Name) and target.id == cls.version_constant:
+                        # literal_eval handles both ast.Str (Python 3.7) and ast.Constant nodes
+                        try:
+                            version = str(ast.literal_eval(node.value))
+                        except ValueError:
+                            get_logger('tiden').debug('Plugin version in %s is not a literal' % plugin_file)
+            elif isinstance(node, ast.ClassDef):
+                base_names = [base.id if isinstance(base, ast.Name) else getattr(base, 'attr', None)
+                              for base in node.bases]
+                if cls.plugin_base_class not in base_names:
+                    continue
+                hooks = sorted(item.name for item in node.body
+                               if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef))
+                               and item.name in known_hooks)
+                plugins.append({'class': node.name, 'hooks': hooks})
+        for plugin in plugins:
+            plugin['version'] = version
+        return plugins
@@ -14,15 +14,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from glob import glob
 from importlib import machinery, util
 from os import path
-from re import search
 from itertools import chain
 
 from .tidenplugin import TidenPluginException
 from .util import log_print
 from .tidenfabric import TidenFabric
+from .tidenpluginindex import PluginIndex, TIDEN_PLUGINS_INDEX
+from .tracing import Tracer
 
 
 class PluginManager:
@@ -38,8 +38,13 @@ class PluginManager:
     def __init__(self, config):
         self.config = config
         self.plugins = {}
+        self.tracer = Tracer()
         hook_mgr = TidenFabric().get_hook_mgr()
         self.plugins_paths = list(chain(*hook_mgr.hook.tiden_get_plugins_path()))
+        index_path = None
+        if self.config.get('var_dir') and path.isdir(self.config['var_dir']):
+            index_path = path.join(self.config['var_dir'], self.config.get('plugins_index', TIDEN_PLUGINS_INDEX))
+        self.index = PluginIndex(index_path)
         self.__import()
 
     def set(self, **kwargs):
@@ -60,7 +65,14 @@ class PluginManager:
         for class_name in configured_plugins.keys():
             if not plugin_module_files.get(class_name):
                 raise TidenPluginException('Python module not found in plugins/* for configured plugin %s' % class_name)
-            plugin_file = plugin_module_files[class_name]
+            plugin_file = plugin_module_files[class_name]['file']
+            # Get plugin options from config
+            plugin_opts = configured_plugins[class_name]
+            # Don't import module at all when indexed version doesn't match
+            indexed_version = plugin_module_files[class_name].get('version')
+            if plugin_opts.get('version') and indexed_version is not None and \
+                    plugin_opts['version'] != indexed_version:
+                continue
             # Load module
             loader = machinery.SourceFileLoader(path.basename(plugin_file)[:-3], plugin_file)
             spec = util.spec_from_loader(loader.name, loader)
@@ -69,12 +81,11 @@ class PluginManager:
             preloaded_plugin_config = {
                 'file': plugin_file,
                 'class': class_name,
+                'hooks': plugin_module_files[class_name].get('hooks', []),
             }
             # Check mandatory constants in a plugin module
             for const in self.mandatory_constants:
                 preloaded_plugin_config[const] = getattr(plugin_module, const)
-            # Get plugin options from config
-            plugin_opts = configured_plugins[class_name]
             # Check version if needed
             if not plugin_opts.get('version') or \
                     plugin_opts['version'] == preloaded_plugin_config['TIDEN_PLUGIN_VERSION']:
@@ -85,30 +96,22 @@ class PluginManager:
                 configured_plugins[class_name]['module'] = plugin_file
 
     def __find_plugin_modules(self, configured_plugins):
-        # Find modules
-        plugin_module_files = {}
-        for plugins_path in self.plugins_paths:
-            for plugin_file in glob(path.join(plugins_path, "*.py")):
-                # Ignore Tiden abstract plugin class and itself
-                if path.basename(plugin_file) in self.ignore_modules or plugin_file == path.abspath(__file__):
-                    continue
-                # Scan plugin python files and check that the given class in config
-                class_name = None
-                with open(plugin_file) as r:
-                    content = r.read()
-                    m = search(r'\s*class\s*([a-zA-z0-9_]+)\s*\(\s*TidenPlugin\s*\)\s*:\s*\n', content)
-                    if m:
-                        class_name = m.group(1)
-                        if not class_name in configured_plugins.keys():
-                            continue
-                        else:
-                            plugin_module_files[class_name] = plugin_file
-        return plugin_module_files
+        """
+        Find modules of configured plugins using persistent plugins index,
+        only modules changed since the previous run are parsed again.
+        :param configured_plugins: plugins from config
+        :return: indexed plugins for configured class names
+        """
+        found_plugins = self.index.scan(self.plugins_paths, ignore_files=self.ignore_modules + [path.abspath(__file__)])
+        self.index.save()
+        return {class_name: plugin for class_name, plugin in found_plugins.items()
+                if class_name in configured_plugins.keys()}
 
     def do(self, point, *args, **kwargs):
         for name in self.plugins.keys():
             try:
-                getattr(self.plugins[name]['instance'], point)(*args, **kwargs)
+                with self.tracer.span('%s.%s' % (name, point), cat='plugin'):
+                    getattr(self.plugins[name]['instance'], point)(*args, **kwargs)
             # TODO too broad and need to be investigated but now we don't stop tests execution
             except TidenPluginException as e:
                 log_print('Plugin %s failed in %s: %s' % (name, point, str(e)), color='red')
@@ -117,7 +120,8 @@ class PluginManager:
         check_result = True
         for name in self.plugins.keys():
             try:
-                plugin_result = getattr(self.plugins[name]['instance'], point)(*args, **kwargs)
+                with self.tracer.span('%s.%s' % (name, point), cat='plugin'):
+                    plugin_result = getattr(self.plugins[name]['instance'], point)(*args, **kwargs)
                 check_result = check_result and plugin_result
                 if not check_result:
                     # first failed plugin skips other plugins
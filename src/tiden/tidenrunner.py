@@ -24,6 +24,8 @@ from .logger import *
 from .runner import get_test_modules, get_long_path_len, get_class_from_module, known_issue_str
 from .priority_decorator import get_priority_key
 from .sshpool import SshPool
+from .tracing import Tracer, format_trace_summary
+from .templateengine import TemplateEngine
 from uuid import uuid4
 from traceback import format_exc
 
@@ -124,6 +126,8 @@ class TidenRunner:
 
         self.ssh_pool: SshPool = kwargs.get('ssh_pool')
         self.pm: PluginManager = kwargs.get('plugin_manager')
+        self.tracer = Tracer().configure(config)
+        TemplateEngine().configure(config)
 
     def collect_tests(self):
         """
@@ -253,6 +257,10 @@ class TidenRunner:
                 if not setup_passed:
                     exit(1)
 
+        trace_path = self.tracer.save(self.config['suite_var_dir'])
+        if trace_path:
+            log_print('Tiden trace stored in %s' % trace_path, color='debug')
+
     def create_test_module_attr_yaml(self, test_method_names):
         # create attr.yaml
         for current_test_name in test_method_names:
@@ -475,13 +483,15 @@ class TidenRunner:
         started = int(time())
         known_issue = self.test_plan[self.test_module].all_tests[self.current_test_name].get('known_issue')
         setattr(self.test_class, '_secret_report_storage', InnerReportConfig())
+        self.tracer.begin_test()
         try:
             self.pm.do("before_test_method",
                        test_module=self.test_module,
                        test_name=self.current_test_name,
                        artifacts=self.config.get('artifacts', {}))
             self.result.start_testcase(self.test_class, self.current_test_name)
-            self.__update_config_and_save(current_method_name=self.current_test_name)
+            with self.tracer.span('update_config_and_save'):
+                self.__update_config_and_save(current_method_name=self.current_test_name)
 
             # Execute test setup method
             self.__call_test_setup_teardown('setup')
@@ -490,10 +500,12 @@ class TidenRunner:
 
             with Step(self, 'Execution'):
                 try:
-                    call_method(self.test_class, self.current_test_method)
+                    with self.tracer.span(self.current_test_method, cat='test'):
+                        call_method(self.test_class, self.current_test_method)
                 finally:
                     self.__set_child_steps_to_parent()
-                    self.__save_logs()
+                    with self.tracer.span('save_logs'):
+                        self.__save_logs()
 
             log_print(f"{pad_string} passed  {exec_time(started)}", color='green')
         except (AssertionError, TidenException) as e:
@@ -529,10 +541,17 @@ class TidenRunner:
                        stacktrace=tb_msg,
                        known_issue=known_issue,
                        description=getattr(self.test_class, self.current_test_method, lambda: None).__doc__,
-                       inner_report_config=getattr(self, '_secret_report_storage'))
+                       inner_report_config=getattr(self, '_secret_report_storage'),
+                       result=self.result)
             # Kill java process if teardown function didn't kill nodes
             if not hasattr(self.test_class, 'keep_ignite_between_tests'):
-                kill_stalled_java(self.ssh_pool)
+                with self.tracer.span('kill_stalled_java'):
+                    kill_stalled_java(self.ssh_pool)
+
+            if self.tracer.enabled:
+                log_print('Tiden overhead for %s:\n%s' % (self.current_test_name,
+                                                           format_trace_summary(self.tracer.end_test())),
+                          color='debug')
 
             return test_status
 
@@ -547,20 +566,28 @@ class TidenRunner:
             return
         if test_dir:
             try:
-                for host_ip, output_lines in self.ssh_pool.exec([f"ls {test_dir}"]).items():
+                # list and send all logs of the test directory with a single command per host,
+                # each host gets its own prefix to keep sent file names unique
+                send_prefixes = {host_ip: str(uuid4()) for host_ip in self.ssh_pool.hosts}
+                commands = {}
+                for host_ip, send_prefix in send_prefixes.items():
+                    cmd = f'cd {test_dir} && for file_name in *.log; do ' \
+                          f'[ -f "$file_name" ] || continue; ' \
+                          f'echo "$file_name"; '
+                    if upload_logs:
+                        cmd += f'curl -s -o /dev/null -H "filename: {send_prefix}_$file_name" ' \
+                               f'-F "file=@$file_name;filename=$file_name" ' \
+                               f'{files_receiver_url}/files/add; '
+                    cmd += 'done'
+                    commands[host_ip] = [cmd]
+                for host_ip, output_lines in self.ssh_pool.exec(commands).items():
                     with Step(self, host_ip):
                         for line in output_lines:
                             file_name: str
                             for file_name in line.split('\n'):
                                 if file_name and file_name.endswith('.log'):
-                                    send_file_name = f'{uuid4()}_{file_name}'
+                                    send_file_name = f'{send_prefixes[host_ip]}_{file_name}'
                                     add_attachment(self, file_name, send_file_name, AttachmentType.FILE)
-                                    if upload_logs:
-                                        cmd = f'cd {test_dir}; ' \
-                                              f'curl -H "filename: {send_file_name}" ' \
-                                              f'-F "file=@{file_name};filename={file_name}" ' \
-                                              f'{files_receiver_url}/files/add'
-                                        self.ssh_pool.exec_on_host(host_ip, [cmd])
             except:
                 log_print(f'Failed to send report. \n{format_exc()}', color='pink')
 
@@ -593,10 +620,11 @@ class TidenRunner:
                 method_to_execute = all_tests[self.current_test_name].get(f'{method_name}_test_method')
                 self.__print_with_format(msg=str(method_to_execute.__name__))
                 try:
-                    if all_tests[self.current_test_name].get(f'{method_name}_test_params'):
-                        method_to_execute(self.test_class)
-                    else:
-                        method_to_execute()
+                    with self.tracer.span(method_to_execute.__name__, cat='test'):
+                        if all_tests[self.current_test_name].get(f'{method_name}_test_params'):
+                            method_to_execute(self.test_class)
+                        else:
+                            method_to_execute()
                 except Exception as e:
                     log_print(f'!!! Exception in {method_name} code !!!', color='red')
                     log_print(traceback.format_exc())
@@ -689,13 +717,12 @@ class TidenRunner:
         self.config['rt']['test_dir'] = "{}/{}/{}".format(
             self.config['rt']['test_module_dir'], self.config['rt']['test_class'], test_dir_name)
         try:
-            create_remote_dir = [
-                'mkdir -p %s/%s/%s' % (self.config['rt']['remote']['test_module_dir'],
-                                       self.test_class_name, str(test_dir_name)),
-                'ln -sfn %s %s/current_test_directory' % (self.config['rt']['remote']['test_module_dir'],
-                                                          self.config['environment']['home'])
-            ]
-            self.ssh_pool.exec(create_remote_dir)
+            # single round trip per host: create test directory and point current test symlink to it
+            self.ssh_pool.exec([
+                'mkdir -p %s/%s/%s && ln -sfn %s %s/current_test_directory' % (
+                    self.config['rt']['remote']['test_module_dir'], self.test_class_name, str(test_dir_name),
+                    self.config['rt']['remote']['test_module_dir'], self.config['environment']['home'])
+            ])
         except Exception:
             log_print("Can't create symlink to current test", color='red')
         self._save_config()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from contextlib import contextmanager
+from json import dump
+from os import getpid, path
+from threading import local, get_ident, main_thread, Lock
+from time import perf_counter
+
+from .singleton import singleton
+
+TIDEN_TRACE_FILE = 'tiden_trace.json'
+TIDEN_TRACE_COLLAPSED_FILE = 'tiden_trace.collapsed'
+
+
+class Span:
+    """
+    Single measured harness operation.
+    """
+    __slots__ = ('name', 'cat', 'stack', 'start', 'duration', 'tid', 'args')
+
+    def __init__(self, name, cat, stack, start, tid, args):
+        self.name = name
+        self.cat = cat
+        self.stack = stack
+        self.start = start
+        self.duration = 0.0
+        self.tid = tid
+        self.args = args
+
+    def to_chrome_event(self, pid, origin):
+        return {
+            'name': self.name,
+            'cat': self.cat,
+            'ph': 'X',
+            'ts': int((self.start - origin) * 1000000),
+            'dur': int(self.duration * 1000000),
+            'pid': pid,
+            'tid': self.tid,
+            'args': self.args,
+        }
+
+
+def trace_summary(spans):
+    """
+    Aggregate spans by their stack into flame-style rows.
+    :param spans: list of spans
+    :return: list of (stack, count, total seconds, self seconds) sorted by stack
+    """
+    totals = {}
+    for span in spans:
+        count, total, child_total = totals.get(span.stack, (0, 0.0, 0.0))
+        totals[span.stack] = (count + 1, total + span.duration, child_total)
+    for span in spans:
+        parent = span.stack[:-1]
+        if parent in totals:
+            count, total, child_total = totals[parent]
+            totals[parent] = (count, total, child_total + span.duration)
+    return [
+        (stack, count, total, max(total - child_total, 0.0))
+        for stack, (count, total, child_total) in sorted(totals.items())
+    ]
+
+
+def format_trace_summary(spans):
+    lines = []
+    for stack, count, total, self_time in trace_summary(spans):
+        lines.append('%s%s x%d total %.3f sec self %.3f sec' % (
+            '  ' * (len(stack) - 1), stack[-1], count, total, self_time))
+    return '\n'.join(lines)
+
+
+@singleton
+class Tracer:
+    """
+    Harness overhead tracer.
+
+    Records nested spans of Tiden own work (plugin hooks, bookkeeping, remote commands) to show how much of test
+    time goes into harness itself rather than into application under test. Disabled by default, enable with
+    `--to=trace=True`; when disabled `span` costs one attribute check.
+
+    Spans made from pool worker threads are attached to the current span of the main thread, so remote commands
+    issued by `SshPool.exec` are accounted under the runner step that started them.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.spans = []
+        self.test_spans_from = 0
+        self.origin = perf_counter()
+        self._local = local()
+        self._main_stack = ()
+        self._lock = Lock()
+
+    def configure(self, config):
+        self.enabled = str(config.get('trace', False)).lower() == 'true'
+        return self
+
+    def _get_stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = []
+            self._local.stack = stack
+        return stack
+
+    @contextmanager
+    def span(self, name, cat='tiden', **kwargs):
+        """
+        Measure enclosed block.
+        :param name: span name, e.g. hook or method name
+        :param cat: span category, e.g. 'tiden', 'plugin', 'ssh'
+        :param kwargs: additional span attributes (host, command, bytes, ...), may be updated inside the block
+        """
+        if not self.enabled:
+            yield kwargs
+            return
+        is_main = get_ident() == main_thread().ident
+        stack = self._get_stack()
+        if stack:
+            parent = stack[-1]
+        else:
+            parent = () if is_main else self._main_stack
+        current = Span(name, cat, parent + (name,), perf_counter(), get_ident(), kwargs)
+        stack.append(current.stack)
+        if is_main:
+            self._main_stack = current.stack
+        try:
+            yield kwargs
+        finally:
+            current.duration = perf_counter() - current.start
+            stack.pop()
+            if is_main:
+                self._main_stack = parent
+            with self._lock:
+                self.spans.append(current)
+
+    def begin_test(self):
+        with self._lock:
+            self.test_spans_from = len(self.spans)
+
+    def end_test(self):
+        """
+        :return: spans recorded since last `begin_test`
+        """
+        with self._lock:
+            return self.spans[self.test_spans_from:]
+
+    def save(self, dir_path):
+        """
+        Store all recorded spans as Chrome trace (chrome://tracing, Perfetto) and as collapsed stacks
+        suitable for flamegraph tools.
+        :param dir_path: local directory
+        :return: path to Chrome trace file or None if tracing is disabled
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            spans = list(self.spans)
+        pid = getpid()
+        trace_path = path.join(dir_path, TIDEN_TRACE_FILE)
+        with open(trace_path, 'w') as w:
+            dump({
+                'traceEvents': [span.to_chrome_event(pid, self.origin) for span in spans],
+                'displayTimeUnit': 'ms',
+            }, w)
+        with open(path.join(dir_path, TIDEN_TRACE_COLLAPSED_FILE), 'w') as w:
+            for stack, count, total, self_time in trace_summary(spans):
+                w.write('%s %d\n' % (';'.join(stack), int(self_time * 1000000)))
+        return trace_path
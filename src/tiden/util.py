@@ -20,10 +20,13 @@ import hashlib
 import inspect
 
 from yaml import load, YAMLError, dump, Loader, FullLoader
+try:
+    from yaml import CDumper as Dumper
+except ImportError:
+    from yaml import Dumper
 from datetime import datetime
 from genericpath import exists
 from time import sleep, time
-from jinja2 import Environment, FileSystemLoader
 from json import loads
 from os import path, listdir
 from inspect import stack
@@ -33,8 +36,10 @@ from urllib.request import Request, urlopen
 from enum import Enum
 from xml.etree.ElementTree import ElementTree, parse as _parse_xml
 from .logger import get_logger
+from .templateengine import TemplateEngine
 from re import search, sub
 from glob import glob
+from math import ceil
 
 
 def cfg(config, name, new_value=None):
@@ -119,7 +124,7 @@ def read_yaml_file(file_path):
 
 def write_yaml_file(file_path, data):
     with open(file_path, 'w') as w:
-        dump(data, w)
+        dump(data, w, Dumper=Dumper)
 
 
 def call_method(cls, name):
@@ -567,6 +572,15 @@ def unix_path(p):
     return p.replace('\\', '/')
 
 
+def pkill_pattern(s):
+    """
+    Pattern for `pkill -f`/`pgrep -f` matching string s, but not the shell command line containing the pattern itself
+    :param s: process command line part
+    :return: pattern with last character in bracket expression
+    """
+    return '%s[%s]' % (s[:-1], s[-1])
+
+
 def with_setup(*args, **kwargs):
     def wrapper(func):
         if len(args) >= 1:
@@ -770,8 +784,7 @@ def render_template(glob_path, name, options):
         file_parts = tmpl_file.split('.tmpl.')
         if len(file_parts) > 1:
             cfg_name = path.basename(file_parts[0])
-            env = Environment(loader=FileSystemLoader(output_dir), trim_blocks=True)
-            rendered_string = env.get_template(path.basename(tmpl_file)).render(options)
+            rendered_string = TemplateEngine().render(output_dir, path.basename(tmpl_file), options)
             cfg_path = "%s/%s" % (
                 output_dir, path.basename(tmpl_file).replace('.tmpl.', '.%s.' % name))
             with open(cfg_path, "w+") as config_file:
@@ -1386,3 +1399,35 @@ def mergedict(source, destination):
             destination[key] = value
 
     return destination
+
+
+def percentile(sorted_values, p):
+    """
+    Nearest-rank percentile.
+    :param sorted_values: list of values sorted ascending
+    :param p: percentile, 0..100
+    :return: value or None for empty list
+    """
+    if not sorted_values:
+        return None
+    rank = int(ceil(p / 100.0 * len(sorted_values)))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+
+def distribution(values, percentiles=(50, 95, 99)):
+    """
+    Summarize values distribution.
+    :param values: iterable of numbers
+    :param percentiles: percentiles to compute
+    :return: {'count': int, 'min': ..., 'p50': ..., 'p95': ..., 'p99': ..., 'max': ..., 'mean': ...}
+    """
+    sorted_values = sorted(values)
+    result = {'count': len(sorted_values)}
+    if not sorted_values:
+        return result
+    result['min'] = sorted_values[0]
+    for p in percentiles:
+        result['p%s' % p] = percentile(sorted_values, p)
+    result['max'] = sorted_values[-1]
+    result['mean'] = sum(sorted_values) / len(sorted_values)
+    return result
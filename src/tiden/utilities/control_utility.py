@@ -14,22 +14,33 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from os.path import basename
+from os.path import basename, join
 from re import search, sub
-from time import sleep
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import sleep, time
 
 from ..apps.ignite.igniteexception import IgniteException
 from ..report.steps import step
 from ..tidenexception import TidenException
 from ..util import print_red, log_print, log_put, version_num
+from .idle_verify_dump import iter_dump_items, index_dump_items
 
 
 class ControlUtility:
+    # parsed control.sh help per Ignite home (i.e. per Ignite distribution and version):
+    #   <ignite_home>: (<commands>, <ssl keys>, <ignite version>)
+    help_cache = {}
+
+    # timeout and poll interval to wait for cluster/baseline state after changing it, seconds
+    default_state_timeout = 60
+    state_poll_interval = 1
 
     def __init__(self, ignite, parent_cls=None):
         self.ignite = ignite
         self.latest_utility_output = None
         self.latest_utility_host = None
+        self.latest_server_host = None
         self.commands = None
         self.auth_login = None
         self.auth_password = None
@@ -83,36 +94,10 @@ class ControlUtility:
     def control_utility(self, *args, **kwargs):
         self.latest_command = args = list(args)
         log_print(f"Control utility {' '.join(args)}")
-        args = list(args)
-        client_host = self.ignite.get_and_inc_client_host()
-        server_host = None
-        server_port = None
-        bg = ''
         too_many_lines_num = 100
+        client_host, server_host, server_port = self.__get_client_and_server(**kwargs)
 
-        alive_server_nodes = self.ignite.get_alive_default_nodes() + self.ignite.get_alive_additional_nodes()
-        if 'node' in kwargs:
-            alive_server_nodes = [kwargs['node']]
-
-        elif 'use_same_host' in kwargs:
-            alive_server_nodes = [node for node in alive_server_nodes if
-                                  self.ignite.nodes[node].get('host') == client_host]
-
-        elif 'use_another_host' in kwargs:
-            alive_server_nodes = [node for node in alive_server_nodes if
-                                  self.ignite.nodes[node].get('host') != client_host]
-        if kwargs.get('reverse', False):
-            alive_server_nodes = list(reversed(alive_server_nodes))
-        for node_idx in alive_server_nodes:
-            server_host = self.ignite.nodes[node_idx]['host']
-            if 'binary_rest_port' not in self.ignite.nodes[node_idx]:
-                # this node not run or killed, skip to next node
-                continue
-            server_port = self.ignite.nodes[node_idx]['binary_rest_port']
-            break
-        if server_host is None or server_port is None:
-            raise TidenException('Not found running server nodes')
-
+        bg = ''
         nohup = ''
         if kwargs.get('background'):
             print('In background mode')
@@ -121,19 +106,11 @@ class ControlUtility:
         elif kwargs.get('log'):
             bg = f">> {kwargs['log']} 2>&1"
 
-        if self.authentication_enabled:
-            if self.auth_login:
-                args.append(f'--user {self.auth_login}')
-            if self.auth_password:
-                args.append(f'--password {self.auth_password}')
-
-        if self.ssl_connection_enabled:
-            args.append(self.__return_ssl_connection_string())
-
         commands = {
             client_host: [
                 f"cd {self.ignite.client_ignite_home}; "
-                f"{nohup} bin/control.sh --host {server_host} --port {server_port} {' '.join(args)} {bg}"
+                f"{nohup} bin/control.sh --host {server_host} --port {server_port} "
+                f"{' '.join(args + self.__get_connection_args())} {bg}"
             ]
         }
 
@@ -151,6 +128,7 @@ class ControlUtility:
             self.__print_control_utility_output(lines)
         self.latest_utility_output = lines
         self.latest_utility_host = client_host
+        self.latest_server_host = server_host
         if kwargs.get('all_required'):
             success = ControlUtility.check_content_all_required(
                 lines, kwargs.get('all_required'),
@@ -170,6 +148,82 @@ class ControlUtility:
                 raise TidenException('control.sh --baseline command end up with exceptions')
         return self
 
+    @step('CU batch', attach_parameters=True)
+    def control_utility_batch(self, *commands, **kwargs):
+        """
+        Run several control.sh commands one after another from the same client host by single remote call.
+
+        control.sh has no resident mode, so every command still starts its own JVM, but commands don't wait
+        for each other's round trip to the runner host.
+        :param commands: list of commands, each command is either string or list of control.sh arguments
+        :param kwargs: node selection options same as for `control_utility` (node, use_same_host, use_another_host,
+            reverse), ssh_options and show_output
+        :return: list of commands outputs
+        """
+        client_host, server_host, server_port = self.__get_client_and_server(**kwargs)
+        connection_args = self.__get_connection_args()
+        remote_commands = []
+        for args in commands:
+            args = [args] if isinstance(args, str) else list(args)
+            log_print(f"Control utility {' '.join(args)}")
+            self.latest_command = args
+            remote_commands.append(
+                f"cd {self.ignite.client_ignite_home}; "
+                f"bin/control.sh --host {server_host} --port {server_port} {' '.join(args + connection_args)}"
+            )
+        self.ignite.logger.debug(remote_commands)
+        results = self.ignite.ssh.exec({client_host: remote_commands}, **kwargs.get('ssh_options', {}))
+        outputs = results[client_host]
+        if kwargs.get('show_output', True):
+            for output in outputs:
+                self.__print_control_utility_output(output)
+        if outputs:
+            self.latest_utility_output = outputs[-1]
+            self.latest_utility_host = client_host
+            self.latest_server_host = server_host
+        return outputs
+
+    def __get_client_and_server(self, **kwargs):
+        client_host = self.ignite.get_and_inc_client_host()
+        server_host = None
+        server_port = None
+
+        alive_server_nodes = self.ignite.get_alive_default_nodes() + self.ignite.get_alive_additional_nodes()
+        if 'node' in kwargs:
+            alive_server_nodes = [kwargs['node']]
+
+        elif 'use_same_host' in kwargs:
+            alive_server_nodes = [node for node in alive_server_nodes if
+                                  self.ignite.nodes[node].get('host') == client_host]
+
+        elif 'use_another_host' in kwargs:
+            alive_server_nodes = [node for node in alive_server_nodes if
+                                  self.ignite.nodes[node].get('host') != client_host]
+        if kwargs.get('reverse', False):
+            alive_server_nodes = list(reversed(alive_server_nodes))
+        for node_idx in alive_server_nodes:
+            server_host = self.ignite.nodes[node_idx]['host']
+            if 'binary_rest_port' not in self.ignite.nodes[node_idx]:
+                # this node not run or killed, skip to next node
+                continue
+            server_port = self.ignite.nodes[node_idx]['binary_rest_port']
+            break
+        if server_host is None or server_port is None:
+            raise TidenException('Not found running server nodes')
+        return client_host, server_host, server_port
+
+    def __get_connection_args(self):
+        args = []
+        if self.authentication_enabled:
+            if self.auth_login:
+                args.append(f'--user {self.auth_login}')
+            if self.auth_password:
+                args.append(f'--password {self.auth_password}')
+
+        if self.ssl_connection_enabled:
+            args.append(self.__return_ssl_connection_string())
+        return args
+
     def __find_commands(self):
         nodes = self.ignite.get_all_default_nodes()
         if not nodes:
@@ -177,6 +231,14 @@ class ControlUtility:
         ignite_home = self.ignite.nodes[nodes[0]]['ignite_home']
         ignite_host = self.ignite.nodes[nodes[0]]['host']
 
+        cached_help = ControlUtility.help_cache.get(ignite_home)
+        if cached_help is not None:
+            commands, self.ssl_keys, ignite_version = cached_help
+            if ignite_version is not None:
+                self.ignite_version = ignite_version
+                self.ignite_version_num = version_num(ignite_version)
+            return commands
+
         output = self.ignite.ssh.exec_on_host(ignite_host, ['cd {}; bin/control.sh --help'.format(ignite_home)])
         if output[ignite_host]:
             output = output[ignite_host][0].split("\n")
@@ -194,7 +256,9 @@ class ControlUtility:
             if 'ssl_enabled' in ''.join(output):
                 self.ssl_keys['ssl_enabled'] = '--ssl_enabled'
 
-            return self.__parse_commands(self.__parse_help(output))
+            commands = self.__parse_commands(self.__parse_help(output))
+            ControlUtility.help_cache[ignite_home] = (commands, self.ssl_keys, self.ignite_version)
+            return commands
         raise TidenException("Can't get control.sh help")
 
     def __parse_commands(self, parsed_help):
@@ -403,6 +467,8 @@ class ControlUtility:
         activation_timeout = self.ignite.activation_timeout
         if 'activation_timeout' in kwargs:
             activation_timeout = int(kwargs['activation_timeout'])
+        started = time()
+        poll_interval = self.state_poll_interval
         while timeout_counter < activation_timeout and not completed:
             results = self.ignite.ssh.exec(check_commands, **kwargs)
             activated_server_nodes_num = 0
@@ -425,8 +491,10 @@ class ControlUtility:
             else:
                 if activated_server_nodes_num == 0:
                     completed = True
-            sleep(5)
-            timeout_counter += 5
+            if not completed:
+                sleep(poll_interval)
+                poll_interval = min(poll_interval * 2, 5)
+            timeout_counter = int(time() - started)
         log_print('')
         if cmd:
             if activated_server_nodes_num < server_nodes_num:
@@ -546,62 +614,49 @@ class ControlUtility:
                                         }
                             })
         """
+        return list(iter_dump_items(self.__fetch_dump_lines(file_path, copy_path)))
+
+    def get_dump_index(self, file_path=None, copy_path=None):
+        """
+        Get compact index of idle_verify dump suitable for `diff_dumps`
+        :param file_path:   dump file path
+        :param copy_path:   path to copy dump file
+        :return:            {(grpName, partId): {consistentId: (isPrimary, updateCntr, size, partHash)}}
+        """
+        return index_dump_items(iter_dump_items(self.__fetch_dump_lines(file_path, copy_path)))
+
+    def __fetch_dump_lines(self, file_path=None, copy_path=None):
+        """
+        Stream partition lines of dump file from the host where dump was written into local file and yield them.
+        Dump is written by the server node control.sh connected to, other server hosts are asked only if file is not
+        there.
+        """
         if file_path is None:
             file_path = self.get_idle_verify_dump_path()
 
-        # searching on all hosts because dump file stored in first server node directory
+        # grep fails when nothing matched, file absence is what tells hosts apart
+        cmd = "{{ grep '^Partition' {path} || test -f {path}; }}".format(path=file_path)
         if copy_path:
-            cmd = 'cp {src} {dst} && cat {src}'.format(src=file_path, dst=copy_path)
-        else:
-            cmd = 'cat {}'.format(file_path)
+            cmd = 'cp {src} {dst} && {cmd}'.format(src=file_path, dst=copy_path, cmd=cmd)
         print_red('Idle verify dump: %s' % cmd)
-        result = self.ignite.ssh.exec([cmd])
-        for host, command_out in result.items():
-            command_out = command_out[0]
-            if 'No such file or directory' not in command_out and command_out != '':
-                result = command_out
-
-        # filter body
-        lines = result.split("\n")
-        body_lines = []
-        for line in lines:
-            read = line.startswith("Partition")
-            if read:
-                body_lines.append(line)
 
-        result_list = []
-        structure = {}
-        for line in body_lines:
-            if line.startswith("Partition:"):
+        server_hosts = list(self.ignite.config['environment'].get('server_hosts', []))
+        if self.latest_server_host:
+            server_hosts = [self.latest_server_host] + [
+                host for host in server_hosts if host != self.latest_server_host]
 
-                structure["info"] = {"name": line[line.index(":") + 1:line.index("[")]}
-
-                for pair in line[line.index("[") + 1:line.index("]")].split(","):
-                    key, value = pair.strip().split("=")
-                    structure["info"][key] = value
-
-            elif line.startswith("Partition instances:"):
-
-                structure["instances"] = []
-
-                items_line = line[line.index("[") + 1:line.rindex("]")]
-                for partition in items_line.split("],"):
-
-                    instance = {"name": partition[:partition.index("[")].strip()}
-
-                    for pair in partition[partition.index("[") + 1:].split(","):
-                        pair = pair.replace("]", "").strip()
-                        key, value = pair.split("=")
-                        instance[key] = value
-
-                    structure["instances"].append(instance)
-
-            # two lines for two dict keys
-            if len(structure) == 2:
-                result_list.append(structure)
-                structure = {}
-
-        return result_list
+        local_dir = mkdtemp()
+        try:
+            local_file = join(local_dir, basename(file_path))
+            for host in server_hosts:
+                written, _ = self.ignite.ssh.exec_to_file_on_host(host, cmd, local_file)
+                if written is not None:
+                    with open(local_file) as r:
+                        yield from r
+                    return
+            raise IgniteException("Can't find idle verify dump {} on server hosts".format(file_path))
+        finally:
+            rmtree(local_dir, ignore_errors=True)
 
     @staticmethod
     def __print_control_utility_output(output):
@@ -726,7 +781,12 @@ class ControlUtility:
             args.append(force_attr)
 
         self.control_utility(*args, background=kwargs.get('background'), log=kwargs.get('log'))
-        sleep(5)  # TODO: make sure automated snapshot created
+        if not kwargs.get('background'):
+            consistent_ids = str(consistent_id).split(',')
+            self.wait_for_baseline(
+                lambda nodes: all(nodes.get(node_id, '') == '' for node_id in consistent_ids),
+                'nodes %s removed from baseline' % consistent_id,
+                timeout=kwargs.get('timeout'))
 
     def add_node_to_baseline(self, consistent_id, **kwargs):
         args = [
@@ -740,7 +800,41 @@ class ControlUtility:
             args.append(force_attr)
 
         self.control_utility(*args, background=kwargs.get('background'), log=kwargs.get('log'))
-        sleep(5)  # TODO: make sure automated snapshot created
+        if not kwargs.get('background'):
+            consistent_ids = str(consistent_id).split(',')
+            self.wait_for_baseline(
+                lambda nodes: all(nodes.get(node_id, '') != '' for node_id in consistent_ids),
+                'nodes %s added to baseline' % consistent_id,
+                timeout=kwargs.get('timeout'))
+
+    def wait_for_baseline(self, condition, description, timeout=None):
+        """
+        Wait until baseline state satisfies condition.
+
+        Output of the latest control.sh command is checked first (baseline commands print resulting baseline),
+        then `--baseline` is polled until condition met or timeout.
+        :param condition: callable getting dictionary {<consistent id>: <state>} parsed from `--baseline` output
+            (state is empty for nodes out of baseline)
+        :param description: what is awaited, for logs
+        :param timeout: timeout in seconds, default `default_state_timeout`
+        :return: True when condition met, TidenException is raised on timeout
+        """
+        if timeout is None:
+            timeout = self.default_state_timeout
+        end_time = time() + int(timeout)
+        while True:
+            # nodes are absent in error output, it doesn't mean they are out of baseline
+            if self.latest_utility_output and self._is_baseline_output() \
+                    and condition(self._get_nodes_state_from_output()):
+                return True
+            if time() > end_time:
+                raise TidenException('Timeout %s sec waiting for %s, last control.sh output:\n%s' % (
+                    timeout, description, self.latest_utility_output))
+            sleep(self.state_poll_interval)
+            self.control_utility('--baseline', show_output=False)
+
+    def _is_baseline_output(self):
+        return 'Error:' not in self.latest_utility_output and 'Baseline nodes' in self.latest_utility_output
 
     def get_kill_subcommand(self):
         return self.get_command('tx', 'kill')
@@ -842,7 +936,10 @@ class ControlUtility:
                 args.append(force_attr)
 
             self.control_utility(*args)
-            sleep(5)
+            expected_status = 'disabled' if disable else 'enabled'
+            self.wait_for_baseline(
+                lambda nodes: self.get_auto_baseline_params()[0] == expected_status,
+                'baseline auto adjustment %s' % expected_status)
         else:
             log_print('Could not disable baseline autoajustment as it is not supported'.
                       format('disable' if disable else 'enable'), color='red')
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# partition instance attributes compared between dumps
+DUMP_INSTANCE_STATE = ('isPrimary', 'updateCntr', 'size', 'partHash')
+
+
+def iter_dump_items(lines):
+    """
+    Parse idle_verify dump lines one by one.
+    :param lines: iterable of dump lines (file object, list of lines, ...), lines not starting with 'Partition'
+        are skipped
+    :return: generator of partition items:
+        {
+            "info": {"name": str, "grpName": str, "grpId": str, "partId": str},
+            "instances": [{"name": str, "isPrimary": str, "consistentId": str, "updateCntr": str,
+                           "size": str, "partHash": str}, ...]
+        }
+    """
+    structure = {}
+    for line in lines:
+        if not line.startswith('Partition'):
+            continue
+        line = line.rstrip('\r\n')
+        if line.startswith("Partition:"):
+            structure["info"] = {"name": line[line.index(":") + 1:line.index("[")]}
+
+            for pair in line[line.index("[") + 1:line.index("]")].split(","):
+                key, value = pair.strip().split("=")
+                structure["info"][key] = value
+
+        elif line.startswith("Partition instances:"):
+            structure["instances"] = []
+
+            items_line = line[line.index("[") + 1:line.rindex("]")]
+            for partition in items_line.split("],"):
+
+                instance = {"name": partition[:partition.index("[")].strip()}
+
+                for pair in partition[partition.index("[") + 1:].split(","):
+                    pair = pair.replace("]", "").strip()
+                    key, value = pair.split("=")
+                    instance[key] = value
+
+                structure["instances"].append(instance)
+
+        # two lines for two dict keys
+        if len(structure) == 2:
+            yield structure
+            structure = {}
+
+
+def index_dump_items(items):
+    """
+    Build compact index of dump items.
+    :param items: iterable of partition items as returned by `iter_dump_items`
+    :return: {(grpName, partId): {consistentId: (isPrimary, updateCntr, size, partHash)}}
+    """
+    index = {}
+    for item in items:
+        key = (item['info'].get('grpName'), item['info'].get('partId'))
+        index[key] = {
+            instance.get('consistentId'): tuple(instance.get(attr) for attr in DUMP_INSTANCE_STATE)
+            for instance in item['instances']
+        }
+    return index
+
+
+def diff_dumps(dump_before, dump_after):
+    """
+    Compare two idle_verify dumps.
+    :param dump_before: dump index (see `index_dump_items`) or list of partition items
+    :param dump_after: dump index or list of partition items
+    :return: sorted list of differences
+        ((grpName, partId), consistentId, <state before or None>, <state after or None>)
+    """
+    if not isinstance(dump_before, dict):
+        dump_before = index_dump_items(dump_before)
+    if not isinstance(dump_after, dict):
+        dump_after = index_dump_items(dump_after)
+    diff = []
+    for key in set(dump_before.keys()) | set(dump_after.keys()):
+        instances_before = dump_before.get(key, {})
+        instances_after = dump_after.get(key, {})
+        if instances_before == instances_after:
+            continue
+        for consistent_id in set(instances_before.keys()) | set(instances_after.keys()):
+            state_before = instances_before.get(consistent_id)
+            state_after = instances_after.get(consistent_id)
+            if state_before != state_after:
+                diff.append((key, consistent_id, state_before, state_after))
+    return sorted(diff, key=lambda d: (tuple(str(k) for k in d[0]), str(d[1])))
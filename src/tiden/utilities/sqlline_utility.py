@@ -14,7 +14,150 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from ..util import print_green
+from csv import reader
+from os import path
+from re import compile as re_compile
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import sleep, time
+from uuid import uuid4
+
+from ..tidenexception import TidenException
+from ..util import pkill_pattern, print_green
+
+ANSI_ESCAPE = re_compile(r'\x1b\[[0-9;]*[A-Za-z]')
+PROMPT = re_compile(r'^\d+: jdbc:[^>]*> ?(.*)$')
+PROMPT_CONTINUATION = re_compile(r'^(?:\. )+\.?\s*> ?(.*)$')
+STATEMENT_RESULT = re_compile(r'^(No|\d+) rows? (selected|affected) \(([0-9.]+) seconds?\)')
+
+
+def parse_sqlline_output(output):
+    """
+    Parse sqlline output produced with `--outputFormat=csv` and `--verbose=true`.
+    :param output: sqlline output text
+    :return: list of statement results:
+        {
+            'statement': <statement text>,
+            'columns': [<column name>, ...],
+            'rows': [[<value>, ...], ...],
+            'count': <rows selected or affected>,
+            'seconds': <statement execution time reported by sqlline>,
+            'error': <error text or None>,
+        }
+    """
+    results = []
+    current = None
+    for line in output.split('\n'):
+        line = ANSI_ESCAPE.sub('', line).rstrip('\r')
+        m = PROMPT.match(line)
+        if m:
+            current = {'statement': m.group(1), 'columns': [], 'rows': [], 'count': None, 'seconds': None,
+                       'error': None}
+            results.append(current)
+            continue
+        if current is None or not line.strip():
+            continue
+        m = PROMPT_CONTINUATION.match(line)
+        if m and current['count'] is None and not current['columns']:
+            current['statement'] += '\n' + m.group(1)
+            continue
+        m = STATEMENT_RESULT.match(line)
+        if m:
+            current['count'] = 0 if m.group(1) == 'No' else int(m.group(1))
+            current['seconds'] = float(m.group(3))
+            continue
+        if line.startswith('Error:'):
+            current['error'] = line[len('Error:'):].strip() if current['error'] is None \
+                else current['error'] + '\n' + line
+            continue
+        if current['count'] is None and current['error'] is None:
+            values = next(reader([line], quotechar="'"))
+            if not current['columns']:
+                current['columns'] = values
+            else:
+                current['rows'].append(values)
+    return results
+
+
+class SqllineSession:
+    """
+    Warm sqlline process on remote host.
+
+    Sqlline reads commands appended to input file, every `execute` uploads SQL script and asks sqlline to `!run` it,
+    then reads output appended since previous call until end marker of the call is found.
+    """
+
+    poll_interval = 0.5
+
+    def __init__(self, sqlline, host, command, remote_dir):
+        self.sqlline = sqlline
+        self.ssh = sqlline.ignite.ssh
+        self.host = host
+        self.command = command
+        self.session_id = uuid4().hex[:8]
+        self.remote_dir = '%s/sqlline-%s' % (remote_dir, self.session_id)
+        self.input_file = '%s/input.sql' % self.remote_dir
+        self.output_file = '%s/output.log' % self.remote_dir
+        self.output_lines = 0
+        self.scripts = 0
+
+    def start(self):
+        self.ssh.exec_on_host(self.host, [
+            'mkdir -p {dir}; touch {input}; '
+            'nohup sh -c \'tail -f {input} | {command}\' > {output} 2>&1 < /dev/null &'.format(
+                dir=self.remote_dir, input=self.input_file, output=self.output_file,
+                command=self.command.replace("'", "'\"'\"'"))
+        ])
+        return self
+
+    def execute(self, sql_commands, timeout=600, on_line=None):
+        """
+        Execute statements in warm sqlline.
+        :param sql_commands: list of statements
+        :param timeout: seconds to wait for all statements
+        :param on_line: (optional) callback(line) called with each output line as soon as it is read
+        :return: list of parsed statement results, see `parse_sqlline_output`
+        """
+        self.scripts += 1
+        marker = 'TIDEN_SQLLINE_DONE_%s_%s' % (self.session_id, self.scripts)
+        script_file = self.sqlline.util_prepare_sql_file(
+            self.host, list(sql_commands) + ["SELECT '%s';" % marker],
+            file_name='script-%s.sql' % self.scripts, remote_dir=self.remote_dir)
+        self.ssh.exec_on_host(self.host, ["echo '!run %s' >> %s" % (script_file, self.input_file)])
+
+        output = []
+        end_time = time() + timeout
+        marker_started = done = False
+        while not done:
+            # every line is prefixed to keep blank lines, so line offset stays correct
+            results = self.ssh.exec_on_host(self.host, [
+                "tail -n +%d %s | sed 's/^/|/'" % (self.output_lines + 1, self.output_file)])
+            # last line is still being written unless output ends with new line, it is read by next poll
+            lines = [line[1:] for line in ''.join(results.get(self.host, [])).split('\n')[:-1] if line.startswith('|')]
+            self.output_lines += len(lines)
+            for line in lines:
+                output.append(line)
+                if on_line is not None:
+                    on_line(line)
+                clean_line = ANSI_ESCAPE.sub('', line)
+                m = PROMPT.match(clean_line)
+                if m:
+                    marker_started = marker in m.group(1)
+                elif marker_started and (STATEMENT_RESULT.match(clean_line) or clean_line.startswith('Error:')):
+                    done = True
+            if done:
+                break
+            if time() > end_time:
+                raise TidenException('Sqlline session did not complete script in %s sec' % timeout)
+            sleep(self.poll_interval)
+        # drop results of marker statement
+        return [result for result in parse_sqlline_output('\n'.join(output)) if marker not in result['statement']]
+
+    def close(self):
+        self.ssh.exec_on_host(self.host, [
+            "echo '!quit' >> {input}; sleep 1; pkill -f '{pattern}'; true".format(
+                input=self.input_file, pattern=pkill_pattern('tail -f %s' % self.input_file))
+        ])
 
 
 class Sqlline:
@@ -39,12 +182,14 @@ class Sqlline:
             auth_info = kwargs.get('auth')
             self.conn_params += '&user={}&password={}'.format(auth_info.user, auth_info.password)
 
-    def run_sqlline(self, sql_commands, driver_flags=None, log=True):
+    def get_sqlline_command(self, driver_flags=None):
+        """
+        :return: (host, sqlline command line connected to first alive default node)
+        """
         set_java_home = ''
         node_id = self.ignite.get_alive_default_nodes()[0]
         host = self.ignite.nodes[node_id]['host']
         port = self.ignite.nodes[node_id]['client_connector_port']
-        sql_cmd_file = self.util_prepare_sql_file(host, sql_commands)
 
         if self.ignite.config['environment'].get('env_vars') \
                 and self.ignite.config['environment']['env_vars'].get('JAVA_HOME'):
@@ -63,44 +208,62 @@ class Sqlline:
         default_conn_str = 'jdbc:ignite:thin://{}:{}'.format(host, port)
 
         if self.conn_params:
-            driver_flags = [self.conn_params] if not driver_flags else driver_flags.insert(0, self.conn_params)
+            driver_flags = [self.conn_params] + (driver_flags or [])
 
         if driver_flags:
             run_sqlline += '\"{}?{}\"'.format(default_conn_str, '?'.join(driver_flags))
         else:
             run_sqlline += '\"{}\"'.format(default_conn_str)
+        return host, run_sqlline
 
+    def run_sqlline(self, sql_commands, driver_flags=None, log=True):
+        host, run_sqlline = self.get_sqlline_command(driver_flags)
+        sql_cmd_file = self.util_prepare_sql_file(host, sql_commands)
         run_sqlline += ' -f %s' % sql_cmd_file
 
         if log:
             print_green(run_sqlline)
-        results = self.ignite.ssh.exec_on_host(host, [run_sqlline])
+        # output is printed as soon as it is received
+        results = self.ignite.ssh.exec_on_host(
+            host, [run_sqlline], on_line=(lambda line_host, line: print_green(line)) if log else None)
         response = results[host][0]
-        if log:
-            print_green(response)
-            self.util_print_beautiful(response)
 
         return response
 
-    def util_prepare_sql_file(self, host, sql_commands):
-        sql_cmd_file = '%s/sql_commands.sql' % self.ignite.config['rt']['remote']['test_dir']
+    def execute(self, sql_commands, driver_flags=None, log=False):
+        """
+        Execute statements in new sqlline process.
+        :return: list of parsed statement results, see `parse_sqlline_output`
+        """
+        return parse_sqlline_output(self.run_sqlline(sql_commands, driver_flags=driver_flags, log=log))
 
-        # delete sql commands file if exists
-        commands = []
-        results = self.ignite.ssh.exec_on_host(host, ['rm %s' % sql_cmd_file])
-        print_green(results)
+    def start_session(self, driver_flags=None):
+        """
+        Start warm sqlline process, statements are executed in it by `SqllineSession.execute`
+        without starting new JVM. Session must be closed by `SqllineSession.close`.
+        """
+        host, run_sqlline = self.get_sqlline_command(driver_flags)
+        return SqllineSession(self, host, run_sqlline, self.ignite.config['rt']['remote']['test_dir']).start()
 
-        # create sql commands file
-        for sql_cmd in sql_commands:
-            commands.append('echo %s >> %s' % (sql_cmd, sql_cmd_file))
-        print_green(commands)
-        results = self.ignite.ssh.exec_on_host(host, commands)
-        print_green(results)
-
-        return sql_cmd_file
+    def util_prepare_sql_file(self, host, sql_commands, file_name='sql_commands.sql', remote_dir=None):
+        """
+        Write statements to local file and upload it to host.
+        :return: remote path of SQL file
+        """
+        if remote_dir is None:
+            remote_dir = self.ignite.config['rt']['remote']['test_dir']
+        local_dir = mkdtemp()
+        try:
+            local_file = path.join(local_dir, file_name)
+            with open(local_file, 'w') as w:
+                for sql_cmd in sql_commands:
+                    w.write('%s\n' % sql_cmd)
+            self.ignite.ssh.upload_on_host(host, [local_file], remote_dir)
+        finally:
+            rmtree(local_dir, ignore_errors=True)
+        return '%s/%s' % (remote_dir, file_name)
 
     @staticmethod
     def util_print_beautiful(buffer):
         for line in buffer.split('\n'):
             print_green(line)
-
@@ -14,8 +14,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from jinja2 import Environment, FileSystemLoader
 
+from .templateengine import TemplateEngine
 from .util import get_host_list
 
 
@@ -73,16 +73,8 @@ class IgniteTestContext:
         XMLConfigBuilder(self.config['rt']['test_resource_dir'], self.configs, **self.variables).build()
 
     def build_and_deploy(self, ssh):
-        from glob import glob
-        from os import path
-        from tiden.util import unix_path
-
         self.build_config()
-        files = []
-        for file in glob("%s/*" % self.config['rt']['test_resource_dir']):
-            if path.isfile(file):
-                files.append(unix_path(file))
-        ssh.upload(files, self.config['rt']['remote']['test_module_dir'])
+        ssh.deploy_resources(self.config['rt']['test_resource_dir'], self.config['rt']['remote']['test_module_dir'])
 
 
 class XMLConfigBuilder:
@@ -94,19 +86,13 @@ class XMLConfigBuilder:
     def build(self):
         if isinstance(self.config_templates, dict):
             for template, config in self.config_templates.items():
-                rendered_string = Environment(loader=FileSystemLoader(self.templates_dir),
-                                              trim_blocks=True) \
-                    .get_template(template) \
-                    .render(self.kwargs)
+                rendered_string = TemplateEngine().render(self.templates_dir, template, self.kwargs)
 
                 with open("%s/%s" % (self.templates_dir, config), "w+") as config_file:
                     config_file.write(rendered_string)
         if isinstance(self.config_templates, list):
             for file in self.config_templates:
-                rendered_string = Environment(loader=FileSystemLoader(self.templates_dir),
-                                              trim_blocks=True) \
-                    .get_template(file) \
-                    .render(self.kwargs)
+                rendered_string = TemplateEngine().render(self.templates_dir, file, self.kwargs)
 
                 with open("%s/%s" % (self.templates_dir, file), "w+") as config_file:
                     config_file.write(rendered_string)
@@ -19,8 +19,12 @@ from .tidenexception import TidenException
 
 import time
 from datetime import datetime
-from requests import post
-from json import dumps, loads
+from multiprocessing.dummy import Pool as ThreadPool
+from os import makedirs, path
+from threading import Lock
+from requests import Session
+from requests.adapters import HTTPAdapter
+from json import dump, dumps, load, loads
 
 
 class ZabbixApiException(TidenException):
@@ -33,10 +37,32 @@ class ZabbixApi():
     logger = get_logger('tiden')
     logger.set_suite('[ZabbixApi]')
 
-    def __init__(self, url, login, passwd):
+    # max number of concurrent history.get requests
+    history_threads = 8
+
+    def __init__(self, url, login, passwd, item_cache_path=None, history_threads=None):
+        """
+        :param url: Zabbix frontend url
+        :param login: Zabbix user
+        :param passwd: Zabbix password
+        :param item_cache_path: JSON file to keep found item ids between runs, no cache file by default
+        :param history_threads: max number of concurrent history requests
+        """
         self.url = '%s/api_jsonrpc.php' % url
         self.login = login
         self.passwd = passwd
+        if history_threads:
+            self.history_threads = history_threads
+        # keep-alive connections, one per concurrent history request
+        self.session = Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.history_threads)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.request_id = 0
+        self._lock = Lock()
+        self.item_cache_path = item_cache_path
+        # {host id: {metric name: [item id, value type]}}
+        self.item_cache = self._load_item_cache()
         # just to fail fast make login request here
         request = {
             'req_type': 'user.login',
@@ -48,31 +74,185 @@ class ZabbixApi():
         self.auth_key = self.get_request(request)
 
     def collect_metrics_from_servers(self, servers, metrics, start_time, stop_time=None):
+        """
+        Collect metrics history for servers: items of all hosts and metrics are looked up in one request
+        (or taken from item cache), then history of items is fetched concurrently.
+        :return: {metric name: {host name: {'timestamp': [...], 'values': [...]}}}, hosts without metric item
+            are omitted
+        """
         host_ids = self.get_hosts(servers)
-        data = {}
+        items = self.get_items([host_id for _, host_id in host_ids], metrics)
+
+        time_from = self.util_get_time(start_time.timetuple())
+        time_till = self.util_get_time((stop_time or datetime.now()).timetuple())
 
+        history_requests = []
         for metric_name in metrics:
             for host, host_id in host_ids:
-                self.logger.debug('%s %s' % (host, host_id))
-                metric_id, value_type = self.get_metric_id_by_description(host_id, metric_name)
-                self.logger.debug('Metric_id = %s' % metric_id)
-                m_history = self.get_cpu_metrics_history(
-                    metric_id, value_type,
-                    time_from=start_time, time_till=stop_time)
-                if data.get(metric_name):
-                    data[metric_name].update({host: m_history})
-                else:
-                    data[metric_name] = {host: m_history}
+                item = items.get((host_id, metric_name))
+                if item is None:
+                    self.logger.debug('Metric \'%s\' not found for host %s %s' % (metric_name, host, host_id))
+                    continue
+                history_requests.append((metric_name, host, item[0], item[1]))
+
+        histories = []
+        if history_requests:
+            pool = ThreadPool(min(self.history_threads, len(history_requests)))
+            histories = pool.starmap(self.get_metrics_history,
+                                     [(item_id, value_type, time_from, time_till)
+                                      for _, _, item_id, value_type in history_requests])
+            pool.close()
+            pool.join()
 
+        data = {}
+        for (metric_name, host, _, _), m_history in zip(history_requests, histories):
+            data.setdefault(metric_name, {})[host] = m_history
         return data
 
+    def get_items(self, host_ids, metric_names):
+        """
+        Find items of metrics for hosts. Cached item ids are checked by single item.get request, items not found in
+        item cache or gone from Zabbix server are searched by description with single item.get request for all hosts
+        and metrics.
+        :return: {(host id, metric name): (item id, value type)}, metric must match exactly one host item
+        """
+        items = {}
+        cached_items = {}
+        for host_id in host_ids:
+            for metric_name in metric_names:
+                cached = self.item_cache.get(host_id, {}).get(metric_name)
+                if cached:
+                    cached_items[(host_id, metric_name)] = cached[0]
+
+        if cached_items:
+            request = {
+                'req_type': 'item.get',
+                'req_body': {
+                    'itemids': sorted(set(cached_items.values())),
+                    'output': ['itemid', 'hostid', 'value_type'],
+                }
+            }
+            existing = {(item.get('hostid'), item.get('itemid')): item for item in self.get_request(request)}
+            for (host_id, metric_name), item_id in cached_items.items():
+                item = existing.get((host_id, item_id))
+                if item:
+                    items[(host_id, metric_name)] = (item_id, item.get('value_type'))
+                else:
+                    self.logger.debug('Cached item %s of metric \'%s\' is gone for host %s' % (
+                        item_id, metric_name, host_id))
+                    self.item_cache[host_id].pop(metric_name, None)
+
+        missing_hosts = set()
+        missing_metrics = set()
+        for host_id in host_ids:
+            for metric_name in metric_names:
+                if (host_id, metric_name) not in items:
+                    missing_hosts.add(host_id)
+                    missing_metrics.add(metric_name)
+        if not missing_hosts:
+            if len(items) < len(cached_items):
+                self._save_item_cache()
+            return items
+
+        request = {
+            'req_type': 'item.get',
+            'req_body': {
+                'hostids': sorted(missing_hosts),
+                'search': {'description': sorted(missing_metrics)},
+                'searchByAny': True,
+                'output': ['itemid', 'hostid', 'value_type', 'description'],
+            }
+        }
+        result = self.get_request(request)
+        self.logger.debug('get_items result is: \n%s' % result)
+
+        found = {}
+        for item in result:
+            description = (item.get('description') or '').lower()
+            for metric_name in missing_metrics:
+                # search is case-insensitive substring match
+                if metric_name.lower() in description:
+                    found.setdefault((item.get('hostid'), metric_name), []).append(item)
+
+        for host_id in missing_hosts:
+            for metric_name in missing_metrics:
+                if (host_id, metric_name) in items:
+                    continue
+                candidates = found.get((host_id, metric_name), [])
+                if len(candidates) == 1 and candidates[0].get('itemid'):
+                    item = (candidates[0].get('itemid'), candidates[0].get('value_type'))
+                    items[(host_id, metric_name)] = item
+                    self.item_cache.setdefault(host_id, {})[metric_name] = list(item)
+        self._save_item_cache()
+        return items
+
+    def get_metrics_history(self, metric_id, value_type, time_from, time_till):
+        """
+        :param time_from: unix timestamp
+        :param time_till: unix timestamp
+        :return: {'timestamp': [...], 'values': [...]} ordered by time
+        """
+        request = {
+            'req_type': 'history.get',
+            'req_body': {
+                'history': value_type,
+                'itemids': metric_id,
+                'time_from': time_from,
+                'time_till': time_till,
+                'sortfield': 'clock',
+                'sortorder': 'ASC',
+            }
+        }
+        results = self.get_request(request)
+
+        # numeric float and numeric unsigned, text values are kept as is
+        cast = {'0': float, '3': int}.get(str(value_type), str)
+        m_history = {'timestamp': [], 'values': []}
+        for result in results:
+            if result.get('clock') and result.get('value'):
+                m_history['timestamp'].append(datetime.fromtimestamp(int(result['clock'])).
+                                              strftime('%Y-%m-%d %H:%M:%S'))
+                m_history['values'].append(cast(result['value']))
+        return m_history
+
+    def _load_item_cache(self):
+        if not self.item_cache_path or not path.isfile(self.item_cache_path):
+            return {}
+        try:
+            with open(self.item_cache_path) as r:
+                cache = load(r)
+        except (OSError, ValueError) as e:
+            self.logger.debug('Item cache %s is not loaded: %s' % (self.item_cache_path, e))
+            return {}
+        # ids differ between Zabbix servers
+        return cache.get(self.url, {})
+
+    def _save_item_cache(self):
+        if not self.item_cache_path:
+            return
+        cache = {}
+        if path.isfile(self.item_cache_path):
+            try:
+                with open(self.item_cache_path) as r:
+                    cache = load(r)
+            except (OSError, ValueError):
+                cache = {}
+        cache[self.url] = self.item_cache
+        cache_dir = path.dirname(path.abspath(self.item_cache_path))
+        makedirs(cache_dir, exist_ok=True)
+        with open(self.item_cache_path, 'w') as w:
+            dump(cache, w, indent=2)
+
+    def close(self):
+        self.session.close()
+
     def get_hosts(self, servers):
         host_names = ['lab%s' % id.split('.')[-1] for id in servers]
         hostid_name = []
 
         request = {
             'req_type': 'host.get',
-            'req_body': {'monitored_hosts': '1', 'output': ['hostid', 'name']}
+            'req_body': {'monitored_hosts': '1', 'output': ['hostid', 'name'], 'filter': {'name': host_names}}
         }
 
         results = self.get_request(request)
@@ -203,17 +383,21 @@ class ZabbixApi():
         :param params: ZabbixAPI method arguments.
 
         """
+        with self._lock:
+            self.request_id += 1
+            request_id = self.request_id
+
         request_json = {
             'jsonrpc': '2.0',
             'method': method,
             'params': params or {},
-            'id': '1',
+            'id': str(request_id),
         }
 
         if self.auth_key and method not in ['user.login']:
             request_json['auth'] = self.auth_key
 
-        res = post(
+        res = self.session.post(
             self.url,
             dumps(request_json),
             headers={'Content-Type': 'application/json-rpc'}
@@ -18,6 +18,7 @@ import pytest
 from pprint import PrettyPrinter
 import os.path
 
+from tiden.tidenexception import TidenException
 from tiden.utilities.control_utility import ControlUtility
 
 help_activate_deactivate_only = {
@@ -246,3 +247,58 @@ def test_parse_help(data):
         for command, use_force in data['commands'].items():
             assert use_force == commands[command]['force'], "Force argument matches"
 
+
+
+def test_help_cache_and_baseline_wait(monkeypatch):
+    help_file_path = os.path.join(
+        os.path.dirname(__file__), 'res', 'control_utility', 'test_parse_help_2.5.8.txt'
+    )
+    with open(help_file_path, 'r') as f:
+        help_text = f.read()
+
+    class MockSsh:
+        def __init__(self):
+            self.commands = []
+
+        def exec_on_host(self, host, commands, **kwargs):
+            self.commands.extend(commands)
+            return {host: [help_text]}
+
+    class MockIgnite:
+        name = 'ignite'
+        nodes = {1: {'host': '127.0.0.1', 'ignite_home': '/tmp/tiden_test_help_cache'}}
+        ssh = MockSsh()
+
+        def get_all_default_nodes(self):
+            return [1]
+
+    ignite = MockIgnite()
+    ControlUtility.help_cache.pop('/tmp/tiden_test_help_cache', None)
+    assert ControlUtility(ignite).get_force_attr('baseline_add') == '--yes'
+    assert ControlUtility(ignite).get_force_attr('baseline_remove') == '--yes'
+    # help is asked only once for the same Ignite home
+    assert len(ignite.ssh.commands) == 1
+
+    cu = ControlUtility(ignite)
+    outputs = iter([
+        'Baseline nodes:\n    ConsistentId=node_1, State=ONLINE, Order=1\n',
+        'Baseline nodes:\n    ConsistentId=node_1, State=ONLINE, Order=1\n'
+        '    ConsistentId=node_2, State=ONLINE, Order=2\n',
+    ])
+
+    def mock_control_utility(*args, **kwargs):
+        cu.latest_utility_output = next(outputs)
+        return cu
+
+    monkeypatch.setattr(cu, 'control_utility', mock_control_utility)
+    monkeypatch.setattr(ControlUtility, 'state_poll_interval', 0)
+    cu.latest_utility_output = 'Other nodes:\n    ConsistentId=node_2, Order=2\n'
+    assert cu.wait_for_baseline(lambda nodes: nodes.get('node_2', '') != '', 'node_2 added', timeout=5)
+    with pytest.raises(TidenException):
+        cu.wait_for_baseline(lambda nodes: 'node_3' in nodes, 'node_3 added', timeout=-1)
+
+    # nodes missing from error output are not removed from baseline
+    cu.latest_utility_output = 'Error: Failed to get baseline\n'
+    monkeypatch.setattr(cu, 'control_utility', lambda *args, **kwargs: cu)
+    with pytest.raises(TidenException):
+        cu.wait_for_baseline(lambda nodes: nodes.get('node_1', '') == '', 'node_1 removed', timeout=-1)
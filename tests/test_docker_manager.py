@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import tarfile
+from json import dumps
+from os import chmod, environ, makedirs, path, remove
+from shutil import rmtree
+from subprocess import run
+from threading import Timer
+from time import time
+
+from tiden.dockermanager import DockerManager
+from tiden.localpool import LocalPool
+
+IMAGE_HEX = 'f' * 64
+
+# docker emulation: images loaded on host are kept in host directory
+FAKE_DOCKER = '''#!/usr/bin/env python3
+import json, sys, tarfile
+with open('docker_calls.log', 'a') as w:
+    w.write(' '.join(sys.argv[1:]) + '\\n')
+args = sys.argv[1:]
+if args[:2] == ['images', '-q']:
+    try:
+        print(open('images.txt').read(), end='')
+    except FileNotFoundError:
+        pass
+elif args[:2] == ['image', 'load']:
+    src = tarfile.open(args[3]) if '-i' in args else tarfile.open(fileobj=sys.stdin.buffer, mode='r|*')
+    for member in src:
+        if member.name == 'manifest.json':
+            config = json.loads(src.extractfile(member).read())[0]['Config']
+            with open('images.txt', 'a') as w:
+                w.write('sha256:%s\\n' % config[:-len('.json')])
+            print('Loaded image ID: sha256:%s' % config[:-len('.json')])
+'''
+
+
+def make_image_dump(file_path):
+    with tarfile.open(file_path, 'w') as tar:
+        for name, data in [('manifest.json', dumps([{'Config': '%s.json' % IMAGE_HEX, 'Layers': []}]).encode()),
+                           ('%s.json' % IMAGE_HEX, b'{}')]:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+def test_load_images_only_where_missing(local_config, tmpdir, monkeypatch):
+    home = local_config['environment']['home']
+    bin_dir = str(tmpdir.mkdir('bin'))
+    with open(path.join(bin_dir, 'docker'), 'w') as w:
+        w.write(FAKE_DOCKER)
+    chmod(path.join(bin_dir, 'docker'), 0o755)
+    monkeypatch.setenv('PATH', '%s:%s' % (bin_dir, environ['PATH']))
+
+    dump_path = str(tmpdir.join('image.tar'))
+    make_image_dump(dump_path)
+    assert DockerManager.get_image_dump_id(dump_path) == 'sha256:%s' % IMAGE_HEX
+
+    pool = LocalPool(local_config['ssh'])
+    pool.connect()
+    hosts = sorted(pool.hosts)
+    for host in hosts:
+        rmtree(path.join(home, host, 'artifacts'), ignore_errors=True)
+        makedirs(path.join(home, host, 'artifacts'))
+        for file_name in ['images.txt', 'docker_calls.log']:
+            if path.exists(path.join(home, host, file_name)):
+                remove(path.join(home, host, file_name))
+    # only first host has artifact copy
+    make_image_dump(path.join(home, hosts[0], 'artifacts', 'image.tar'))
+    config = {
+        'artifacts': {'image': {'type': 'image_dump', 'path': dump_path,
+                                'remote_path': '%s/artifacts/image.tar' % home}},
+        'remote': {'artifacts_dir': '%s/artifacts' % home},
+        'rt': {'remote': {'test_dir': '%s/artifacts' % home}},
+    }
+    try:
+        docker = DockerManager(config, pool)
+        docker.load_images()
+        assert docker.get_image_ids() == {host: {'sha256:%s' % IMAGE_HEX} for host in hosts}
+        with open(path.join(home, hosts[0], 'docker_calls.log')) as r:
+            assert 'image load -i' in r.read()
+        with open(path.join(home, hosts[1], 'docker_calls.log')) as r:
+            assert 'image load\n' in r.read()
+        # compressed archive is removed from host after load
+        assert not path.exists(path.join(home, hosts[1], 'artifacts', 'image.tar.gz'))
+
+        # second load finds image on every host
+        docker.load_images()
+        for host in hosts:
+            with open(path.join(home, host, 'docker_calls.log')) as r:
+                assert len([line for line in r if line.startswith('image load')]) == 1
+    finally:
+        pool.close()
+
+
+def test_wait_for_text(local_config):
+    home = local_config['environment']['home']
+    pool = LocalPool(local_config['ssh'])
+    pool.connect()
+    host = pool.hosts[0]
+    log_file = path.join(home, host, 'container.log')
+    with open(log_file, 'w') as w:
+        w.write('starting\n')
+
+    def append():
+        with open(log_file, 'a') as w:
+            w.write('node started\nnode ready\n')
+
+    timer = Timer(0.5, append)
+    timer.start()
+    try:
+        docker = DockerManager({}, pool)
+        assert docker.wait_for_text(host, '%s/container.log' % home, 'node',
+                                    lambda found: 'ready' in found, timeout=10)
+        assert not docker.wait_for_text(host, '%s/container.log' % home, 'failed',
+                                        lambda found: found, timeout=1, strict=False)
+    finally:
+        timer.cancel()
+        pool.close()
+
+
+# docker emulation: containers, networks and volumes of host are kept in host directory
+FAKE_DOCKER_STATE = '''#!/usr/bin/env python3
+import json, sys
+with open('docker_calls.log', 'a') as w:
+    w.write(' '.join(sys.argv[1:]) + '\\n')
+state = json.load(open('docker_state.json'))
+args = sys.argv[1:]
+if args[0] == 'ps':
+    for c in state['containers']:
+        print('%s|%s|%s|%s' % (c['id'], c['image'], c['status'], c['name']))
+elif args[:2] == ['network', 'ls']:
+    for n in state['networks']:
+        print('%s|%s|bridge' % (n, n))
+elif args[:2] == ['volume', 'ls']:
+    for v in state['volumes']:
+        print('%s|local' % v)
+elif args[0] == 'rm':
+    state['containers'] = [c for c in state['containers'] if c['id'] not in args]
+elif args[:2] == ['network', 'rm']:
+    state['networks'] = [n for n in state['networks'] if n not in args]
+elif args[:2] == ['volume', 'rm']:
+    state['volumes'] = [v for v in state['volumes'] if v not in args]
+json.dump(state, open('docker_state.json', 'w'))
+'''
+
+
+def test_reconcile(local_config, tmpdir, monkeypatch):
+    home = local_config['environment']['home']
+    bin_dir = str(tmpdir.mkdir('bin'))
+    with open(path.join(bin_dir, 'docker'), 'w') as w:
+        w.write(FAKE_DOCKER_STATE)
+    chmod(path.join(bin_dir, 'docker'), 0o755)
+    monkeypatch.setenv('PATH', '%s:%s' % (bin_dir, environ['PATH']))
+
+    pool = LocalPool(local_config['ssh'])
+    pool.connect()
+    hosts = sorted(pool.hosts)
+    for idx, host in enumerate(hosts):
+        state = {
+            'containers': [
+                {'id': '%s%d' % ('a' * 63, idx), 'image': 'ignite:2.8', 'status': 'Up 2 hours',
+                 'name': 'ignite-old-%d' % idx},
+                {'id': '%s%d' % ('b' * 63, idx), 'image': 'zk:3.5', 'status': 'Exited (0) 1 hour ago',
+                 'name': 'zk-old-%d' % idx},
+                {'id': '%s%d' % ('c' * 63, idx), 'image': 'registry:2', 'status': 'Up 5 days',
+                 'name': 'registry'},
+            ],
+            'networks': ['bridge', 'host', 'none', 'tiden-net'],
+            'volumes': ['ignite-work-%d' % idx, 'registry-data'],
+        }
+        with open(path.join(home, host, 'docker_state.json'), 'w') as w:
+            w.write(dumps(state))
+        if path.exists(path.join(home, host, 'docker_calls.log')):
+            remove(path.join(home, host, 'docker_calls.log'))
+    try:
+        docker = DockerManager({}, pool)
+        inventory = docker.get_inventory()
+        assert len(inventory[hosts[0]]['containers']) == 3
+        assert inventory[hosts[0]]['containers'][0]['running']
+        assert not inventory[hosts[0]]['containers'][1]['running']
+        assert [n['name'] for n in inventory[hosts[0]]['networks']] == ['bridge', 'host', 'none', 'tiden-net']
+
+        keep = {'containers': ['registry$'], 'volumes': ['registry-']}
+        # networks and volumes are reconciled only when asked explicitly
+        leftovers = docker.reconcile(keep=keep, dry_run=True)
+        assert list(leftovers[hosts[1]].keys()) == ['containers']
+        assert sorted([c['name'] for c in leftovers[hosts[1]]['containers']]) == ['ignite-old-1', 'zk-old-1']
+        all_kinds = ('containers', 'networks', 'volumes')
+        leftovers = docker.reconcile(keep=keep, kinds=all_kinds, dry_run=True)
+        assert [n['name'] for n in leftovers[hosts[1]]['networks']] == ['tiden-net']
+        assert [v['name'] for v in leftovers[hosts[1]]['volumes']] == ['ignite-work-1']
+
+        docker.reconcile(keep=keep)
+        assert docker.reconcile(keep=keep, dry_run=True) == {}
+        assert [v['name'] for v in docker.get_inventory([hosts[1]])[hosts[1]]['volumes']] == [
+            'ignite-work-1', 'registry-data']
+
+        docker.reconcile(keep=keep, kinds=all_kinds)
+        assert docker.reconcile(keep=keep, kinds=all_kinds, dry_run=True) == {}
+        for host in hosts:
+            inventory = docker.get_inventory([host])[host]
+            assert [c['name'] for c in inventory['containers']] == ['registry']
+            assert [v['name'] for v in inventory['volumes']] == ['registry-data']
+            # removal is single batched command per kind
+            with open(path.join(home, host, 'docker_calls.log')) as r:
+                assert len([line for line in r if line.startswith('rm ')]) == 1
+    finally:
+        pool.close()
+
+
+# docker emulation: `run` prints container ID, `logs -f` follows container output for a while
+FAKE_DOCKER_RUN = '''#!/bin/sh
+case "$1" in
+    run) printf '%064d\\n' $$ ;;
+    logs) echo "logs of $3"; sleep 3 ;;
+esac
+'''
+
+
+def test_run_containers(local_config, tmpdir, monkeypatch):
+    home = local_config['environment']['home']
+    bin_dir = str(tmpdir.mkdir('bin'))
+    with open(path.join(bin_dir, 'docker'), 'w') as w:
+        w.write(FAKE_DOCKER_RUN)
+    chmod(path.join(bin_dir, 'docker'), 0o755)
+    monkeypatch.setenv('PATH', '%s:%s' % (bin_dir, environ['PATH']))
+
+    pool = LocalPool(local_config['ssh'])
+    pool.connect()
+    hosts = sorted(pool.hosts)
+    for host in hosts:
+        makedirs(path.join(home, host, 'test_dir'), exist_ok=True)
+
+    # generated scripts are kept to check them with bash too
+    scripts = []
+    pool_exec = pool.exec
+
+    def exec_and_keep(commands, **kwargs):
+        scripts.extend([command for host_commands in commands.values() for command in host_commands])
+        return pool_exec(commands, **kwargs)
+
+    monkeypatch.setattr(pool, 'exec', exec_and_keep)
+    try:
+        docker = DockerManager({'rt': {'remote': {'test_dir': '%s/test_dir' % home}}}, pool)
+        started_at = time()
+        started = docker.run_containers([
+            ('ignite', hosts[0], {'name': 'ignite-1'}),
+            ('ignite', hosts[0], {'name': 'ignite-2'}),
+            ('zk', hosts[1], {'name': 'zk-1'}),
+        ])
+        # logs followers are left in background
+        assert time() - started_at < 2
+        assert [name for _, _, name in started] == ['ignite-1', 'ignite-2', 'zk-1']
+        assert len(set([container_id for container_id, _, _ in started])) == 3
+        assert started[0][1] == '%s/test_dir/ignite-1.log' % home
+        for script in scripts:
+            assert run(['bash', '-n', '-c', script]).returncode == 0
+    finally:
+        pool.close()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from csv import reader
+from json import load
+from os.path import join
+
+from tiden.apps.ignite.exchange_analytics import ExchangeAnalytics
+from tiden.util import distribution
+from .test_exchanges_info import exch_test_data, _get_test_data
+
+
+def test_distribution():
+    assert distribution([]) == {'count': 0}
+    assert distribution(range(100, 0, -1)) == {
+        'count': 100, 'min': 1, 'p50': 50, 'p95': 95, 'p99': 99, 'max': 100, 'mean': 50.5
+    }
+
+
+def test_exchange_analytics(tmpdir):
+    for exch_test in exch_test_data.keys():
+        exchanges = _get_test_data(exch_test)
+        analytics = ExchangeAnalytics(exchanges)
+        timings = {timing['topVer']: timing for timing in analytics.get_exchange_timings()}
+
+        for chain in analytics.get_merged_chains():
+            assert chain[0] in timings
+            assert timings[chain[0]]['merged'] == chain[1:]
+            for top_ver in chain[1:]:
+                assert top_ver not in timings
+
+        if exch_test_data[exch_test]['check_times']:
+            for k, (major_topVer, minor_topVer) in enumerate(exch_test_data[exch_test]['exchanges']):
+                exchange = exchanges.get_exchange(major_topVer, minor_topVer)
+                timing = timings.get(exchanges.glue_version_num(major_topVer, minor_topVer))
+                if timing is None or exchange.merged or timing['x2_time'] is None:
+                    continue
+                assert timing['x2_time'] == exch_test_data[exch_test]['exchange_x2_time'][k]
+                assert timing['slowest_time'] == max(timing['nodes'].values())
+
+        summary = analytics.get_summary()
+        assert summary['exchanges'] == len(timings)
+
+        json_path = analytics.to_json(join(str(tmpdir), 'exchanges.%s.json' % exch_test))
+        with open(json_path) as r:
+            assert len(load(r)['exchanges']) == len(timings)
+        csv_path = analytics.to_csv(join(str(tmpdir), 'exchanges.%s.csv' % exch_test))
+        with open(csv_path) as r:
+            rows = list(reader(r))
+        assert len(rows) == 1 + sum(len(timing['nodes']) for timing in timings.values())
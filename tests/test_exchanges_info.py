@@ -18,7 +18,7 @@ import sys
 
 from tiden.util import read_yaml_file, prettydict
 from os.path import join, dirname
-from tiden.apps.ignite.exchange_info import ExchangesCollection
+from tiden.apps.ignite.exchange_info import ExchangesCollection, ExchangeInfo
 
 
 def test_log_timestamp():
@@ -397,3 +397,36 @@ def test_exchange_info_grep_logs():
     ex = ExchangesCollection.get_exchanges_from_logs(ignite, 'alive_server')
     print(prettydict(ex))
 
+
+    # single pass extraction gives the same messages as separate greps
+    multi = ignite.grep_all_data_from_log_multi('alive_server', ExchangesCollection.exchange_log_patterns)
+    for node_option_name, (grep_text, regex_match) in ExchangesCollection.exchange_log_patterns.items():
+        assert multi[node_option_name] == ignite.grep_all_data_from_log(
+            'alive_server', grep_text, regex_match, node_option_name)
+
+
+def test_exchanges_collection_index():
+    exchanges = ExchangesCollection()
+    for topVer in [50000, 30001, 40000, 30000, 60000]:
+        exchanges.add_exchange_info(topVer)
+    assert exchanges.get_top_vers() == [30000, 30001, 40000, 50000, 60000]
+    assert [str(e) for e in exchanges.get_exchanges_range(30001, 50000)] == ['[3, 1]', '[4, 0]', '[5, 0]']
+
+    del exchanges[40000]
+    exchanges.update({70000: ExchangeInfo(major_topVer=7, minor_topVer=0)})
+    assert exchanges.get_top_vers() == [30000, 30001, 50000, 60000, 70000]
+
+    # pop followed by insert of another key keeps length, index must follow anyway
+    exchanges.pop(70000)
+    exchanges.setdefault(20000, ExchangeInfo(major_topVer=2, minor_topVer=0))
+    assert exchanges.get_top_vers() == [20000, 30000, 30001, 50000, 60000]
+    assert exchanges.popitem()[0] == 20000
+    exchanges.update({70000: ExchangeInfo(major_topVer=7, minor_topVer=0)})
+    assert exchanges.get_top_vers() == [30000, 30001, 50000, 60000, 70000]
+
+    # [5, 0] merged into [6, 0]
+    exchanges.add_exchange_info(50000, merged_exchange=60000)
+    exchanges.add_exchange_info(60000, merged_exchange=50000)
+    assert str(exchanges.get_min_merged_exchange(6)) == '[5, 0]'
+    assert str(exchanges.get_max_merged_exchange(5)) == '[6, 0]'
+    assert str(exchanges.get_max_merged_exchange(4)) == '[6, 0]'
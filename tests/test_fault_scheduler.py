@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from os import chmod, environ, makedirs, path
+from subprocess import Popen, check_output
+from threading import Timer
+from time import sleep
+
+import pytest
+
+from tiden.faultscheduler import FaultScheduler
+from tiden.localpool import LocalPool
+from tiden.tidenexception import TidenException
+
+
+def test_fault_timeline(local_config):
+    home = local_config['environment']['home']
+    pool = LocalPool(local_config['ssh'])
+    pool.connect()
+    hosts = sorted(pool.hosts)
+    for host in hosts:
+        makedirs(path.join(home, host, 'faults'), exist_ok=True)
+    node_log = path.join(home, hosts[1], 'faults', 'node.log')
+    with open(node_log, 'w') as w:
+        w.write('Checkpoint started\n')
+    sleeper = Popen(['sleep', '30'])
+
+    scheduler = FaultScheduler.from_timeline(pool, '%s/faults' % home, [
+        {'fault': 'sigstop', 'host': hosts[0], 'pid': sleeper.pid, 'at': 0.3, 'duration': 0.5},
+        {'fault': 'add', 'host': hosts[0], 'inject': 'echo on > flag', 'rollback': 'rm flag', 'at': 0.2,
+         'duration': 0.2, 'name': 'flag'},
+        # old checkpoint message in log does not trigger fault
+        {'fault': 'add', 'host': hosts[1], 'inject': 'echo killed > killed', 'on_log': ('node.log', 'Checkpoint st'),
+         'log_timeout': 5, 'name': 'kill'},
+        {'fault': 'add', 'host': hosts[1], 'inject': 'echo never > never', 'on_log': ('node.log', 'never happens'),
+         'log_timeout': 0.3, 'name': 'skipped'},
+    ])
+    scheduler.start_lead = 0.5
+
+    def checkpoint():
+        with open(node_log, 'a') as w:
+            w.write('Checkpoint started\n')
+
+    timer = Timer(1.5, checkpoint)
+    timer.start()
+    try:
+        scheduler.run(timeout=20)
+    finally:
+        timer.cancel()
+        sleeper.kill()
+        sleeper.wait()
+        pool.close()
+
+    report = scheduler.get_report()
+    sigstop, flag, kill, skipped = report['sigstop#1'], report['flag#2'], report['kill#3'], report['skipped#4']
+    assert sigstop['rc'] == 0 and sigstop['rolled_back'] - sigstop['inject'] == pytest.approx(0.5, abs=0.1)
+    assert abs(sigstop['offset'] - 0.3) < 0.2
+    assert flag['inject'] < sigstop['inject']
+    assert flag['rollback'] - flag['inject'] == pytest.approx(0.2, abs=0.1)
+    assert not path.exists(path.join(home, hosts[0], 'faults', 'flag'))
+    assert kill['triggered'] - scheduler.start_time > 1.0
+    assert kill['host'] == hosts[1] and kill['rc'] == 0
+    assert path.exists(path.join(home, hosts[1], 'faults', 'killed'))
+    assert 'trigger_timeout' in skipped and 'inject' not in skipped
+    assert not path.exists(path.join(home, hosts[1], 'faults', 'never'))
+
+
+def test_fault_without_duration_is_rolled_back_by_stop(local_config):
+    home = local_config['environment']['home']
+    pool = LocalPool(local_config['ssh'])
+    pool.connect()
+    host = sorted(pool.hosts)[0]
+    makedirs(path.join(home, host, 'faults'), exist_ok=True)
+    held_file = path.join(home, host, 'faults', 'held')
+    try:
+        scheduler = FaultScheduler(pool, '%s/faults' % home)
+        scheduler.start_lead = 0.2
+        scheduler.add(host, 'echo on > held', 'rm held', name='held')
+        scheduler.run(timeout=10)
+        assert path.exists(held_file)
+        assert 'rollback' not in scheduler.get_report()['held#1']
+        scheduler.stop()
+        assert not path.exists(held_file)
+    finally:
+        pool.close()
+
+
+# fio emulation: creates io file and keeps running
+FAKE_FIO = '''#!/usr/bin/env python3
+import sys, time
+directory = [arg.split('=', 1)[1].strip('"') for arg in sys.argv if arg.startswith('--directory=')][0]
+open('%s/io.test.file' % directory, 'w').close()
+time.sleep(30)
+'''
+
+
+def test_stop_rolls_back_fio(local_config, tmpdir, monkeypatch):
+    home = local_config['environment']['home']
+    bin_dir = str(tmpdir.mkdir('bin'))
+    with open(path.join(bin_dir, 'fio'), 'w') as w:
+        w.write(FAKE_FIO)
+    chmod(path.join(bin_dir, 'fio'), 0o755)
+    monkeypatch.setenv('PATH', '%s:%s' % (bin_dir, environ['PATH']))
+
+    pool = LocalPool(local_config['ssh'])
+    pool.connect()
+    host = sorted(pool.hosts)[0]
+    makedirs(path.join(home, host, 'faults'), exist_ok=True)
+    io_file = path.join(home, host, 'faults', 'io.test.file')
+    try:
+        scheduler = FaultScheduler(pool, '%s/faults' % home)
+        scheduler.start_lead = 0.2
+        # scheduler script runs in its directory, script content is not rewritten by local pool
+        fio = scheduler.fio(host, '.', 20)
+        scheduler.start()
+        try:
+            scheduler.wait_for_fault(fio, timeout=10)
+            sleep(0.5)
+            assert path.exists(io_file)
+        finally:
+            scheduler.stop()
+        assert not path.exists(io_file)
+        assert 'fio --name=test' not in check_output(['ps', '-eo', 'args']).decode()
+    finally:
+        pool.close()
+
+
+def test_unknown_fault(local_config):
+    with pytest.raises(TidenException):
+        FaultScheduler.from_timeline(None, '/tmp', [{'fault': 'stop', 'host': 'localhost'}])
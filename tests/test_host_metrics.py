@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from os import makedirs, path
+from time import sleep
+
+from tiden.hostmetrics import HostMetricsCollector
+from tiden.localpool import LocalPool
+
+
+def _record(time, cpu, mem_available, sectors_read, sectors_written, io_ms, rx, tx):
+    return '\n'.join([
+        'T %s' % time,
+        'cpu  %s' % ' '.join(str(v) for v in cpu),
+        'MemTotal:        8000000 kB',
+        'MemAvailable:    %s kB' % mem_available,
+        'D    8       0 sda 100 0 %d 0 50 0 %d 0 0 %d 0' % (sectors_read, sectors_written, io_ms),
+        'D    8       1 sda1 100 0 %d 0 50 0 %d 0 0 %d 0' % (sectors_read, sectors_written, io_ms),
+        'N     lo: 999999 10 0 0 0 0 0 0 999999 10 0 0 0 0 0 0',
+        'N   eth0: %d 10 0 0 0 0 0 0 %d 10 0 0 0 0 0 0' % (rx, tx),
+        'E',
+    ]) + '\n'
+
+
+def test_parse_samples_skips_incomplete_record():
+    text = _record(10.0, [100, 0, 100, 800, 0, 0, 0, 0], 6000000, 0, 0, 0, 0, 0) + 'T 11.0\ncpu  1 2 3'
+    samples, lines_num = HostMetricsCollector.parse_samples(text)
+    assert len(samples) == 1
+    assert lines_num == 9
+    assert samples[0].time == 10.0
+    assert samples[0].mem_total == 8000000 * 1024
+    # partitions are not accounted
+    assert list(samples[0].disks.keys()) == ['sda']
+    assert sorted(samples[0].nets.keys()) == ['eth0', 'lo']
+
+
+def test_summarize_window():
+    text = _record(10.0, [100, 0, 100, 800, 0, 0, 0, 0], 6000000, 0, 0, 0, 0, 0) + \
+           _record(12.0, [200, 0, 200, 1500, 100, 0, 0, 0], 5000000, 4000, 8000, 1000, 2000, 4000)
+    samples, _ = HostMetricsCollector.parse_samples(text)
+    summary = HostMetricsCollector.summarize(samples)
+    assert summary['duration'] == 2.0
+    assert summary['samples'] == 1
+    assert summary['cpu_util'] == 20.0
+    assert summary['cpu_iowait'] == 10.0
+    assert summary['mem_used_max'] == 3000000 * 1024
+    assert summary['disk_read_bps'] == 4000 * 512 / 2
+    assert summary['disk_write_bps'] == 8000 * 512 / 2
+    assert summary['disk_busy_max'] == 50.0
+    assert summary['net_rx_bps'] == 1000
+    assert summary['net_tx_bps'] == 2000
+    assert HostMetricsCollector.summarize(samples[:1]) is None
+
+
+def _running(pid):
+    # killed collector may stay zombie until local pool shell reaps it
+    try:
+        with open('/proc/%d/stat' % pid) as r:
+            return r.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except FileNotFoundError:
+        return False
+
+
+def test_collector_stopped(local_config):
+    home = local_config['environment']['home']
+    pool = LocalPool(local_config['ssh'])
+    pool.connect()
+    for host in pool.hosts:
+        makedirs(path.join(home, host, 'metrics'), exist_ok=True)
+    metrics = HostMetricsCollector(pool, '%s/metrics' % home, interval=0.2)
+    try:
+        metrics.start()
+        sleep(0.5)
+        pids = {}
+        for host in pool.hosts:
+            with open(path.join(home, host, 'metrics', 'hoststat_proc.pid')) as r:
+                pids[host] = int(r.read())
+            assert _running(pids[host])
+        # restart stops previous collector
+        metrics.start()
+        for host in pool.hosts:
+            assert not _running(pids[host])
+        metrics.stop()
+        assert metrics.last_samples.keys() == set(pool.hosts)
+        for host in pool.hosts:
+            assert not path.exists(path.join(home, host, 'metrics', 'hoststat_proc.pid'))
+    finally:
+        metrics.stop()
+        pool.close()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from tiden.utilities.idle_verify_dump import iter_dump_items, index_dump_items, diff_dumps
+
+dump_before = """idle_verify check has finished, found 2 partitions
+Partition: PartitionKeyV2 [grpId=1, grpName=cache_group_1, partId=0]
+Partition instances: [PartitionHashRecordV2 [isPrimary=true, consistentId=node_1, updateCntr=10, size=5, partHash=111], PartitionHashRecordV2 [isPrimary=false, consistentId=node_2, updateCntr=10, size=5, partHash=111]]
+Partition: PartitionKeyV2 [grpId=1, grpName=cache_group_1, partId=1]
+Partition instances: [PartitionHashRecordV2 [isPrimary=true, consistentId=node_2, updateCntr=3, size=1, partHash=222]]
+"""
+
+
+def test_iter_dump_items():
+    items = list(iter_dump_items(dump_before.splitlines(keepends=True)))
+    assert len(items) == 2
+    assert items[0]['info'] == {'name': ' PartitionKeyV2 ', 'grpId': '1', 'grpName': 'cache_group_1', 'partId': '0'}
+    assert items[0]['instances'][1] == {
+        'name': 'PartitionHashRecordV2', 'isPrimary': 'false', 'consistentId': 'node_2', 'updateCntr': '10',
+        'size': '5', 'partHash': '111'
+    }
+    assert index_dump_items(items)[('cache_group_1', '1')] == {'node_2': ('true', '3', '1', '222')}
+
+
+def test_diff_dumps():
+    dump_after = dump_before.replace('updateCntr=3, size=1, partHash=222', 'updateCntr=4, size=2, partHash=333')
+    before = list(iter_dump_items(dump_before.splitlines()))
+    after = index_dump_items(iter_dump_items(dump_after.splitlines()))
+
+    assert diff_dumps(before, before) == []
+    assert diff_dumps(before, after) == [
+        (('cache_group_1', '1'), 'node_2', ('true', '3', '1', '222'), ('true', '4', '2', '333')),
+    ]
+    assert diff_dumps(before, {}) == sorted(diff_dumps(before, {}))
+    assert len(diff_dumps(before, {})) == 3
@@ -49,3 +49,106 @@ def test_local_pool_exec_on_host_rm_files_by_mask(local_config):
     assert not os.path.exists(file1_path)
     assert not os.path.exists(file2_path)
 
+
+
+def test_local_pool_exec_on_host_output_and_isolation(local_config):
+    pool = LocalPool(local_config['ssh'])
+    pool.connect()
+    host = local_config['ssh']['hosts'][0]
+    host_home_path = os.path.join(local_config['environment']['home'], host)
+
+    result = pool.exec_on_host(host, ['cd /; printf "a\\nb"', 'pwd', 'exit 3', 'echo "$TIDEN_UNSET_VAR" done'])
+    # failed command output is skipped, directory change doesn't leak into next command
+    assert result == {host: ['a\nb', host_home_path + '\n', ' done\n']}
+
+
+def test_local_pool_exec_on_host_streaming_and_timeout(local_config):
+    pool = LocalPool(local_config['ssh'])
+    pool.connect()
+    host = local_config['ssh']['hosts'][0]
+
+    lines = []
+    result = pool.exec_on_host(host, ['echo 1; echo 2'], on_line=lambda h, line: lines.append((h, line)))
+    assert result == {host: ['1\n2\n']}
+    assert lines == [(host, '1'), (host, '2')]
+
+    result = pool.exec_on_host(host, ['sleep 5', 'echo ok'], timeout=1)
+    assert result == {host: ['ok\n']}
+
+
+def test_local_pool_exec_to_files_timed(local_config, tmpdir):
+    pool = LocalPool(local_config['ssh'])
+    pool.connect()
+    slow_host, fast_host = sorted(local_config['ssh']['hosts'])
+
+    results = pool.exec_to_files_timed({
+        slow_host: ('sleep 1; echo slow', str(tmpdir.join('slow.out'))),
+        fast_host: ('echo fast', str(tmpdir.join('fast.out'))),
+    })
+    # every host reports its own transfer time
+    assert results[slow_host][0] == 5 and results[slow_host][1] >= 1
+    assert results[fast_host][0] == 5 and results[fast_host][1] < 0.5
+    assert pool.exec_to_files({fast_host: ('exit 1', str(tmpdir.join('fail.out')))}) == {fast_host: None}
+
+
+def test_local_pool_java_main_class():
+    assert LocalPool._java_main_class(['java', '-Xmx1g', '-cp', 'a.jar:b.jar', 'org.Main', 'arg']) == 'org.Main'
+    assert LocalPool._java_main_class(['/usr/bin/java', '-DA=B', '-jar', '/tmp/app.jar']) == '/tmp/app.jar'
+
+
+def test_local_pool_deploy_resources(local_config, tmpdir):
+    pool = LocalPool(local_config['ssh'])
+    pool.connect()
+    home_path = local_config['environment']['home']
+    remote_dir = '%s/resources' % home_path
+    pool.exec(['rm -rf %s; mkdir -p %s' % (remote_dir, remote_dir)])
+    resource_dir = tmpdir.mkdir('res')
+    resource_dir.join('server.xml').write('server')
+    resource_dir.join('client.xml').write('client')
+
+    uploaded = pool.deploy_resources(str(resource_dir), remote_dir)
+    assert uploaded == {host: ['client.xml', 'server.xml'] for host in pool.hosts}
+    for host in pool.hosts:
+        host_dir = os.path.join(home_path, host, 'resources')
+        assert sorted(os.listdir(host_dir)) == ['client.xml', 'server.xml']
+
+    # only changed files are uploaded
+    assert pool.deploy_resources(str(resource_dir), remote_dir) == {}
+    resource_dir.join('server.xml').write('server2')
+    assert pool.deploy_resources(str(resource_dir), remote_dir) == {host: ['server.xml'] for host in pool.hosts}
+
+    # state of remote directory is checked by fresh pool
+    assert LocalPool(local_config['ssh']).deploy_resources(str(resource_dir), remote_dir) == {}
+
+    # files removed or edited on hosts since previous deployment are uploaded again
+    removed_host, edited_host = sorted(pool.hosts)
+    os.remove(os.path.join(home_path, removed_host, 'resources', 'client.xml'))
+    with open(os.path.join(home_path, edited_host, 'resources', 'server.xml'), 'w') as w:
+        w.write('edited')
+    assert pool.deploy_resources(str(resource_dir), remote_dir) == {
+        removed_host: ['client.xml'],
+        edited_host: ['server.xml'],
+    }
+    assert pool.deploy_resources(str(resource_dir), remote_dir) == {}
+
+
+def test_local_pool_deploy_resources_failed_upload(local_config, tmpdir, monkeypatch):
+    pool = LocalPool(local_config['ssh'])
+    pool.connect()
+    home_path = local_config['environment']['home']
+    remote_dir = '%s/resources' % home_path
+    pool.exec(['rm -rf %s; mkdir -p %s' % (remote_dir, remote_dir)])
+    resource_dir = tmpdir.mkdir('res')
+    resource_dir.join('server.xml').write('server')
+    failed_host, host = sorted(pool.hosts)
+
+    # upload errors are logged, not raised, by ssh pool
+    upload_on_host = pool.upload_on_host
+    monkeypatch.setattr(pool, 'upload_on_host', lambda upload_host, files, remote: (
+        None if upload_host == failed_host else upload_on_host(upload_host, files, remote)))
+    assert pool.deploy_resources(str(resource_dir), remote_dir) == {host: ['server.xml']}
+
+    # failed file is uploaded again
+    monkeypatch.setattr(pool, 'upload_on_host', upload_on_host)
+    assert pool.deploy_resources(str(resource_dir), remote_dir) == {failed_host: ['server.xml']}
+    assert pool.deploy_resources(str(resource_dir), remote_dir) == {}
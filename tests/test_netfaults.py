@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from os import chmod, environ, makedirs, path, remove
+
+import pytest
+
+from tiden.localpool import LocalPool
+from tiden.netfaults import NetworkFaults, get_netem_args, partition
+from tiden.tidenexception import TidenException
+
+# sudo emulation: commands and iptables-restore input are logged in host directory
+FAKE_SUDO = '''#!/bin/sh
+echo "$*" >> sudo_calls.log
+if [ "$1" = iptables-restore ] && [ -f restore_fails ]; then exit 1; fi
+if [ "$1" = iptables-restore ]; then cat >> sudo_calls.log; fi
+exit 0
+'''
+
+
+def test_matrix_rules():
+    net = NetworkFaults(None, '/tmp', hosts=['h1', 'h2', 'h3'], dev='eth0')
+    links = partition(['h1', 'h2'], ['h3'])
+    assert sorted(links.keys()) == [('h1', 'h3'), ('h2', 'h3'), ('h3', 'h1'), ('h3', 'h2')]
+    rules = net.get_iptables_rules('h3', links).split('\n')
+    assert '-A TIDEN_NETFAULT_OUT -d h1 -j DROP' in rules
+    assert '-A TIDEN_NETFAULT_IN -s h2 -j DROP' in rules
+    assert rules[-2:] == ['COMMIT', '']
+
+    # asymmetric link: only h1 -> h2 packets are dropped
+    rules = net.get_iptables_rules('h2', {('h1', 'h2'): 'drop'})
+    assert '-A TIDEN_NETFAULT_IN -s h1 -j DROP' in rules and 'OUT -d' not in rules
+
+    links = {('h1', 'h2'): {'delay': '100ms', 'jitter': '10ms', 'loss': '5%'}, ('h1', 'h3'): {'loss': '1%'}}
+    batch = net.get_tc_batch('h1', links, 'eth0').split('\n')
+    assert batch[0].startswith('qdisc add dev eth0 root handle 1: prio bands 5 priomap')
+    assert batch[1] == 'qdisc add dev eth0 parent 1:4 handle 104: netem delay 100ms 10ms loss 5%'
+    assert batch[2] == 'filter add dev eth0 protocol ip parent 1:0 prio 1 u32 match ip dst h2/32 flowid 1:4'
+    assert batch[4] == 'filter add dev eth0 protocol ip parent 1:0 prio 1 u32 match ip dst h3/32 flowid 1:5'
+    assert net.get_tc_batch('h2', links, 'eth0') == ''
+
+    with pytest.raises(TidenException):
+        get_netem_args({'latency': '10ms'})
+    with pytest.raises(TidenException):
+        net.get_tc_batch('h1', {('h1', 'h%s' % i): {'loss': '1%'} for i in range(20)}, 'eth0')
+
+
+def test_apply_changed_hosts_only(local_config, tmpdir, monkeypatch):
+    home = local_config['environment']['home']
+    bin_dir = str(tmpdir.mkdir('bin'))
+    with open(path.join(bin_dir, 'sudo'), 'w') as w:
+        w.write(FAKE_SUDO)
+    chmod(path.join(bin_dir, 'sudo'), 0o755)
+    monkeypatch.setenv('PATH', '%s:%s' % (bin_dir, environ['PATH']))
+
+    pool = LocalPool(local_config['ssh'])
+    pool.connect()
+    hosts = sorted(pool.hosts)
+    for host in hosts:
+        makedirs(path.join(home, host, 'test_dir'), exist_ok=True)
+        for file_name in ('sudo_calls.log', 'restore_fails'):
+            if path.exists(path.join(home, host, file_name)):
+                remove(path.join(home, host, file_name))
+
+    def calls(host):
+        if not path.exists(path.join(home, host, 'sudo_calls.log')):
+            return ''
+        with open(path.join(home, host, 'sudo_calls.log')) as r:
+            return r.read()
+
+    try:
+        with NetworkFaults(pool, '%s/test_dir' % home, dev='eth0') as net:
+            net.switch_lead = 0.2
+            assert net.apply(partition([hosts[0]], [hosts[1]])) == hosts
+            for host, other in zip(hosts, reversed(hosts)):
+                assert '-A TIDEN_NETFAULT_OUT -d %s -j DROP' % other in calls(host)
+                assert 'tc -batch' not in calls(host)
+
+            # latency on one direction only changes rules of sender and receiver
+            assert net.apply({(hosts[0], hosts[1]): {'delay': '50ms'}}) == hosts
+            assert 'tc -batch' in calls(hosts[0]) and 'tc -batch' not in calls(hosts[1])
+            with open(path.join(home, hosts[0], 'test_dir', '%s.tc' % net.batch_name)) as r:
+                assert 'netem delay 50ms' in r.read()
+
+            # same matrix again touches nothing
+            before = [calls(host) for host in hosts]
+            assert net.apply({(hosts[0], hosts[1]): {'delay': '50ms'}}) == []
+            assert [calls(host) for host in hosts] == before
+
+            assert net.heal() == [hosts[0]]
+
+            # failed host gets the same matrix again
+            open(path.join(home, hosts[0], 'restore_fails'), 'w').close()
+            with pytest.raises(TidenException):
+                net.apply(partition([hosts[0]], [hosts[1]]))
+            remove(path.join(home, hosts[0], 'restore_fails'))
+            assert net.apply(partition([hosts[0]], [hosts[1]])) == [hosts[0]]
+            assert net.heal() == hosts
+        for host in hosts:
+            assert 'iptables -w -X TIDEN_NETFAULT_IN' in calls(host)
+            assert 'tc qdisc del dev eth0 root' in calls(host)
+            assert not path.exists(path.join(home, host, 'test_dir', '%s.iptables' % net.batch_name))
+    finally:
+        pool.close()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import socket
+from os import path
+from time import sleep
+
+from tiden.apps.netstat import Netstat
+from tiden.localpool import LocalPool
+
+
+def test_netstat_sampling(local_config):
+    pool = LocalPool(local_config['ssh'])
+    pool.connect()
+    config = {'remote': {'suite_var_dir': local_config['environment']['home']}}
+    netstat = Netstat('netstat', config, pool)
+
+    counters = netstat.network()
+    host = pool.hosts[0]
+    assert int(counters[host]['lo']['RX']['bytes']) > 0
+    assert counters[host]['total']['TX']['packets'] > 0
+
+    netstat.start_sampling(interval=0.2)
+    pid_file = path.join(local_config['environment']['home'], host, 'netstat_proc.pid')
+    with open(pid_file) as r:
+        pid = int(r.read())
+    try:
+        netstat.mark_step('idle')
+        sleep(0.6)
+        netstat.mark_step('traffic')
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(('127.0.0.1', 0))
+        client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for _ in range(50):
+            client.sendto(b'x' * 1000, server.getsockname())
+            sleep(0.01)
+        client.close()
+        server.close()
+        sleep(0.5)
+    finally:
+        netstat.stop_sampling()
+        pool.close()
+
+    # sampler loop is not left running, killed one may stay zombie until local pool shell reaps it
+    if path.exists('/proc/%d/stat' % pid):
+        with open('/proc/%d/stat' % pid) as r:
+            assert r.read().rsplit(')', 1)[1].split()[0] == 'Z'
+    assert not path.exists(pid_file)
+
+    rates = netstat.get_rates()
+    assert len(rates[host]['lo']) >= 3
+    assert set(rates[host]['lo'][0].keys()) >= {'time', 'rx_bytes', 'tx_packets', 'rx_drop', 'tx_errs'}
+
+    step_rates = netstat.get_step_rates()
+    assert sorted(step_rates.keys()) == ['idle', 'traffic']
+    assert step_rates['traffic'][host]['lo']['tx_packets'] > 0
+    assert step_rates['traffic'][host]['lo']['rx_bytes'] > step_rates['idle'][host]['lo']['rx_bytes']
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from os.path import join
+
+from tiden.tidenpluginindex import PluginIndex
+
+PLUGIN_SOURCE = """
+from tiden.tidenplugin import TidenPlugin
+
+TIDEN_PLUGIN_VERSION = '%s'
+
+
+class MyPlugin(TidenPlugin):
+
+    def before_hosts_setup(self, *args, **kwargs):
+        pass
+
+    def after_tests_run(self, *args, **kwargs):
+        pass
+
+    def helper(self):
+        pass
+"""
+
+
+def test_plugin_index_parse_and_cache(tmpdir):
+    plugins_dir = str(tmpdir.mkdir('plugins'))
+    plugin_file = join(plugins_dir, 'myplugin.py')
+    with open(plugin_file, 'w') as w:
+        w.write(PLUGIN_SOURCE % '1.0.0')
+    with open(join(plugins_dir, 'notaplugin.py'), 'w') as w:
+        w.write('class Other(object):\n    pass\n')
+    index_path = join(str(tmpdir), 'plugins_index.yaml')
+
+    index = PluginIndex(index_path)
+    plugins = index.scan([plugins_dir])
+    index.save()
+    assert list(plugins.keys()) == ['MyPlugin']
+    assert plugins['MyPlugin']['file'] == plugin_file
+    assert plugins['MyPlugin']['version'] == '1.0.0'
+    assert plugins['MyPlugin']['hooks'] == ['after_tests_run', 'before_hosts_setup']
+    assert len(index.parsed_files) == 2
+
+    # unchanged files are not parsed again
+    index = PluginIndex(index_path)
+    plugins = index.scan([plugins_dir])
+    assert plugins['MyPlugin']['version'] == '1.0.0'
+    assert index.parsed_files == []
+
+    # changed file is parsed again
+    with open(plugin_file, 'w') as w:
+        w.write(PLUGIN_SOURCE % '1.0.10')
+    index = PluginIndex(index_path)
+    plugins = index.scan([plugins_dir])
+    assert plugins['MyPlugin']['version'] == '1.0.10'
+    assert index.parsed_files == [plugin_file]
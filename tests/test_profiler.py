@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os.path
+from shutil import rmtree
+
+import pytest
+
+from tiden.apps.appexception import MissedRequirementException
+from tiden.apps.profiler.flamegraph import parse_collapsed, render_flamegraph
+from tiden.apps.profiler.profiler import Profiler
+from tiden.localpool import LocalPool
+
+FAKE_PROFILER = """#!/bin/sh
+# fake async-profiler: writes collapsed stacks to file given by -f
+while [ $# -gt 1 ]; do
+    if [ "$1" = "-f" ]; then out="$2"; fi
+    shift
+done
+printf 'java.lang.Thread.run;Worker.body;Cache.put 5\\njava.lang.Thread.run;Worker.body 3\\n' > "$out"
+"""
+
+
+def test_render_flamegraph():
+    stacks = parse_collapsed(['a;b;c 5', 'a;b 3', 'broken line'])
+    stacks = parse_collapsed(['a;d 2'], stacks, prefix='node-1')
+    assert stacks == {'a;b;c': 5, 'a;b': 3, 'node-1;a;d': 2}
+    svg = render_flamegraph(stacks, title='test')
+    assert svg.startswith('<?xml')
+    assert '<title>a (8 samples, 80.00%)</title>' in svg
+    assert '<title>c (5 samples, 50.00%)</title>' in svg
+
+
+@pytest.fixture
+def profiler(local_config, tmpdir):
+    pool = LocalPool(local_config['ssh'])
+    pool.connect()
+    home = local_config['environment']['home']
+    config = {
+        'environment': {},
+        'remote': {'suite_var_dir': '%s/profiler_test/var' % home},
+        'rt': {'remote': {'test_dir': '%s/profiler_test/test' % home}, 'test_dir': str(tmpdir)},
+    }
+    for host in pool.hosts:
+        rmtree(os.path.join(home, host, 'profiler_test'), ignore_errors=True)
+        async_home = os.path.join(home, host, 'profiler_test', 'var', 'flamegraph', 'async_fmg')
+        os.makedirs(os.path.join(async_home, 'build'))
+        with open(os.path.join(async_home, 'profiler.sh'), 'w') as w:
+            w.write(FAKE_PROFILER)
+        with open(os.path.join(async_home, 'requirement'), 'w') as w:
+            w.write('1\n')
+    profiler = Profiler('profiler', config, pool, profiler='async_flamegraph')
+    profiler.async_profiler_requirements = (('%s/profiler_test/var/flamegraph/async_fmg/requirement' % home, '1'),)
+    profiler.update_options(warmup=0, duration=1, nodes={
+        1: {'host': pool.hosts[0], 'PID': '101'},
+        2: {'host': pool.hosts[0], 'PID': '102'},
+        3: {'host': pool.hosts[-1], 'PID': '103'},
+    })
+    yield profiler
+    pool.close()
+    for host in pool.hosts:
+        rmtree(os.path.join(home, host, 'profiler_test'), ignore_errors=True)
+
+
+def test_cluster_profiling_session(profiler, tmpdir):
+    profiler.start()
+    profiler.stop()
+    files = profiler.collect()
+    assert sorted(files.keys()) == [1, 2, 3]
+    svg_file = profiler.merge_flamegraph(files, str(tmpdir))
+    with open(svg_file) as r:
+        assert '<title>java.lang.Thread.run (24 samples, 100.00%)</title>' in r.read()
+
+
+def test_profiling_session_requirements(profiler):
+    profiler.async_profiler_requirements = (profiler.async_profiler_requirements[0][0], '0'),
+    with pytest.raises(MissedRequirementException):
+        profiler.start()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os.path
+from shutil import rmtree
+from tarfile import TarError, open as tar_open
+
+import pytest
+
+from tiden.localpool import LocalPool
+from tiden.plugins import testresultscollector
+
+
+def test_stream_test_results_with_size_caps(local_config, tmpdir):
+    pool = LocalPool(local_config['ssh'])
+    pool.connect()
+    home = local_config['environment']['home']
+    for host in pool.hosts:
+        log_dir = os.path.join(home, host, 'test_stream', 'node1', 'work', 'log')
+        rmtree(os.path.join(home, host, 'test_stream'), ignore_errors=True)
+        os.makedirs(log_dir)
+        with open(os.path.join(log_dir, 'gc.log'), 'w') as w:
+            w.write('A' * 1000 + 'B' * 1000)
+        with open(os.path.join(log_dir, 'node.log'), 'w') as w:
+            w.write('started\n')
+        with open(os.path.join(home, host, 'test_stream', 'db.bin'), 'w') as w:
+            w.write('binary')
+
+    options = {
+        'unpack_logs': True,
+        'size_caps': {'*gc*.log': '100'},
+    }
+    collector = testresultscollector.TestResultsCollector('TestResultsCollector',
+                                                          {'plugins': {'TestResultsCollector': options}})
+    collector.set(ssh=pool)
+    local_dir = str(tmpdir)
+    collector._collect_test_results('%s/test_stream' % home, ['./*'], ['*.bin'], local_dir)
+
+    for host in pool.hosts:
+        assert os.path.isfile(os.path.join(local_dir, '%s_logs.tar.gz' % host))
+        extracted = os.path.join(local_dir, '%s_logs' % host)
+        with open(os.path.join(extracted, 'node1', 'work', 'log', 'node.log')) as r:
+            assert r.read() == 'started\n'
+        with open(os.path.join(extracted, 'node1', 'work', 'log', 'gc.log')) as r:
+            assert r.read() == 'A' * 50 + '\n[... truncated ...]\n' + 'B' * 50
+        assert not os.path.exists(os.path.join(extracted, 'db.bin'))
+        assert collector.throughput[host][0][0] == testresultscollector.TestResultsCollector.default_compression_level
+        rmtree(os.path.join(home, host, 'test_stream'))
+    pool.close()
+
+
+def test_auto_compression_level():
+    collector = testresultscollector.TestResultsCollector('TestResultsCollector',
+                                                          {'plugins': {'TestResultsCollector': {}}})
+    assert collector.get_compression_level('h') == 6
+    collector.throughput['h'] = [(6, 100.0)]
+    assert collector.get_compression_level('h') == 5
+    # weaker compression was faster, keep going
+    collector.throughput['h'] = [(6, 100.0), (5, 120.0)]
+    assert collector.get_compression_level('h') == 4
+    # weaker compression was slower, turn back
+    collector.throughput['h'] = [(5, 120.0), (4, 90.0)]
+    assert collector.get_compression_level('h') == 6
+    collector.compression_level = '1'
+    assert collector.get_compression_level('h') == 1
+
+
+def test_is_empty_archive(tmpdir):
+    empty = str(tmpdir.join('empty.tar.gz'))
+    with tar_open(empty, 'w:gz'):
+        pass
+    assert testresultscollector.TestResultsCollector.is_empty_archive(empty)
+
+    full = str(tmpdir.join('full.tar.gz'))
+    tmpdir.join('node.log').write('started\n' * 1000)
+    with tar_open(full, 'w:gz') as tar:
+        tar.add(str(tmpdir.join('node.log')), arcname='node.log')
+    assert not testresultscollector.TestResultsCollector.is_empty_archive(full)
+
+    # damaged archive is not taken for empty one
+    damaged = str(tmpdir.join('damaged.tar.gz'))
+    with open(full, 'rb') as r, open(damaged, 'wb') as w:
+        w.write(r.read()[:20])
+    with pytest.raises((TarError, EOFError, OSError)):
+        testresultscollector.TestResultsCollector.is_empty_archive(damaged)
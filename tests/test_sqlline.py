@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from os import chmod, environ, makedirs, path
+
+from tiden.localpool import LocalPool
+from tiden.utilities.sqlline_utility import Sqlline, SqllineSession, parse_sqlline_output
+
+SQLLINE_OUTPUT = '''Setting property: [force, true]
+issuing: !connect jdbc:ignite:thin://127.0.0.1:10800 '' '' org.apache.ignite.IgniteJdbcThinDriver
+Connected to: Apache Ignite (version 2.8.0#20200226-sha1:341b01df)
+0: jdbc:ignite:thin://127.0.0.1:10800> CREATE TABLE city (id INT PRIMARY KEY, name VARCHAR);
+No rows affected (0.145 seconds)
+0: jdbc:ignite:thin://127.0.0.1:10800> INSERT INTO city (id, name) VALUES (1, 'Forest Hill'), (2, 'Denver');
+2 rows affected (0.031 seconds)
+0: jdbc:ignite:thin://127.0.0.1:10800> SELECT id, name
+. . . . . . . . . . . . . . . . . . .> FROM city ORDER BY id;
+\x1b[1m'ID','NAME'\x1b[m
+'1','Forest Hill'
+'2','Denver, CO'
+2 rows selected (0.012 seconds)
+0: jdbc:ignite:thin://127.0.0.1:10800> SELECT * FROM missing;
+Error: Failed to parse query. Table "MISSING" not found; SQL statement: (state=42000,code=1001)
+0: jdbc:ignite:thin://127.0.0.1:10800> !quit
+Closing: org.apache.ignite.internal.jdbc.thin.JdbcThinConnection
+'''
+
+
+def test_parse_sqlline_output():
+    results = parse_sqlline_output(SQLLINE_OUTPUT)
+    assert [result['statement'] for result in results[:3]] == [
+        'CREATE TABLE city (id INT PRIMARY KEY, name VARCHAR);',
+        "INSERT INTO city (id, name) VALUES (1, 'Forest Hill'), (2, 'Denver');",
+        'SELECT id, name\nFROM city ORDER BY id;',
+    ]
+    assert results[0]['count'] == 0 and results[0]['seconds'] == 0.145
+    assert results[1]['count'] == 2 and results[1]['rows'] == []
+    assert results[2]['columns'] == ['ID', 'NAME']
+    assert results[2]['rows'] == [['1', 'Forest Hill'], ['2', 'Denver, CO']]
+    assert results[2]['count'] == 2 and results[2]['seconds'] == 0.012
+    assert results[3]['error'].startswith('Failed to parse query')
+    assert results[3]['count'] is None and results[3]['rows'] == []
+    assert results[4]['statement'] == '!quit'
+
+
+class FakeIgnite:
+    def __init__(self, ssh, remote_dir):
+        self.ssh = ssh
+        self.config = {'rt': {'remote': {'test_dir': remote_dir}}}
+
+
+def test_prepare_sql_file(local_config):
+    pool = LocalPool(local_config['ssh'])
+    pool.connect()
+    home = local_config['environment']['home']
+    host = pool.hosts[0]
+    makedirs(path.join(home, host, 'test_dir'), exist_ok=True)
+    try:
+        sqlline = Sqlline(FakeIgnite(pool, '%s/test_dir' % home))
+        sql_file = sqlline.util_prepare_sql_file(host, ["SELECT 'a b';", 'SELECT 1;'])
+        assert sql_file == '%s/test_dir/sql_commands.sql' % home
+        output = pool.exec_on_host(host, ['cat %s' % sql_file])[host]
+        assert output == ["SELECT 'a b';\nSELECT 1;\n"]
+    finally:
+        pool.close()
+
+
+# sqlline emulation: statements of `!run` scripts are echoed after prompt which is flushed well before the statement
+FAKE_SQLLINE = '''#!/bin/sh
+while read -r cmd file; do
+    case "$cmd" in
+        '!run')
+            while read -r stmt; do
+                printf '0: jdbc:ignite:thin://127.0.0.1:10800> '
+                sleep 0.3
+                printf '%s\\n' "$stmt"
+                case "$stmt" in
+                    SELECT*)
+                        echo "'VALUE'"
+                        echo "$stmt" | sed "s/^SELECT \\(.*\\);$/\\1/"
+                        echo '1 row selected (0.001 seconds)' ;;
+                    *)
+                        echo 'No rows affected (0.001 seconds)' ;;
+                esac
+            done < "$file" ;;
+        '!quit')
+            exit 0 ;;
+    esac
+done
+'''
+
+
+def test_sqlline_session(local_config, tmpdir, monkeypatch):
+    bin_dir = str(tmpdir.mkdir('bin'))
+    with open(path.join(bin_dir, 'sqlline.sh'), 'w') as w:
+        w.write(FAKE_SQLLINE)
+    chmod(path.join(bin_dir, 'sqlline.sh'), 0o755)
+    monkeypatch.setenv('PATH', '%s:%s' % (bin_dir, environ['PATH']))
+
+    pool = LocalPool(local_config['ssh'])
+    pool.connect()
+    home = local_config['environment']['home']
+    host = pool.hosts[0]
+    makedirs(path.join(home, host, 'test_dir'), exist_ok=True)
+    session = SqllineSession(Sqlline(FakeIgnite(pool, '%s/test_dir' % home)), host, 'sqlline.sh',
+                             '%s/test_dir' % home)
+    session.poll_interval = 0.1
+    try:
+        session.start()
+        # partial prompt line is not consumed, statement text following it is kept
+        results = session.execute(['CREATE TABLE city;', "SELECT 'Denver';"], timeout=10)
+        assert [result['statement'] for result in results] == ['CREATE TABLE city;', "SELECT 'Denver';"]
+        assert results[0]['count'] == 0
+        assert results[1]['columns'] == ['VALUE'] and results[1]['rows'] == [['Denver']]
+
+        # session stays warm for next script
+        results = session.execute(["SELECT 'Forest Hill';"], timeout=10)
+        assert results[0]['rows'] == [['Forest Hill']]
+    finally:
+        session.close()
+        pool.close()
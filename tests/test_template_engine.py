@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from os import utime
+from os.path import join
+
+from tiden.templateengine import TemplateEngine
+from tiden.xmlconfigbuilder import XMLConfigBuilder
+
+
+def test_template_engine_memoizes_renders(tmpdir):
+    engine = TemplateEngine().configure({'template_cache_dir': str(tmpdir.mkdir('cache'))})
+    templates_dir = str(tmpdir.mkdir('templates'))
+    template_path = join(templates_dir, 'server.tmpl.xml')
+    with open(template_path, 'w') as w:
+        w.write('<port>{{ port }}</port>\n')
+
+    assert engine.render(templates_dir, 'server.tmpl.xml', {'port': 1}) == '<port>1</port>'
+    assert engine.render(templates_dir, 'server.tmpl.xml', {'port': 2}) == '<port>2</port>'
+    assert len(engine.rendered) == 2
+    assert engine.render(templates_dir, 'server.tmpl.xml', {'port': 1}) == '<port>1</port>'
+    assert len(engine.rendered) == 2
+
+    # changed template is compiled and rendered again
+    with open(template_path, 'w') as w:
+        w.write('<port>{{ port + 1 }}</port>\n')
+    utime(template_path, (0, 0))
+    assert engine.render(templates_dir, 'server.tmpl.xml', {'port': 1}) == '<port>2</port>'
+
+    XMLConfigBuilder(templates_dir, {'server.tmpl.xml': 'server.xml'}, port=10).build()
+    with open(join(templates_dir, 'server.xml')) as r:
+        assert r.read() == '<port>11</port>'
+    engine.configure({})
+
+
+def test_template_engine_tracks_included_templates(tmpdir):
+    engine = TemplateEngine().configure({'template_cache_dir': str(tmpdir.mkdir('cache'))})
+    templates_dir = str(tmpdir.mkdir('templates'))
+    with open(join(templates_dir, 'server.tmpl.xml'), 'w') as w:
+        w.write('<server>{% include "port.tmpl.xml" %}</server>\n')
+    with open(join(templates_dir, 'port.tmpl.xml'), 'w') as w:
+        w.write('<port>{{ port }}</port>')
+
+    assert engine.render(templates_dir, 'server.tmpl.xml', {'port': 1}) == '<server><port>1</port></server>'
+
+    # changed included template invalidates rendered text
+    with open(join(templates_dir, 'port.tmpl.xml'), 'w') as w:
+        w.write('<port>{{ port + 1 }}</port>')
+    utime(join(templates_dir, 'port.tmpl.xml'), (0, 0))
+    assert engine.render(templates_dir, 'server.tmpl.xml', {'port': 1}) == '<server><port>2</port></server>'
+    assert len(engine.rendered) == 2
+
+    # variables which are not JSON serializable are not memoized
+    class Port:
+        def __init__(self, value):
+            self.value = value
+
+        def __repr__(self):
+            return 'Port'
+
+        def __add__(self, other):
+            return self.value + other
+
+    assert engine.render(templates_dir, 'server.tmpl.xml', {'port': Port(1)}) == '<server><port>2</port></server>'
+    assert engine.render(templates_dir, 'server.tmpl.xml', {'port': Port(2)}) == '<server><port>3</port></server>'
+    assert len(engine.rendered) == 2
+    engine.configure({})
+
+
+def test_template_engine_memo_key_keeps_types(tmpdir):
+    engine = TemplateEngine().configure({'template_cache_dir': str(tmpdir.mkdir('cache'))})
+    templates_dir = str(tmpdir.mkdir('templates'))
+    with open(join(templates_dir, 't.tmpl'), 'w') as w:
+        w.write('{{ d[1] }}|{{ v }}')
+
+    assert engine.render(templates_dir, 't.tmpl', {'d': {1: 'x'}, 'v': (1, 2)}) == 'x|(1, 2)'
+    # same JSON, different types
+    assert engine.render(templates_dir, 't.tmpl', {'d': {'1': 'x'}, 'v': [1, 2]}) == '|[1, 2]'
+
+    # variables not used by template don't make new memo entries
+    assert engine.render(templates_dir, 't.tmpl', {'d': {1: 'x'}, 'v': (1, 2), 'unused': 1}) == 'x|(1, 2)'
+    assert len(engine.rendered) == 2
+    engine.configure({})
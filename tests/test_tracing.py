@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from json import load
+from multiprocessing.dummy import Pool as ThreadPool
+from os.path import join
+
+from tiden.tracing import Tracer, trace_summary
+
+
+def test_tracer_spans_and_summary(tmpdir):
+    tracer = Tracer().configure({'trace': True})
+    try:
+        tracer.begin_test()
+
+        def remote(host):
+            with tracer.span('exec', cat='ssh', host=host, command='ls') as span:
+                span['bytes'] = 10
+
+        with tracer.span('save_logs'):
+            pool = ThreadPool(2)
+            pool.map(remote, ['127.0.0.1', '127.0.0.2'])
+            pool.close()
+            pool.join()
+        with tracer.span('kill_stalled_java'):
+            pass
+
+        spans = tracer.end_test()
+        summary = {stack: (count, total, self_time) for stack, count, total, self_time in trace_summary(spans)}
+        assert set(summary.keys()) == {('save_logs',), ('save_logs', 'exec'), ('kill_stalled_java',)}
+        assert summary[('save_logs', 'exec')][0] == 2
+        assert all(span.args['bytes'] == 10 for span in spans if span.name == 'exec')
+
+        trace_path = tracer.save(str(tmpdir))
+        with open(trace_path) as r:
+            events = load(r)['traceEvents']
+        assert len(events) == len(tracer.spans)
+        assert {'save_logs', 'exec', 'kill_stalled_java'} <= set(event['name'] for event in events)
+        with open(join(str(tmpdir), 'tiden_trace.collapsed')) as r:
+            assert 'save_logs;exec ' in r.read()
+    finally:
+        tracer.configure({})
+        tracer.spans = []
+
+
+def test_tracer_disabled():
+    tracer = Tracer().configure({})
+    with tracer.span('exec', host='127.0.0.1') as span:
+        span['bytes'] = 1
+    assert tracer.spans == []
+    assert tracer.save('/nonexistent') is None
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os.path
+from shutil import rmtree
+
+import pytest
+
+from tiden.apps.ignite.igniteexception import IgniteException
+from tiden.apps.ignite.yardstick import Yardstick
+from tiden.apps.nodestatus import NodeStatus
+from tiden.localpool import LocalPool
+
+
+class FakeIgnite:
+    def __init__(self, ssh):
+        self.ssh = ssh
+        self.nodes = {}
+
+
+def _start_driver(pool, ignite, node_idx, script):
+    home = pool.config['home']
+    host = pool.hosts[0]
+    work_dir = os.path.join(home, host, 'yardstick_test')
+    os.makedirs(os.path.join(work_dir, 'out.%s' % node_idx, 'bench'), exist_ok=True)
+    with open(os.path.join(work_dir, 'out.%s' % node_idx, 'bench', 'ThroughputLatencyProbe.csv'), 'w') as w:
+        w.write('**"Time, sec","Operations/sec (more is better)","Latency, nsec (less is better)"\n1,100.0,5.0\n')
+    log = '%s/yardstick_test/driver.%s.log' % (home, node_idx)
+    output = pool.exec_on_host(host, ["nohup sh -c '%s' > %s 2>&1 & echo $!" % (script, log)])[host]
+    ignite.nodes[node_idx] = {
+        'host': host,
+        'log': log,
+        'output_dir': '%s/yardstick_test/out.%s' % (home, node_idx),
+        'PID': output[0].strip(),
+        'status': NodeStatus.STARTING,
+    }
+
+
+@pytest.fixture
+def yardstick(local_config):
+    pool = LocalPool(local_config['ssh'])
+    pool.connect()
+    work_dir = os.path.join(local_config['environment']['home'], pool.hosts[0], 'yardstick_test')
+    rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+    yardstick = Yardstick.__new__(Yardstick)
+    yardstick.ignite = FakeIgnite(pool)
+    yardstick.warmup = 1
+    yardstick.duration = 1
+    yardstick.poll_interval = 0.2
+    yield yardstick
+    pool.close()
+    rmtree(work_dir, ignore_errors=True)
+
+
+def test_wait_for_drivers_finished(yardstick):
+    script = 'echo Starting warmup; sleep 0.3; echo Starting main test; sleep 0.3; echo Finished main test; sleep 0.2'
+    _start_driver(yardstick.ignite.ssh, yardstick.ignite, 50001, script)
+    _start_driver(yardstick.ignite.ssh, yardstick.ignite, 50002, script)
+    states = yardstick.wait_for_drivers([50001, 50002], timeout=10)
+    assert all(state['phase'] == 'finished' for state in states.values())
+    assert states[50001]['probe'] == (1.0, 100.0, 5.0)
+    assert yardstick.ignite.nodes[50001]['status'] == NodeStatus.STARTED
+
+
+def test_wait_for_drivers_aborts_on_dead_driver(yardstick):
+    _start_driver(yardstick.ignite.ssh, yardstick.ignite, 50001, 'echo Starting warmup; sleep 5')
+    _start_driver(yardstick.ignite.ssh, yardstick.ignite, 50002, 'echo Starting warmup; exit 1')
+    with pytest.raises(IgniteException, match='50002'):
+        yardstick.wait_for_drivers([50001, 50002], timeout=10)
+    yardstick.ignite.ssh.exec_on_host(yardstick.ignite.nodes[50001]['host'],
+                                      ['kill -9 %s' % yardstick.ignite.nodes[50001]['PID']])
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os.path
+
+from tiden.apps.ignite.yardstick_results import YardstickResults, parse_probe_file, merge_series
+
+PROBE_HEADER = [
+    '--Probe dump file for class: class org.yardstickframework.probes.ThroughputLatencyProbe',
+    '--Created Mon Jan 13 12:00:00 MSK 2020',
+    '@@org.apache.ignite.yardstick.cache.IgnitePutBenchmark',
+    '**"Time, sec","Operations/sec (more is better)","Latency, nsec (less is better)"',
+]
+
+
+def _write_probe(path, rows):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as w:
+        w.write('\n'.join(PROBE_HEADER + ['%d,%.2f,%.2f' % row for row in rows]) + '\n')
+
+
+def _run_rows(throughput, start=1000, seconds=60):
+    # first 10 seconds are warmup with low throughput, small periodic noise after
+    return [(start + i, (throughput / 10 if i < 10 else throughput + (i % 7) * throughput / 100), 1000.0)
+            for i in range(seconds)]
+
+
+def test_parse_and_merge():
+    rows = parse_probe_file(PROBE_HEADER + ['1,100.00,2000.00', '2,300.00,1000.00'])
+    assert rows == [(1.0, 100.0, 2000.0), (2.0, 300.0, 1000.0)]
+    merged = merge_series({'a': rows, 'b': [(1.0, 100.0, 4000.0)]})
+    # second 2 is reported by one driver only, latency is weighted by throughput
+    assert merged == [(1, 200.0, 3000.0)]
+
+
+def test_statistics_and_comparison(tmpdir):
+    run_dir = str(tmpdir.join('run'))
+    for driver in range(1, 3):
+        _write_probe(os.path.join(run_dir, 'ignite.%d' % driver, '20200113-put', 'ThroughputLatencyProbe.csv'),
+                     _run_rows(1000.0))
+    results = YardstickResults.from_dir(run_dir)
+    assert len(results.drivers_rows) == 2
+
+    statistics = results.get_statistics(trim_start=10)
+    assert statistics['drivers'] == 2
+    assert statistics['seconds'] == 50
+    assert statistics['throughput']['min'] == 2000.0
+    assert 2000.0 < statistics['throughput']['mean'] < 2100.0
+    assert statistics['throughput']['ci95'] > 0
+
+    baseline_path = YardstickResults.save_statistics(statistics, str(tmpdir.join('baseline.json')))
+    baseline = YardstickResults.load_statistics(baseline_path)
+    assert not YardstickResults.compare(statistics, baseline)['throughput']['regression']
+
+    slower = YardstickResults({'ignite.1': _run_rows(1500.0)}).get_statistics(trim_start=10)
+    comparison = YardstickResults.compare(slower, baseline)
+    assert comparison['throughput']['significant']
+    assert comparison['throughput']['regression']
+    assert not comparison['latency']['regression']
+    # faster run is significant but not a regression
+    faster = YardstickResults({'ignite.1': _run_rows(2500.0)}).get_statistics(trim_start=10)
+    assert not YardstickResults.compare(faster, baseline)['throughput']['regression']
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from json import dumps, loads
+from threading import Thread
+
+import pytest
+
+from tiden.zabbix_api import ZabbixApi
+
+
+class ZabbixStubHandler(BaseHTTPRequestHandler):
+    calls = []
+
+    items = [
+        {'itemid': '101', 'hostid': '1', 'value_type': '0', 'description': 'The time the CPU has spent doing nothing'},
+        {'itemid': '102', 'hostid': '1', 'value_type': '3', 'description': 'Available memory'},
+        {'itemid': '201', 'hostid': '2', 'value_type': '0', 'description': 'The time the CPU has spent doing nothing'},
+    ]
+
+    def do_POST(self):
+        request = loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.calls.append(request['method'])
+        params = request['params']
+        if request['method'] == 'user.login':
+            result = 'auth-key'
+        elif request['method'] == 'host.get':
+            result = [{'hostid': '1', 'name': 'lab1'}, {'hostid': '2', 'name': 'lab2'}, {'hostid': '3', 'name': 'lab3'}]
+        elif request['method'] == 'item.get':
+            result = [item for item in self.items
+                      if item['hostid'] in params.get('hostids', [item['hostid']])
+                      and item['itemid'] in params.get('itemids', [item['itemid']])]
+        else:
+            result = [{'itemid': params['itemids'], 'clock': str(1500000000 + i), 'value': str(int(params['itemids']) + i)}
+                      for i in range(3)]
+        body = dumps({'jsonrpc': '2.0', 'result': result, 'id': request['id']}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def zabbix_url():
+    server = HTTPServer(('127.0.0.1', 0), ZabbixStubHandler)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    ZabbixStubHandler.calls = []
+    yield 'http://127.0.0.1:%d' % server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def test_collect_metrics_batches_item_lookup(zabbix_url, tmpdir):
+    cache_path = str(tmpdir.join('items.json'))
+    metrics = ['The time the CPU has spent doing nothing', 'Available memory']
+    start_time = datetime.now() - timedelta(minutes=1)
+
+    api = ZabbixApi(zabbix_url, 'user', 'password', item_cache_path=cache_path, history_threads=2)
+    data = api.collect_metrics_from_servers(['172.25.1.1', '172.25.1.2'], metrics, start_time)
+    api.close()
+
+    assert ZabbixStubHandler.calls.count('item.get') == 1
+    assert ZabbixStubHandler.calls.count('history.get') == 3
+    assert data[metrics[0]]['lab1']['values'] == [101.0, 102.0, 103.0]
+    assert data[metrics[0]]['lab2']['values'] == [201.0, 202.0, 203.0]
+    assert data[metrics[1]]['lab1']['values'] == [102, 103, 104]
+    assert 'lab2' not in data[metrics[1]]
+    assert len(data[metrics[1]]['lab1']['timestamp']) == 3
+
+    # cached item ids are checked, only host without item is searched again
+    ZabbixStubHandler.calls = []
+    api = ZabbixApi(zabbix_url, 'user', 'password', item_cache_path=cache_path)
+    assert api.collect_metrics_from_servers(['172.25.1.1', '172.25.1.2'], metrics, start_time) == data
+    assert ZabbixStubHandler.calls.count('item.get') == 2
+
+    ZabbixStubHandler.calls = []
+    api.collect_metrics_from_servers(['172.25.1.1'], metrics, start_time)
+    assert ZabbixStubHandler.calls.count('item.get') == 1
+    api.close()
+
+
+def test_collect_metrics_drops_gone_cached_items(zabbix_url, tmpdir, monkeypatch):
+    cache_path = str(tmpdir.join('items.json'))
+    metric = 'The time the CPU has spent doing nothing'
+    start_time = datetime.now() - timedelta(minutes=1)
+
+    api = ZabbixApi(zabbix_url, 'user', 'password', item_cache_path=cache_path)
+    api.collect_metrics_from_servers(['172.25.1.1'], [metric], start_time)
+    api.close()
+
+    # item is recreated on Zabbix server with new id
+    items = [dict(item) for item in ZabbixStubHandler.items]
+    items[0]['itemid'] = '111'
+    monkeypatch.setattr(ZabbixStubHandler, 'items', items)
+
+    ZabbixStubHandler.calls = []
+    api = ZabbixApi(zabbix_url, 'user', 'password', item_cache_path=cache_path)
+    data = api.collect_metrics_from_servers(['172.25.1.1'], [metric], start_time)
+    assert data[metric]['lab1']['values'] == [111.0, 112.0, 113.0]
+    assert ZabbixStubHandler.calls.count('item.get') == 2
+
+    ZabbixStubHandler.calls = []
+    api.collect_metrics_from_servers(['172.25.1.1'], [metric], start_time)
+    assert ZabbixStubHandler.calls.count('item.get') == 1
+    api.close()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from os import chmod, makedirs, path
+from shutil import rmtree
+
+from tiden.apps.nodestatus import NodeStatus
+from tiden.apps.zookeeper import Zookeeper
+from tiden.localpool import LocalPool
+
+FAKE_ZK_SERVER = '''#!/bin/sh
+# $1 - start/stop, $2 - zoo.cfg path
+data_dir=$(grep '^dataDir=' $2 | cut -d= -f2)
+if [ "$1" = "start" ]; then
+    echo $$ > $data_dir/zookeeper_server.pid
+    echo "Starting zookeeper ... STARTED"
+else
+    rm -f $data_dir/zookeeper_server.pid
+    echo "Stopping zookeeper ... STOPPED"
+fi
+'''
+
+ENSEMBLE_OUTPUT = '''ZK_NODE 1
+Zookeeper version: 3.5.7-f0fdd52973d373ffd9c86b81d99842dc2c7f660e, built on 02/10/2020 11:30 GMT
+Latency min/avg/max: 0/0/0
+Received: 2
+Sent: 1
+Connections: 1
+Outstanding: 0
+Zxid: 0x100000000
+Mode: leader
+Node count: 5
+zk_version\t3.5.7-f0fdd52973d373ffd9c86b81d99842dc2c7f660e, built on 02/10/2020 11:30 GMT
+zk_server_state\tleader
+zk_znode_count\t5
+zk_synced_followers\t1
+ZK_NODE 3
+This ZooKeeper instance is not currently serving requests
+'''
+
+
+def test_parse_ensemble_state():
+    states = Zookeeper.parse_ensemble_state({
+        '127.0.1.1': [ENSEMBLE_OUTPUT],
+        '127.0.1.2': ['ZK_NODE 2\nZxid: 0x100000000\nMode: follower\nzk_server_state\tfollower\n'],
+    })
+    assert states[1]['role'] == 'leader'
+    assert states[1]['zxid'] == '0x100000000'
+    assert states[1]['zk_synced_followers'] == 1
+    assert states[1]['zk_version'].startswith('3.5.7')
+    assert states[2]['role'] == 'follower'
+    assert states[3] == {'role': None}
+
+
+def test_ensemble_lifecycle(local_config):
+    home = local_config['environment']['home']
+    pool = LocalPool(local_config['ssh'])
+    pool.connect()
+    for host in pool.hosts:
+        makedirs(path.join(home, host, 'artifacts', 'zookeeper', 'conf'), exist_ok=True)
+        makedirs(path.join(home, host, 'artifacts', 'zookeeper', 'docs'), exist_ok=True)
+        makedirs(path.join(home, host, 'artifacts', 'zookeeper', 'bin'), exist_ok=True)
+        makedirs(path.join(home, host, 'test_dir'), exist_ok=True)
+        with open(path.join(home, host, 'artifacts', 'zookeeper', 'conf', 'log4j.properties'), 'w') as w:
+            w.write('log4j.rootLogger=INFO\n')
+        zk_server = path.join(home, host, 'artifacts', 'zookeeper', 'bin', 'zkServer.sh')
+        with open(zk_server, 'w') as w:
+            w.write(FAKE_ZK_SERVER)
+        chmod(zk_server, 0o755)
+    config = {
+        'artifacts': {'zookeeper': {'remote_path': '%s/artifacts/zookeeper' % home}},
+        'environment': {'zookeeper_hosts': sorted(pool.hosts), 'zookeeper_total_nodes': 3},
+        'rt': {'remote': {'test_module_dir': '%s/test_module' % home, 'test_dir': '%s/test_dir' % home}},
+    }
+    try:
+        zk = Zookeeper('zookeeper', config, pool)
+        zk.deploy_zookeeper()
+        zk._prepare_zk_configs()
+        zk.start_nodes(list(zk.nodes.keys()))
+
+        for node_id, node in zk.nodes.items():
+            assert node['state'] == NodeStatus.STARTED
+            assert node['PID'] is not None
+            host_home = zk._get_cfg_path(node_id).replace(home, path.join(home, node['host']))
+            with open(path.join(host_home, 'myid')) as r:
+                # 'echo -e' of dash prints the flag as is
+                assert r.read().split()[-1] == str(node_id)
+            with open(path.join(host_home, 'zoo.cfg')) as r:
+                zoo_cfg = r.read()
+            assert 'clientPort=218%s' % node_id in zoo_cfg
+            assert '4lw.commands.whitelist=' in zoo_cfg
+            assert 'server.3=' in zoo_cfg
+            assert path.exists(path.join(host_home, 'log4j.properties'))
+        zk_home = zk.zookeeper_home.replace(home, path.join(home, zk.nodes[1]['host']))
+        assert path.islink(path.join(zk_home, 'bin'))
+        assert not path.exists(path.join(zk_home, 'docs'))
+
+        zk.stop()
+        assert all([node['state'] == NodeStatus.KILLED for node in zk.nodes.values()])
+    finally:
+        pool.close()
+        for host in pool.hosts:
+            rmtree(path.join(home, host, 'artifacts'), ignore_errors=True)
+            rmtree(path.join(home, host, 'test_module'), ignore_errors=True)